@@ -1,28 +1,26 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, abort, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from datetime import datetime, timezone, timedelta
-import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import sys
+
+import click
+from flask import Flask, jsonify, send_from_directory
 import pymysql
-from flask_migrate import Migrate
-from flask_bcrypt import Bcrypt
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, DateTimeField, IntegerField, SelectField
-from wtforms.validators import DataRequired, Email, Length, EqualTo
-import logging
-from logging.handlers import RotatingFileHandler
-from wtforms_sqlalchemy.fields import QuerySelectField
 from config import Config
-from extensions import db, login_manager
-from routes import public, user, admin, reviewer, auth
-
-# 配置日志
-logging.basicConfig(level=logging.INFO)
-handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=1)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
+from extensions import db, login_manager, notification_fanout, event_broker, checkin_writer
+from routes import public, user, admin, reviewer, auth, jobs, checkin, calendar
+from utils.jobs import init_app as init_job_runner
+from utils.lifecycle import init_app as init_lifecycle
+from utils.archive import init_app as init_archive
+from utils.analytics import init_app as init_analytics
+from utils.utilization import init_app as init_utilization
+from utils.badges import init_app as init_badges
+from utils.ical import init_app as init_ical
+from utils.counters import init_app as init_counters
+from utils.purge import init_app as init_purge
+from utils.similarity import init_app as init_similarity
+from utils.sqlstats import init_app as init_sqlstats
+from utils.profiling import init_app as init_profiling
+from utils.metrics import init_app as init_metrics
+from utils.logs import init_app as init_logging
+from utils.replicas import init_app as init_replicas
 
 pymysql.install_as_MySQLdb()
 
@@ -33,10 +31,33 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    migrate = Migrate(app, db)
+    # Flask-Migrate 会导入 alembic（约 120ms），只有 flask db 等命令行才需要，web worker 启动时跳过
+    if click.get_current_context(silent=True) is not None or 'flask_migrate' in sys.modules:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    notification_fanout.init_app(app)
+    event_broker.init_app(app)
+    checkin_writer.init_app(app)
+    init_job_runner(app)
+    init_lifecycle(app)
+    init_archive(app)
+    init_analytics(app)
+    init_utilization(app)
+    init_badges(app)
+    init_ical(app)
+    init_counters(app)
+    init_purge(app)
+    init_similarity(app)
+    init_sqlstats(app)
+    init_profiling(app)
+    init_metrics(app)
+    init_logging(app)
+    init_replicas(app)
     
     # Import models
     from models import User
+    # 列表页的 lambda 语句在构建时就会访问 backref（如 Activity.venue），提前完成映射配置
+    db.configure_mappers()
     
     @login_manager.user_loader
     def load_user(user_id):
@@ -48,6 +69,9 @@ def create_app():
     app.register_blueprint(admin.admin_bp)
     app.register_blueprint(reviewer.reviewer_bp)
     app.register_blueprint(auth.auth_bp)
+    app.register_blueprint(jobs.jobs_bp)
+    app.register_blueprint(checkin.checkin_bp)
+    app.register_blueprint(calendar.calendar_bp)
     
     # Serve uploaded files
     @app.route('/uploads/<filename>')
@@ -0,0 +1,107 @@
+"""后台用户管理基准测试：5 万用户时用户列表页的渲染耗时，以及批量改角色/删除的耗时
+
+用法：python -m benchmarks.admin_users [--users 50000]
+
+对比：
+- 旧实现：User.query.all() 后把全部用户渲染到一页
+- 分页：每页 50 个，分别测无筛选、用户名前缀搜索、院系前缀搜索、按角色筛选
+"""
+import argparse
+import os
+import random
+import statistics
+from datetime import datetime, timezone
+
+from flask import render_template
+from flask_login import login_user
+
+from benchmarks.common import make_app, login_client, Timer
+
+DEPARTMENTS = ['计算机学院', '理学院', '外国语学院', '经济管理学院', '机电工程学院', '海洋学院',
+               '材料学院', '汽车工程学院', '信息学院', '法学院', '艺术学院', '建筑学院']
+
+
+def seed_users(db, count):
+    from models import User
+
+    rng = random.Random(7)
+    now = datetime.now(timezone.utc)
+    admin = User(username='bench_admin', email='bench_admin@example.com', is_admin=True, created_at=now)
+    db.session.add(admin)
+    db.session.commit()
+    db.session.execute(db.insert(User), [
+        {'username': f'student{i:06d}', 'email': f'student{i:06d}@stu.example.edu.cn',
+         'department': rng.choice(DEPARTMENTS), 'is_reviewer': rng.random() < 0.01, 'is_admin': False,
+         'password_hash': 'x', 'created_at': now}
+        for i in range(count)
+    ])
+    db.session.commit()
+    return admin.id
+
+
+def time_get(client, url, repeat):
+    samples = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        samples.append(timer.elapsed * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='后台用户管理基准测试')
+    parser.add_argument('--users', type=int, default=50000, help='用户数量')
+    parser.add_argument('--repeat', type=int, default=10, help='每个页面请求次数（取中位数）')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    from extensions import db
+    from models import User
+    from utils.users import UserFilter, search_users, bulk_set_role, bulk_delete_users
+    from utils.purge import purge_deleted_users
+
+    try:
+        with app.app_context():
+            admin_id = seed_users(db, args.users)
+        client = login_client(app, admin_id)
+        print(f'用户数: {args.users}，单位: 毫秒（中位数）')
+
+        with app.test_request_context('/users'):
+            login_user(db.session.get(User, admin_id))
+            samples = []
+            for _ in range(max(1, args.repeat // 5)):
+                with Timer() as timer:
+                    everyone = User.query.all()
+                    page = search_users(UserFilter(), 1, len(everyone))
+                    render_template('admin_users.html', users=everyone, pagination=page,
+                                    user_filter=UserFilter(), search_query='')
+                samples.append(timer.elapsed * 1000)
+            print(f"{'旧实现：全部用户一页':<24}{statistics.median(samples):>10.1f}")
+
+        for label, url in (('分页：无筛选', '/users'),
+                           ('分页：第 500 页', '/users?page=500'),
+                           ('分页：用户名前缀', '/users?field=username&search=student0123'),
+                           ('分页：院系前缀', '/users?field=department&search=计算机'),
+                           ('分页：全部字段前缀', '/users?search=student04'),
+                           ('分页：审核员', '/users?role=reviewer')):
+            print(f'{label:<24}{time_get(client, url, args.repeat):>10.1f}')
+
+        with app.app_context():
+            with Timer() as timer:
+                count = bulk_set_role(UserFilter(search='student01', field='username').conditions(), 'reviewer')
+                db.session.commit()
+            print(f'批量设为审核员 {count} 人：{timer.elapsed * 1000:.1f} ms')
+            with Timer() as timer:
+                count = bulk_delete_users(UserFilter(search='student02', field='username').conditions())
+                db.session.commit()
+            print(f'批量删除 {count} 人：{timer.elapsed * 1000:.1f} ms')
+            with Timer() as timer:
+                totals = purge_deleted_users()
+            print(f"清理 {totals['user']} 个已删除用户：{timer.elapsed * 1000:.1f} ms")
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""运营统计基准测试：管理后台图表直接聚合原始表 vs 读取每日汇总表
+
+用法：python -m benchmarks.analytics_rollup [--participations 300000] [--days 365]
+
+先批量写入一年的报名、点赞、评论数据，然后测量：
+- 回填：flask analytics backfill 按原始表重算全部汇总行的耗时
+- 仪表盘：最近 30 天的每日趋势 + 类型/场地/院系排行，分别从原始表（JOIN + GROUP BY）和汇总表计算
+- 增量：events 模式下单次 upsert 的耗时
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import make_app, Timer
+
+DEPARTMENTS = ['计算机学院', '理学院', '外国语学院', '经济管理学院', '机电工程学院', '海洋学院',
+               '材料学院', '汽车工程学院', '信息学院', '法学院', '艺术学院', '建筑学院']
+
+
+def seed(db, users, activities, participations, days):
+    from models import User, Activity, ActivityType, Venue, Participation, Like, Comment
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    db.session.execute(db.insert(ActivityType), [{'name': f'类型{i}'} for i in range(8)])
+    db.session.execute(db.insert(Venue), [{'name': f'场地{i}', 'address': '校内', 'capacity': 200} for i in range(20)])
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'department': rng.choice(DEPARTMENTS),
+         'created_at': now}
+        for i in range(users)
+    ])
+    db.session.execute(db.insert(Activity), [
+        {'title': f'活动{i}', 'start_time': now, 'end_time': now + timedelta(hours=2), 'organizer_id': 1,
+         'max_participants': 1000, 'current_participants': 0, 'status': 'active', 'is_approved': True,
+         'activity_type_id': rng.randint(1, 8), 'venue_id': rng.randint(1, 20), 'likes_count': 0, 'created_at': now}
+        for i in range(activities)
+    ])
+
+    def events(count):
+        return [
+            {'user_id': rng.randint(1, users), 'activity_id': rng.randint(1, activities),
+             'at': now - timedelta(seconds=rng.randint(0, days * 86400))}
+            for _ in range(count)
+        ]
+
+    batch = 50000
+    for model, column, count in ((Participation, 'registered_at', participations),
+                                 (Like, 'created_at', participations // 3),
+                                 (Comment, 'created_at', participations // 6)):
+        seen = set()
+        for offset in range(0, count, batch):
+            rows = []
+            for event in events(min(batch, count - offset)):
+                key = (event['user_id'], event['activity_id'])
+                if model is Like and key in seen:
+                    continue
+                seen.add(key)
+                row = {'user_id': event['user_id'], 'activity_id': event['activity_id'], column: event['at']}
+                if model is Comment:
+                    row['content'] = '不错'
+                rows.append(row)
+            db.session.execute(db.insert(model), rows)
+    db.session.commit()
+
+
+def raw_dashboard(db, days):
+    """不使用汇总表：每次都从原始表 JOIN + GROUP BY"""
+    from utils import analytics
+
+    end_day = analytics.today()
+    start_day = end_day - timedelta(days=days - 1)
+    events = analytics._raw_events(
+        db, analytics._day_start_utc(start_day), analytics._day_start_utc(end_day + timedelta(days=1))
+    )
+    totals = [db.func.sum(events.c[name]) for name in analytics.METRICS]
+    results = [db.session.execute(db.select(events.c.day, *totals).group_by(events.c.day)).all()]
+    for column in ('activity_type_id', 'venue_id', 'department'):
+        results.append(db.session.execute(
+            db.select(events.c[column], *totals).group_by(events.c[column])
+            .order_by(db.func.sum(events.c.joins).desc()).limit(10)
+        ).all())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运营统计汇总表基准测试')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--activities', type=int, default=5000)
+    parser.add_argument('--participations', type=int, default=300000, help='报名记录数（点赞、评论按比例生成）')
+    parser.add_argument('--days', type=int, default=365, help='数据分布的天数')
+    parser.add_argument('--repeat', type=int, default=20, help='仪表盘查询重复次数')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    from extensions import db
+    from models import Activity, User
+    from utils import analytics
+
+    try:
+        with app.app_context():
+            with Timer() as timer:
+                seed(db, args.users, args.activities, args.participations, args.days)
+            print(f'写入数据：{args.participations} 报名 / {args.participations // 3} 点赞 / '
+                  f'{args.participations // 6} 评论，用时 {timer.elapsed:.1f}s')
+
+            with Timer() as timer:
+                rows = analytics.backfill(analytics.today() - timedelta(days=args.days))
+            print(f'回填 {args.days} 天：{rows} 行汇总，用时 {timer.elapsed:.2f}s')
+
+            with app.test_request_context():
+                for label, func in (('原始表聚合', lambda: raw_dashboard(db, 30)),
+                                    ('汇总表', lambda: analytics.dashboard_data(30))):
+                    func()
+                    with Timer() as timer:
+                        for _ in range(args.repeat):
+                            func()
+                    print(f'仪表盘（30 天）{label}：{timer.elapsed / args.repeat * 1000:.1f} ms/次')
+
+                activity = db.session.get(Activity, 1)
+                user = db.session.get(User, 1)
+                with Timer() as timer:
+                    for _ in range(1000):
+                        analytics.record_event(activity, user, joins=1)
+                db.session.commit()
+                print(f'增量 upsert：{timer.elapsed:.3f} ms/次')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
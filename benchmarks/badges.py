@@ -0,0 +1,70 @@
+"""胸牌批量生成基准测试：单进程与进程池渲染同一份名单的耗时，以及命中名单版本缓存时的耗时
+
+用法：python -m benchmarks.badges [--participants 800] [--processes 1,2,4] [--layout badge] [--format pdf]
+
+进程池的加速比取决于 CPU 核数，单核机器上多进程只会更慢。
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.common import make_app, Timer
+from benchmarks.notification_fanout import seed_activity_with_participants
+
+
+def main():
+    parser = argparse.ArgumentParser(description='胸牌批量生成基准测试')
+    parser.add_argument('--participants', type=int, default=800)
+    parser.add_argument('--processes', default=f'1,{os.cpu_count() or 1}', help='逗号分隔的进程数')
+    parser.add_argument('--layout', choices=['badge', 'ticket'], default='badge')
+    parser.add_argument('--format', choices=['pdf', 'png'], default='pdf')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    output_folder = tempfile.mkdtemp(prefix='bench_badges_')
+    app.config['JOB_OUTPUT_FOLDER'] = output_folder
+    from extensions import db
+    from models import Activity, Job
+    from utils import badges
+    from utils.jobs import enqueue, claim_jobs, run_job
+
+    try:
+        with app.app_context():
+            activity = db.session.get(Activity, seed_activity_with_participants(db, args.participants))
+            with Timer() as roster_timer:
+                entries = badges.load_roster(activity)
+            specs = badges._page_specs(activity, entries, args.layout, badges.find_font())
+            print(f'{len(entries)} 人，{len(specs)} 页，读取名单并签发电子票 {roster_timer.elapsed * 1000:.1f} ms')
+
+            for processes in sorted({int(value) for value in args.processes.split(',')}):
+                path = os.path.join(output_folder, f'bench_{processes}.{args.format}')
+                with Timer() as timer:
+                    badges.render_file(path, args.format, specs, processes)
+                print(f'{processes} 个进程: {timer.elapsed:.2f} 秒，{len(specs) / timer.elapsed:.1f} 页/秒，'
+                      f'文件 {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+
+            app.config['BADGE_RENDER_PROCESSES'] = max(int(value) for value in args.processes.split(','))
+            payload = {'activity_id': activity.id, 'layout': args.layout, 'format': args.format}
+            for label in ('首次生成（任务）', '名单未变（缓存）'):
+                enqueue('badges.render', payload)
+                with Timer() as timer:
+                    for job_id in claim_jobs('bench', 1):
+                        run_job(job_id)
+                finished = db.session.get(Job, job_id)
+                if finished.status != 'succeeded':
+                    print(f'失败: 任务状态为 {finished.status}\n{finished.last_error}')
+                    sys.exit(1)
+                print(f'{label}: {timer.elapsed * 1000:.1f} ms')
+    finally:
+        os.remove(db_path)
+        for root, dirs, files in os.walk(output_folder, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        os.rmdir(output_folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""批量审核基准测试：对比逐条审核与批量审核 1000 个活动的耗时
+
+用法：python -m benchmarks.bulk_review [--count 1000]
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import make_app, login_client, Timer
+
+
+def seed_pending_activities(db, count):
+    from models import User, Activity
+
+    reviewer = User(username='bench_reviewer', email='bench_reviewer@example.com', is_reviewer=True)
+    organizer = User(username='bench_organizer', email='bench_organizer@example.com')
+    db.session.add_all([reviewer, organizer])
+    db.session.commit()
+
+    start_time = datetime.now(timezone.utc) + timedelta(days=7)
+    db.session.execute(
+        db.insert(Activity),
+        [
+            {
+                'title': f'社团招新 {i}',
+                'description': '批量审核基准测试',
+                'start_time': start_time,
+                'end_time': start_time + timedelta(hours=2),
+                'organizer_id': organizer.id,
+                'max_participants': 100,
+                'current_participants': 0,
+                'status': 'pending',
+                'review_status': 'pending',
+                'is_approved': False,
+                'likes_count': 0,
+                'created_at': datetime.now(timezone.utc)
+            }
+            for i in range(count)
+        ]
+    )
+    db.session.commit()
+    ids = db.session.scalars(db.select(Activity.id).where(Activity.review_status == 'pending')).all()
+    return reviewer.id, ids
+
+
+def reset_reviews(db):
+    from models import Activity, Notification
+
+    db.session.execute(db.delete(Notification))
+    db.session.execute(db.update(Activity).values(
+        review_status='pending', status='pending', is_approved=False,
+        reviewer_id=None, review_time=None, review_comment=None
+    ))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量审核基准测试')
+    parser.add_argument('--count', type=int, default=1000, help='待审核活动数量')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    from extensions import db
+    from models import Notification
+
+    try:
+        with app.app_context():
+            reviewer_id, ids = seed_pending_activities(db, args.count)
+        client = login_client(app, reviewer_id)
+
+        # 逐条审核：每个活动一次 POST、一次提交
+        with Timer() as single:
+            for activity_id in ids:
+                client.post(f'/review/{activity_id}', data={'review_status': 'approved', 'review_comment': '通过'})
+
+        with app.app_context():
+            reset_reviews(db)
+
+        # 批量审核：一次 POST、一个事务
+        with Timer() as bulk:
+            client.post('/review/bulk', data={'activity_ids': ids, 'review_status': 'approved', 'review_comment': '通过'})
+
+        # 重复提交同一批活动，验证幂等
+        with Timer() as repeat:
+            client.post('/review/bulk', data={'activity_ids': ids, 'review_status': 'approved', 'review_comment': '通过'})
+
+        with app.app_context():
+            notification_count = db.session.scalar(db.select(db.func.count(Notification.id)))
+
+        print(f'活动数量: {len(ids)}')
+        print(f'逐条审核: {single.elapsed * 1000:.1f} ms ({single.elapsed * 1000 / len(ids):.2f} ms/个)')
+        print(f'批量审核: {bulk.elapsed * 1000:.1f} ms ({bulk.elapsed * 1000 / len(ids):.3f} ms/个)')
+        print(f'重复提交: {repeat.elapsed * 1000:.1f} ms')
+        print(f'通知数量: {notification_count} (期望 {len(ids)})')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""扫码签到基准测试：多个入口同时扫码时签到接口的吞吐量和延迟，以及批量写入的结果
+
+用法：
+    python -m benchmarks.checkin                                   # 800 人的礼堂活动，8 个入口同时扫码
+    python -m benchmarks.checkin --participants 2000 --threads 16
+    python -m benchmarks.checkin --min-rate 500                    # 吞吐量低于 500 次/秒时以退出码 1 结束
+
+在多线程 WSGI 服务器上跑三轮，每个请求都是真实的 HTTP 请求：
+- 现场扫码：前一半电子票由 --threads 个线程逐张提交，相当于各入口的扫码设备，另外混入重复扫码和伪造的票
+- 离线补交：后一半电子票按 --batch 张一批提交，带上设备记录的扫码时间
+- 写入：等待签到队列写完，检查数据库里每个报名都已签到、签到时间取最早的一次
+
+签到接口不应执行任何 SQL（通过 X-SQL-Count 响应头检查），写库只发生在后台队列里。
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import timezone
+
+import numpy as np
+
+from benchmarks.common import make_app, Timer
+from benchmarks.notification_fanout import seed_activity_with_participants
+
+SQL_COUNT_HEADER = 'X-SQL-Count'
+
+
+def post(port, path, scanner_token, body):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('POST', path, body=json.dumps(body), headers={
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {scanner_token}'
+        })
+        response = connection.getresponse()
+        data = json.loads(response.read())
+        return response.status, data, int(response.getheader(SQL_COUNT_HEADER, 0))
+    finally:
+        connection.close()
+
+
+def forge(token):
+    """改掉签名的最后一个字符"""
+    return token[:-1] + ('A' if token[-1] != 'A' else 'B')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='扫码签到基准测试')
+    parser.add_argument('--participants', type=int, default=800, help='报名人数')
+    parser.add_argument('--threads', type=int, default=8, help='同时扫码的入口数')
+    parser.add_argument('--batch', type=int, default=200, help='离线补交时每批的电子票数')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='现场扫码中重复扫码的比例')
+    parser.add_argument('--min-rate', type=float, default=300, help='现场扫码吞吐量的下限（次/秒）')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    from extensions import db, checkin_writer
+    from models import Participation
+    from utils.checkin import sign_ticket, issue_scanner_token
+
+    app.config['SQL_STATS_HEADERS'] = True
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    failures = []
+    try:
+        with app.app_context():
+            activity_id = seed_activity_with_participants(db, args.participants)
+            participations = db.session.scalars(
+                db.select(Participation).where(Participation.activity_id == activity_id).order_by(Participation.id)
+            ).all()
+            tokens = [sign_ticket(app.config, participation) for participation in participations]
+            scanner_token = issue_scanner_token(app.config, activity_id, participations[0].user_id)
+        path = f'/activity/{activity_id}/checkin/scan'
+
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+
+        # 现场扫码：每个入口分到一份电子票，按比例重复扫码，另混入 1% 伪造的票
+        live = tokens[:len(tokens) // 2]
+        rng = random.Random(42)
+        plans = [[] for _ in range(args.threads)]
+        for index, token in enumerate(live):
+            plan = plans[index % args.threads]
+            plan.append((token, 'checked_in'))
+            if rng.random() < args.duplicate_ratio:
+                plan.append((token, 'duplicate'))
+            if rng.random() < 0.01:
+                plan.append((forge(token), 'invalid'))
+        latencies, queries = [], []
+        lock = threading.Lock()
+
+        def scanner(plan):
+            for token, expected in plan:
+                with Timer() as timer:
+                    status, data, sql_count = post(port, path, scanner_token, {'token': token})
+                result = data['results'][0]['status'] if status == 200 else status
+                with lock:
+                    latencies.append(timer.elapsed * 1000)
+                    queries.append(sql_count)
+                    if result != expected:
+                        failures.append(f'现场扫码返回 {result}，应为 {expected}')
+
+        workers = [threading.Thread(target=scanner, args=(plan,)) for plan in plans]
+        with Timer() as live_timer:
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        live_rate = len(latencies) / live_timer.elapsed
+
+        # 离线补交：扫码时间取一分钟前，写入的签到时间应以它为准
+        offline = tokens[len(tokens) // 2:]
+        scanned_at = time.time() - 60
+        with Timer() as offline_timer:
+            for offset in range(0, len(offline), args.batch):
+                batch = offline[offset:offset + args.batch]
+                status, data, sql_count = post(port, path, scanner_token,
+                                               {'scans': [{'token': token, 'at': scanned_at} for token in batch]})
+                queries.append(sql_count)
+                if status != 200 or any(item['status'] != 'checked_in' for item in data['results']):
+                    failures.append(f'离线补交返回 {status}')
+        offline_rate = len(offline) / offline_timer.elapsed
+
+        with Timer() as flush_timer:
+            flushed = checkin_writer.flush(timeout=60)
+        server.shutdown()
+        if not flushed:
+            failures.append('签到队列 60 秒内没有写完')
+
+        with app.app_context():
+            rows = db.session.execute(
+                db.select(Participation.id, Participation.status, Participation.checked_in_at)
+                .where(Participation.activity_id == activity_id)
+            ).all()
+        offline_ids = {participation.id for participation in participations[len(tokens) // 2:]}
+        not_checked = [row.id for row in rows if row.checked_in_at is None or row.status != 'checked_in']
+        # SQLite 读回的是不带时区的 UTC 时间
+        wrong_time = [row.id for row in rows if row.id in offline_ids and row.checked_in_at is not None
+                      and abs(row.checked_in_at.replace(tzinfo=timezone.utc).timestamp() - scanned_at) > 1]
+        if not_checked:
+            failures.append(f'{len(not_checked)} 个报名没有写入签到')
+        if wrong_time:
+            failures.append(f'{len(wrong_time)} 个离线签到的时间不是设备记录的扫码时间')
+        if any(queries):
+            failures.append(f'签到接口执行了 SQL（最多 {max(queries)} 条）')
+
+        print(f'{args.participants} 人报名，{args.threads} 个入口同时扫码')
+        print(f'现场扫码：{len(latencies)} 次，{live_rate:.0f} 次/秒，'
+              f'p50 {np.percentile(latencies, 50):.1f} ms，p95 {np.percentile(latencies, 95):.1f} ms，'
+              f'p99 {np.percentile(latencies, 99):.1f} ms')
+        print(f'离线补交：{len(offline)} 张，每批 {args.batch} 张，{offline_rate:.0f} 张/秒')
+        print(f'等待签到队列写完：{flush_timer.elapsed * 1000:.1f} ms；'
+              f'签到接口每个请求的 SQL 语句数最多 {max(queries)} 条')
+        if live_rate < args.min_rate:
+            failures.append(f'现场扫码吞吐量 {live_rate:.0f} 次/秒低于下限 {args.min_rate:.0f}')
+        for failure in sorted(set(failures)):
+            print(f'失败: {failure}')
+        if failures:
+            sys.exit(1)
+        print('全部报名均已签到')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""基准测试公共工具：在独立的 SQLite 数据库上启动应用"""
+import os
+import sys
+import time
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def make_app(db_path=None):
+    """创建一个使用临时 SQLite 数据库的应用实例，返回 (app, db_path)"""
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(prefix='bench_', suffix='.db')
+        os.close(fd)
+        os.remove(db_path)
+    # Config 在导入时读取环境变量，必须在导入 app 之前设置
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # 访问日志会淹没基准输出，只保留警告以上
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+    return app, db_path
+
+
+def login_client(app, user_id):
+    """返回一个已登录为指定用户的测试客户端（跳过密码校验）"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+class Timer:
+    """简单的计时上下文管理器"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
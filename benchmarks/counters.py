@@ -0,0 +1,108 @@
+"""计数校正基准测试：在生成的数据集上注入偏差，检查 reconcile_activity_counters 找出并修正全部偏差，以及每秒校正的活动数
+
+用法：python -m benchmarks.counters [--activities 20000] [--participations 200000] [--drift 500] [--batch-size 1000]
+
+生成的数据计数都是准确的。随机挑 --drift 个活动改乱报名数、点赞数或评论数（含 NULL），校正后：
+- 报告的偏差行数应等于注入的行数，数据库里的计数与 GROUP BY 的结果一致
+- 再跑一次应没有任何偏差
+另外模拟校正期间的并发写入：读取之后、更新之前改动过的行应被跳过而不是覆盖。不符合时以退出码 1 结束。
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.common import make_app, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='计数校正基准测试')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--activities', type=int, default=20000)
+    parser.add_argument('--participations', type=int, default=200000)
+    parser.add_argument('--drift', type=int, default=500, help='注入偏差的活动数')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    from generate_data import generate
+
+    app, db_path = make_app()
+    from extensions import db
+    from models import Activity
+    from utils import counters
+
+    failures = []
+    try:
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        with Timer() as generate_timer:
+            generate(app, log=lambda message: None, now=today, workers=1, users=args.users,
+                     activities=args.activities, participations=args.participations,
+                     likes=args.participations // 4, comments=args.participations // 10)
+        print(f'生成数据 {generate_timer.elapsed:.1f} 秒')
+
+        with app.app_context():
+            ids = db.session.scalars(db.select(Activity.id)).all()
+            rng = random.Random(42)
+            drifted = rng.sample(ids, min(args.drift, len(ids)))
+            for activity_id in drifted:
+                name = rng.choice(counters.ACTIVITY_COUNTERS)
+                value = None if name != 'comments_count' and rng.random() < 0.1 else rng.randint(1000, 2000)
+                db.session.execute(db.update(Activity).where(Activity.id == activity_id).values({name: value}))
+            db.session.commit()
+
+            with Timer() as timer:
+                reports = counters.reconcile_activity_counters(batch_size=args.batch_size)
+            report = reports['activity']
+            print(counters.format_drift_report(reports))
+            print(f"校正 {report['scanned']} 个活动用时 {timer.elapsed:.2f} 秒，{report['scanned'] / timer.elapsed:.0f} 个/秒")
+            if report['drifted'] != len(drifted) or report['updated'] != len(drifted):
+                failures.append(f"注入 {len(drifted)} 行偏差，报告 {report['drifted']} 行、更新 {report['updated']} 行")
+
+            # 与校正代码无关的整表 GROUP BY 核对
+            for name, child in counters._activity_sources()[0][1].items():
+                expected = dict(db.session.execute(
+                    db.select(child.activity_id, db.func.count()).group_by(child.activity_id)
+                ).all())
+                actual = db.session.execute(db.select(Activity.id, Activity.__table__.c[name])).all()
+                wrong = sum(1 for activity_id, value in actual if value != expected.get(activity_id, 0))
+                if wrong:
+                    failures.append(f'校正后仍有 {wrong} 个活动的 {name} 不正确')
+
+            again = counters.reconcile_activity_counters(batch_size=args.batch_size)['activity']
+            if again['drifted']:
+                failures.append(f"第二次校正仍发现 {again['drifted']} 行偏差")
+
+            # 并发写入：读取之后把计数改掉（相当于期间有人报名），校正不应覆盖它
+            victim = drifted[0]
+            db.session.execute(db.update(Activity).where(Activity.id == victim).values(likes_count=5000))
+            db.session.commit()
+            statement_rows = []
+            original_execute = db.session.execute
+
+            def racing_execute(statement, params=None, *rest, **kwargs):
+                if isinstance(params, list) and not statement_rows:
+                    statement_rows.append(len(params))
+                    original_execute(db.update(Activity).where(Activity.id == victim).values(likes_count=6000))
+                return original_execute(statement, params, *rest, **kwargs)
+
+            db.session.execute = racing_execute
+            try:
+                raced = counters.reconcile_activity_counters(batch_size=args.batch_size)['activity']
+            finally:
+                del db.session.execute
+            value = db.session.scalar(db.select(Activity.likes_count).where(Activity.id == victim))
+            if raced['skipped'] != 1 or value != 6000:
+                failures.append(f"并发修改的行被覆盖（跳过 {raced['skipped']} 行，likes_count={value}）")
+    finally:
+        os.remove(db_path)
+
+    for failure in failures:
+        print(f'失败: {failure}')
+    if failures:
+        sys.exit(1)
+    print('偏差全部找出并修正，并发修改的行没有被覆盖')
+
+
+if __name__ == '__main__':
+    main()
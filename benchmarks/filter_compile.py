@@ -0,0 +1,135 @@
+"""列表筛选语句每个请求的构建+编译耗时：手写 Query 与 ActivityFilter 的缓存语句对比
+
+用法：python -m benchmarks.filter_compile [--requests 5000]
+
+分三项测量（均在空表上，数据库本身几乎不耗时）：
+- 构建+缓存键：每个请求都要付出的开销。SQLAlchemy 用缓存键查找已编译的 SQL，
+  手写 Query 每次要构建完整的语句树再遍历生成缓存键，ActivityFilter 直接取出缓存的语句对象，缓存键也已生成过。
+- 无缓存编译：把语句直接编译成 SQL 字符串，即没有编译缓存时每个请求额外要付出的开销。
+- 端到端：执行首页的分页查询（列表 + 计数），包含连接和结果处理。
+"""
+import argparse
+import itertools
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+
+from benchmarks.common import make_app, Timer
+
+# 模拟不同请求的筛选参数组合
+REQUEST_ARGS = [
+    {},
+    {'venue_id': '1'},
+    {'activity_type_id': '2', 'status': 'upcoming'},
+    {'start_date': '2025-01-01', 'end_date': '2025-12-31'},
+    {'search': '讲座'},
+    {'venue_id': '3', 'activity_type_id': '1', 'status': 'ended', 'start_date': '2024-09-01'},
+]
+
+
+def handwritten_query(Activity, args):
+    """原先路由中的写法：每个请求重新构建 Query 并解析日期"""
+    query = Activity.query.filter_by(status='active', is_approved=True)
+    query = query.options(joinedload(Activity.venue), joinedload(Activity.activity_type))
+    if args.get('search'):
+        query = query.filter(Activity.title.ilike(f"%{args['search']}%"))
+    if args.get('activity_type_id'):
+        query = query.filter_by(activity_type_id=int(args['activity_type_id']))
+    if args.get('venue_id'):
+        query = query.filter_by(venue_id=int(args['venue_id']))
+    if args.get('start_date'):
+        try:
+            query = query.filter(Activity.start_time >= datetime.strptime(args['start_date'], '%Y-%m-%d'))
+        except Exception:
+            pass
+    if args.get('end_date'):
+        try:
+            end_dt = datetime.strptime(args['end_date'], '%Y-%m-%d')
+            query = query.filter(Activity.end_time <= end_dt + timedelta(days=1))
+        except Exception:
+            pass
+    if args.get('status') in ('upcoming', 'ongoing', 'ended'):
+        query = query.filter(Activity.lifecycle_status == args['status'])
+    return query.order_by(Activity.start_time.desc())
+
+
+def index_statement(Activity):
+    """与 public.index 相同的基础语句"""
+    from extensions import db
+    return db.select(Activity).where(
+        Activity.status == 'active', Activity.is_approved == True
+    ).options(joinedload(Activity.venue), joinedload(Activity.activity_type)).order_by(Activity.start_time.desc())
+
+
+def build_handwritten(Activity, args):
+    statement = handwritten_query(Activity, args).limit(9).offset(0).statement
+    return statement._generate_cache_key()
+
+
+def build_cached(Activity, args):
+    from utils.filters import ActivityFilter
+
+    filters = ActivityFilter.from_request(MultiDict(args))
+    statement = filters.statement('bench.index', lambda: index_statement(Activity))
+    return statement._generate_cache_key(), filters.params
+
+
+def compile_without_cache(Activity, args, dialect):
+    statement = handwritten_query(Activity, args).limit(9).offset(0).statement
+    return str(statement.compile(dialect=dialect))
+
+
+def end_to_end_handwritten(Activity, args):
+    return handwritten_query(Activity, args).paginate(page=1, per_page=9, error_out=False)
+
+
+def end_to_end_cached(Activity, args):
+    from utils.filters import ActivityFilter
+
+    filters = ActivityFilter.from_request(MultiDict(args))
+    return filters.paginate('bench.index', lambda: index_statement(Activity), page=1, per_page=9, error_out=False)
+
+
+def measure(func, requests):
+    args_cycle = itertools.cycle(REQUEST_ARGS)
+    # 预热：填充语句缓存和编译缓存
+    for args in REQUEST_ARGS:
+        func(args)
+    with Timer() as timer:
+        for _ in range(requests):
+            func(next(args_cycle))
+    return timer.elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列表筛选语句构建+编译基准测试')
+    parser.add_argument('--requests', type=int, default=5000, help='模拟的请求数')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    from extensions import db
+    from models import Activity
+
+    try:
+        with app.test_request_context():
+            dialect = db.engine.dialect
+            rows = [
+                ('构建+缓存键', measure(lambda a: build_handwritten(Activity, a), args.requests),
+                 measure(lambda a: build_cached(Activity, a), args.requests)),
+                ('无缓存编译（参照）', measure(lambda a: compile_without_cache(Activity, a, dialect), args.requests), None),
+                ('端到端（列表+计数）', measure(lambda a: end_to_end_handwritten(Activity, a), args.requests),
+                 measure(lambda a: end_to_end_cached(Activity, a), args.requests)),
+            ]
+        print(f'请求数: {args.requests}，筛选组合: {len(REQUEST_ARGS)}，单位: 微秒/请求')
+        print(f"{'':<20}{'手写 Query':>12}{'ActivityFilter':>16}")
+        for name, handwritten, cached in rows:
+            cached_text = f'{cached:.0f}' if cached is not None else '-'
+            print(f'{name:<20}{handwritten:>12.0f}{cached_text:>16}')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
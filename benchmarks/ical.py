@@ -0,0 +1,103 @@
+"""日历订阅基准测试：日历应用轮询 .ics 地址时，首次生成与带 ETag 的条件请求（304）的耗时和 SQL 语句数
+
+用法：python -m benchmarks.ical [--participants 1000] [--polls 3] [--max-hit-ms 5]
+
+先让每个报名者请求一次自己的日历（生成并缓存文件），再按 --polls 轮带 If-None-Match 轮询，
+然后编辑一次活动，检查全部报名者的日历都被失效并在下一次轮询时拿到新内容。
+304 请求执行了 SQL、304 的 p95 超过 --max-hit-ms 或编辑后仍返回 304 时以退出码 1 结束。
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import make_app, login_client, Timer
+from benchmarks.notification_fanout import seed_activity_with_participants
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日历订阅基准测试')
+    parser.add_argument('--participants', type=int, default=1000)
+    parser.add_argument('--polls', type=int, default=3, help='条件请求的轮数')
+    parser.add_argument('--max-hit-ms', type=float, default=5, help='304 请求 p95 的上限（毫秒）')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    app.config['SQL_STATS_HEADERS'] = True
+    app.config['ICAL_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench_ical_')
+    from extensions import db
+    from models import Activity, Participation
+    from utils.ical import feed_token
+
+    failures = []
+    try:
+        with app.app_context():
+            activity_id = seed_activity_with_participants(db, args.participants)
+            user_ids = db.session.scalars(
+                db.select(Participation.user_id).where(Participation.activity_id == activity_id)
+            ).all()
+            organizer_id = db.session.get(Activity, activity_id).organizer_id
+        paths = [f"/calendar/user/{user_id}/{feed_token(app.config, 'user', user_id)}.ics" for user_id in user_ids]
+        client = app.test_client()
+
+        def poll(etags):
+            latencies, queries, statuses = [], [], []
+            for path in paths:
+                headers = {'If-None-Match': etags[path]} if path in etags else {}
+                with Timer() as timer:
+                    response = client.get(path, headers=headers)
+                latencies.append(timer.elapsed * 1000)
+                queries.append(int(response.headers.get('X-SQL-Count', 0)))
+                statuses.append(response.status_code)
+                etags[path] = response.headers['ETag']
+            return np.array(latencies), np.array(queries), np.array(statuses)
+
+        def report(label, latencies, queries, statuses):
+            print(f'{label}: {len(latencies)} 次，p50 {np.percentile(latencies, 50):.2f} ms，'
+                  f'p95 {np.percentile(latencies, 95):.2f} ms，每次 SQL {queries.mean():.1f} 条，'
+                  f'304 {int((statuses == 304).sum())} 次')
+
+        etags = {}
+        latencies, queries, statuses = poll(etags)
+        report('首次生成', latencies, queries, statuses)
+
+        hits = [poll(etags) for _ in range(args.polls)]
+        latencies, queries, statuses = (np.concatenate(values) for values in zip(*hits))
+        report('条件轮询', latencies, queries, statuses)
+        if (statuses != 304).any():
+            failures.append(f'{int((statuses != 304).sum())} 次条件轮询没有返回 304')
+        if queries.any():
+            failures.append(f'304 请求执行了 SQL（最多 {queries.max()} 条）')
+        if np.percentile(latencies, 95) > args.max_hit_ms:
+            failures.append(f'304 的 p95 {np.percentile(latencies, 95):.2f} ms 超过上限 {args.max_hit_ms} ms')
+
+        with app.app_context():
+            activity = db.session.get(Activity, activity_id)
+            start, end = activity.start_time, activity.end_time
+        organizer = login_client(app, organizer_id)
+        with Timer() as edit_timer:
+            organizer.post(f'/activity/{activity_id}/edit', data={
+                'title': '改期后的活动', 'description': '', 'venue': '', 'activity_type': '',
+                'start_time': start.strftime('%Y-%m-%dT%H:%M'), 'end_time': end.strftime('%Y-%m-%dT%H:%M'),
+                'max_participants': args.participants, 'tags': ''
+            })
+        latencies, queries, statuses = poll(etags)
+        report(f'编辑活动（{edit_timer.elapsed * 1000:.1f} ms）后的轮询', latencies, queries, statuses)
+        if (statuses != 200).any():
+            failures.append(f'编辑活动后 {int((statuses != 200).sum())} 个日历没有更新')
+
+        for failure in failures:
+            print(f'失败: {failure}')
+        if failures:
+            sys.exit(1)
+        print('轮询未执行 SQL，编辑后全部日历均已更新')
+    finally:
+        os.remove(db_path)
+        shutil.rmtree(app.config['ICAL_CACHE_DIR'], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""通知扇出基准测试：为 1000 名报名者写入活动变更通知的吞吐量
+
+用法：python -m benchmarks.notification_fanout [--participants 1000] [--chunk-size 500]
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import make_app, Timer
+
+
+def seed_activity_with_participants(db, count):
+    from models import User, Activity, Participation
+
+    organizer = User(username='bench_organizer', email='bench_organizer@example.com')
+    db.session.add(organizer)
+    db.session.commit()
+    db.session.execute(
+        db.insert(User),
+        [{'username': f'bench_user_{i}', 'email': f'bench_user_{i}@example.com'} for i in range(count)]
+    )
+    start_time = datetime.now(timezone.utc) + timedelta(days=7)
+    activity = Activity(
+        title='礼堂迎新晚会', description='通知扇出基准测试',
+        start_time=start_time, end_time=start_time + timedelta(hours=3),
+        organizer_id=organizer.id, max_participants=count, current_participants=count,
+        status='active', review_status='approved', is_approved=True
+    )
+    db.session.add(activity)
+    db.session.commit()
+    user_ids = db.session.scalars(db.select(User.id).where(User.id != organizer.id)).all()
+    db.session.execute(
+        db.insert(Participation),
+        [{'user_id': user_id, 'activity_id': activity.id, 'status': 'registered',
+          'registered_at': datetime.now(timezone.utc)} for user_id in user_ids]
+    )
+    db.session.commit()
+    return activity.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='通知扇出基准测试')
+    parser.add_argument('--participants', type=int, default=1000, help='报名人数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每批写入的通知数')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    app.config['NOTIFICATION_FANOUT_CHUNK_SIZE'] = args.chunk_size
+    from extensions import db, notification_fanout
+    from models import Notification
+    from utils.jobs import claim_jobs, run_job
+
+    try:
+        with app.app_context():
+            activity_id = seed_activity_with_participants(db, args.participants)
+
+        event = {
+            'notification_type': 'activity_updated',
+            'activity_id': activity_id,
+            'activity_title': '礼堂迎新晚会',
+            'detail': '时间变更',
+            'source_activity_id': activity_id
+        }
+        # 请求只写入一个任务，由任务工作进程完成写入
+        with app.app_context():
+            with Timer() as total:
+                with Timer() as enqueue:
+                    notification_fanout.enqueue(event)
+                for job_id in claim_jobs('bench', 1):
+                    run_job(job_id)
+            delivered = db.session.scalar(db.select(db.func.count(Notification.id)))
+
+        print(f'报名人数: {args.participants}，每批 {args.chunk_size} 条')
+        print(f'入队耗时（请求内）: {enqueue.elapsed * 1000:.2f} ms')
+        print(f'扇出总耗时: {total.elapsed * 1000:.1f} ms')
+        print(f'写入通知: {delivered}，吞吐量 {delivered / max(total.elapsed, 1e-9):.0f} 条/秒')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
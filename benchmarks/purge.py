@@ -0,0 +1,159 @@
+"""删除与清理基准测试：删除一个有大量报名、点赞、评论的活动和批量删除用户的请求耗时，以及后台清理任务的耗时
+
+用法：python -m benchmarks.purge [--participants 10000] [--deleted-users 1000] [--max-ms 500]
+
+删除请求只做软删除，耗时和 SQL 条数不应随子记录数量增长。清理任务执行后检查：
+- 子记录全部删除，活动和用户行被真正删除
+- 用户计数和活动计数与实际记录一致（recount/reconcile 不再发现偏差）
+删除请求超过 --max-ms、已删除的活动仍能访问、已删除的用户仍能登录或清理后有残留/计数偏差时以退出码 1 结束。
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+
+from benchmarks.common import make_app, login_client, Timer
+from benchmarks.notification_fanout import seed_activity_with_participants
+
+
+def run_purge(db, claim_jobs, run_job, Job):
+    with Timer() as timer:
+        job_ids = claim_jobs('bench', 10)
+        for job_id in job_ids:
+            run_job(job_id)
+    statuses = [db.session.get(Job, job_id).status for job_id in job_ids]
+    return timer.elapsed, job_ids, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='删除与清理基准测试')
+    parser.add_argument('--participants', type=int, default=10000, help='活动的报名、点赞人数')
+    parser.add_argument('--deleted-users', type=int, default=1000, help='批量删除的用户数')
+    parser.add_argument('--max-ms', type=float, default=500, help='删除请求耗时上限（毫秒）')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    app.config['SQL_STATS_HEADERS'] = True
+    app.config['PURGE_DELAY'] = 0
+    from extensions import db
+    from models import User, Activity, Participation, Comment, Like, Notification, Job
+    from utils.counters import recount_user_counters, reconcile_activity_counters
+    from utils.jobs import claim_jobs, run_job
+
+    failures = []
+    try:
+        with app.app_context():
+            activity_id = seed_activity_with_participants(db, args.participants)
+            user_ids = db.session.scalars(
+                db.select(Participation.user_id).where(Participation.activity_id == activity_id)
+            ).all()
+            now = datetime.now(timezone.utc)
+            db.session.execute(db.insert(Like), [
+                {'user_id': user_id, 'activity_id': activity_id, 'created_at': now} for user_id in user_ids
+            ])
+            db.session.execute(db.insert(Comment), [
+                {'user_id': user_id, 'activity_id': activity_id, 'content': '期待', 'created_at': now}
+                for user_id in user_ids[::10]
+            ])
+            db.session.execute(db.insert(Notification), [
+                {'user_id': user_id, 'activity_id': activity_id, 'notification_type': 'activity_updated',
+                 'created_at': now} for user_id in user_ids
+            ])
+            # 第二个活动：被批量删除的用户也报名并点赞了它，清理后它的人数和点赞数应相应减少
+            activity = db.session.get(Activity, activity_id)
+            organizer_id = activity.organizer_id
+            other = Activity(title='社团招新', start_time=activity.start_time + timedelta(days=1),
+                             end_time=activity.end_time + timedelta(days=1), organizer_id=organizer_id,
+                             status='active', review_status='approved', is_approved=True, tags='社团')
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+            deleted_user_ids = user_ids[:args.deleted_users]
+            db.session.execute(db.insert(Participation), [
+                {'user_id': user_id, 'activity_id': other_id, 'status': 'registered', 'registered_at': now}
+                for user_id in user_ids[:args.deleted_users * 2]
+            ])
+            db.session.execute(db.insert(Like), [
+                {'user_id': user_id, 'activity_id': other_id, 'created_at': now} for user_id in deleted_user_ids
+            ])
+            admin = User(username='bench_admin', email='bench_admin@example.com', is_admin=True)
+            db.session.add(admin)
+            db.session.commit()
+            admin_id = admin.id
+            reconcile_activity_counters()
+            recount_user_counters()
+        print(f'{args.participants} 人报名并点赞，{len(user_ids[::10])} 条评论，{args.participants} 条通知')
+
+        organizer = login_client(app, organizer_id)
+        with Timer() as timer:
+            response = organizer.post(f'/activity/{activity_id}/delete')
+        print(f'删除活动: {timer.elapsed * 1000:.1f} ms，SQL {response.headers.get("X-SQL-Count")} 条')
+        if timer.elapsed * 1000 > args.max_ms:
+            failures.append(f'删除活动耗时 {timer.elapsed * 1000:.1f} ms 超过上限 {args.max_ms} ms')
+        if organizer.get(f'/activity/{activity_id}').status_code != 404:
+            failures.append('软删除的活动仍能访问')
+
+        admin_client = login_client(app, admin_id)
+        with Timer() as timer:
+            response = admin_client.post('/users/bulk', data={
+                'action': 'delete', 'scope': 'selected', 'user_ids': [str(user_id) for user_id in deleted_user_ids]
+            })
+        print(f'批量删除 {len(deleted_user_ids)} 个用户: {timer.elapsed * 1000:.1f} ms，'
+              f'SQL {response.headers.get("X-SQL-Count")} 条')
+        if timer.elapsed * 1000 > args.max_ms:
+            failures.append(f'批量删除用户耗时 {timer.elapsed * 1000:.1f} ms 超过上限 {args.max_ms} ms')
+        if login_client(app, deleted_user_ids[0]).get('/profile').status_code == 200:
+            failures.append('软删除的用户仍能登录')
+
+        with app.app_context():
+            # 取消通知的扇出任务优先级更高，先于清理任务执行，仍能按报名记录找到接收者
+            elapsed, job_ids, statuses = run_purge(db, claim_jobs, run_job, Job)
+            print(f'扇出和清理任务: {len(job_ids)} 个，{elapsed:.2f} 秒，状态 {statuses}')
+            if not statuses or set(statuses) != {'succeeded'}:
+                failures.append(f'任务状态为 {statuses}')
+            cancelled = db.session.scalar(
+                db.select(db.func.count(Notification.id)).where(Notification.notification_type == 'activity_cancelled')
+            )
+            if cancelled != len(user_ids) - len(deleted_user_ids):
+                failures.append(f'取消通知 {cancelled} 条，应为 {len(user_ids) - len(deleted_user_ids)} 条')
+
+            for model in (Participation, Comment, Like, Notification):
+                left = db.session.scalar(db.select(db.func.count(model.id)).where(model.activity_id == activity_id))
+                if left:
+                    failures.append(f'{model.__tablename__} 仍有 {left} 行属于已删除的活动')
+            for model in (Participation, Like, Notification):
+                left = db.session.scalar(
+                    db.select(db.func.count(model.id)).where(model.user_id.in_(deleted_user_ids))
+                )
+                if left:
+                    failures.append(f'{model.__tablename__} 仍有 {left} 行属于已删除的用户')
+            remaining = db.session.scalar(
+                db.select(db.func.count(User.id)).where(User.id.in_(deleted_user_ids))
+                .execution_options(include_deleted=True)
+            ) + db.session.scalar(
+                db.select(db.func.count(Activity.id)).where(Activity.id == activity_id)
+                .execution_options(include_deleted=True)
+            )
+            if remaining:
+                failures.append(f'仍有 {remaining} 个已删除的活动或用户没有清理')
+
+            drifted = reconcile_activity_counters(dry_run=True)['activity']['drifted']
+            if drifted:
+                failures.append(f'清理后有 {drifted} 个活动的计数与实际记录不一致')
+            changed = recount_user_counters()
+            if changed:
+                failures.append(f'清理后有 {changed} 个用户的计数与实际记录不一致')
+            other = db.session.get(Activity, other_id)
+            print(f'第二个活动清理后: 报名 {other.current_participants}，点赞 {other.likes_count}')
+    finally:
+        os.remove(db_path)
+
+    for failure in failures:
+        print(f'失败: {failure}')
+    if failures:
+        sys.exit(1)
+    print('删除请求立即返回，清理后没有残留，计数一致')
+
+
+if __name__ == '__main__':
+    main()
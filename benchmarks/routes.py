@@ -0,0 +1,381 @@
+"""端到端路由基准测试：每个路由的 p50/p95/p99 延迟和每个请求的 SQL 语句数，并与基线比较
+
+用法：
+    python -m benchmarks.routes                           # 测试客户端逐个请求，打印结果并与基线比较
+    python -m benchmarks.routes --save-baseline           # 把本次的 SQL 语句数保存为基线
+    python -m benchmarks.routes --latency-baseline /tmp/routes_latency.json --save-baseline
+                                                          # 同时在本机录制延迟基线，之后带同一参数运行即比较延迟
+    python -m benchmarks.routes --mode http --threads 8   # 多线程 HTTP 压测（每个线程一个登录用户）
+    python -m benchmarks.routes --only index --repeat 50  # 只跑名称包含 index 的场景
+
+数据由 generate_data.generate() 写入临时 SQLite 数据库，种子和“当前时间”（当天 0 点 UTC）固定，
+同一天内多次运行的数据完全相同。每个场景以一个角色（匿名、普通用户、发起人、审核员、管理员）请求一个路由，
+加入/退出、点赞/取消点赞成对执行，保证每轮结束时数据恢复原状。
+
+SQL 语句数由 utils.sqlstats 按请求统计，通过 X-SQL-Count 响应头带回，两种模式都适用。
+以下情况判为退化，脚本以退出码 1 结束，可以直接放进 CI：
+- SQL 语句数比基线多 --query-threshold 条以上。仓库里的基线 baseline_routes.json 只记录语句数，与机器无关。
+- 同一请求内同形语句出现 SQL_NPLUSONE_THRESHOLD 次以上（N+1，X-SQL-Repeated 响应头），
+  不论基线是多少；确实无法消除的写进 KNOWN_NPLUSONE 并注明原因，不能靠提高语句数预算放过。
+- 给了 --latency-baseline 时，p95 比该文件中的记录慢 --latency-threshold（比例）且超过 --latency-floor 毫秒。
+  延迟只在同一台机器上可比，这个文件由各自在本机录制，不提交到仓库。
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from benchmarks.common import make_app, Timer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_routes.json')
+SQL_COUNT_HEADER = 'X-SQL-Count'
+SQL_REPEATED_HEADER = 'X-SQL-Repeated'
+DATASET = {'users': 3000, 'activities': 3000, 'participations': 30000, 'likes': 15000, 'comments': 6000}
+
+# 已知且暂不修复的 N+1：场景名 -> 原因。这些场景仍按基线检查语句数，但不因 N+1 判为退化
+KNOWN_NPLUSONE = {}
+
+
+class Step:
+    """场景中的一个请求；expect 为可接受的状态码"""
+
+    def __init__(self, name, method, path, data=None, expect=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.expect = expect
+
+
+def build_scenarios(refs):
+    """返回 [(角色, [Step, ...])]，同一场景的步骤每轮按顺序执行"""
+    hot = refs['hot_activity']
+    joinable = refs['joinable_activity']
+    exportable = refs['exportable_activity']
+    today = datetime.now(timezone.utc).date()
+    month = f'start_date={today - timedelta(days=30)}&end_date={today}'
+    redirect = (302,)
+    return [
+        ('anon', [Step('index', 'GET', '/')]),
+        ('anon', [Step('index?type', 'GET', f'/?activity_type_id={refs["type_id"]}')]),
+        ('anon', [Step('index?venue', 'GET', f'/?venue_id={refs["venue_id"]}')]),
+        ('anon', [Step('index?status', 'GET', '/?status=upcoming')]),
+        ('anon', [Step('index?date', 'GET', f'/?{month}')]),
+        ('anon', [Step('index?search', 'GET', '/?search=讲座')]),
+        ('anon', [Step('index?hot', 'GET', '/?hot=1')]),
+        ('anon', [Step('index?page', 'GET', '/?page=20')]),
+        ('anon', [Step('index?recommend', 'GET', '/?recommend=1')]),
+        ('anon', [Step('activity_detail', 'GET', f'/activity/{hot}')]),
+        ('anon', [Step('login', 'GET', '/login')]),
+        ('user', [Step('index:user', 'GET', '/')]),
+        ('user', [Step('index?recommend:user', 'GET', '/?recommend=1')]),
+        ('user', [Step('activity_detail:user', 'GET', f'/activity/{hot}')]),
+        ('user', [Step('join', 'POST', f'/activity/{joinable}/join', expect=redirect),
+                  Step('quit', 'POST', f'/activity/{joinable}/quit', expect=redirect)]),
+        ('user', [Step('like', 'POST', f'/activity/{hot}/like'),
+                  Step('like', 'POST', f'/activity/{hot}/like')]),
+        ('user', [Step('profile', 'GET', '/profile')]),
+        ('user', [Step('profile_timeline', 'GET', '/profile/timeline?kind=participated')]),
+        ('user', [Step('my_activities', 'GET', '/my_activities')]),
+        ('user', [Step('my_activities?status', 'GET', '/my_activities?status=ended')]),
+        ('user', [Step('notifications', 'GET', '/notifications')]),
+        ('user', [Step('create_activity', 'GET', '/create_activity')]),
+        ('organizer', [Step('edit_activity', 'GET', f'/activity/{exportable}/edit', expect=(200, 302))]),
+        ('organizer', [Step('export_activity', 'GET', f'/activity/{exportable}/export')]),
+        ('organizer', [Step('export_activity_data', 'POST', '/export_activity_data', {'activity_id': exportable})]),
+        ('organizer', [Step('export_activity_data:async', 'POST', '/export_activity_data',
+                            {'activity_id': exportable, 'async': '1'}, expect=(202,))]),
+        ('organizer', [Step('job_status', 'GET', f'/jobs/{refs["job_id"]}')]),
+        ('reviewer', [Step('review_list', 'GET', '/review/list')]),
+        ('reviewer', [Step('review_activity', 'GET', f'/review/{refs["pending_activity"]}')]),
+        ('reviewer', [Step('review_history', 'GET', '/review/history')]),
+        ('admin', [Step('admin_dashboard', 'GET', '/dashboard')]),
+        ('admin', [Step('admin_users', 'GET', '/users')]),
+        ('admin', [Step('admin_users?search', 'GET', '/users?field=username&search=load00012')]),
+        ('admin', [Step('admin_venues', 'GET', '/venues')]),
+        ('admin', [Step('admin_venues?selected', 'GET', f'/venues?venue_id={refs["venue_id"]}')]),
+        ('admin', [Step('admin_activity_types', 'GET', '/activity_types')]),
+    ]
+
+
+def find_refs(db, threads):
+    """挑出场景要用的用户和活动"""
+    from models import User, Activity, Participation, ActivityType, Venue
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    users = db.session.scalars(
+        db.select(User.id).where(User.is_admin.is_(False), User.is_reviewer.is_(False))
+        .order_by(User.joined_count.desc(), User.id).limit(threads)
+    ).all()
+    joined = db.select(Participation.activity_id).where(Participation.user_id.in_(users))
+    refs = {
+        'users': users,
+        'admin': db.session.scalar(db.select(User.id).where(User.is_admin.is_(True)).order_by(User.id)),
+        'reviewer': db.session.scalar(db.select(User.id).where(User.is_reviewer.is_(True)).order_by(User.id)),
+        'type_id': db.session.scalar(db.select(ActivityType.id).order_by(ActivityType.id)),
+        'venue_id': db.session.scalar(db.select(Venue.id).order_by(Venue.id)),
+        'hot_activity': db.session.scalar(
+            db.select(Activity.id).where(Activity.is_approved.is_(True))
+            .order_by(Activity.current_participants.desc(), Activity.id)),
+        'joinable_activity': db.session.scalar(
+            db.select(Activity.id).where(
+                Activity.is_approved.is_(True), Activity.lifecycle_status == 'upcoming',
+                Activity.max_participants - Activity.current_participants > threads,
+                Activity.organizer_id.not_in(users), Activity.id.not_in(joined)
+            ).order_by(Activity.current_participants.desc(), Activity.id)),
+        'pending_activity': db.session.scalar(
+            db.select(Activity.id).where(Activity.review_status == 'pending').order_by(Activity.id)),
+    }
+    exportable = db.session.execute(
+        db.select(Activity.id, Activity.organizer_id).where(Activity.end_time < now - timedelta(days=8))
+        .order_by(Activity.current_participants.desc(), Activity.id)
+    ).first()
+    refs['exportable_activity'], refs['organizer'] = exportable
+    missing = [key for key, value in refs.items() if value is None]
+    if missing:
+        raise RuntimeError(f'生成的数据中找不到场景所需的记录: {missing}')
+    return refs
+
+
+def session_cookie(app, user_id):
+    """直接签发登录后的会话 cookie，跳过登录表单和 bcrypt"""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f'{app.config["SESSION_COOKIE_NAME"]}={serializer.dumps({"_user_id": str(user_id), "_fresh": True})}'
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.failures = []
+        self.repeated = {}
+        self.lock = threading.Lock()
+
+    def add(self, step, status, elapsed, queries, repeated=None):
+        with self.lock:
+            if status not in step.expect:
+                self.failures.append((step.name, status))
+            if repeated:
+                self.repeated.setdefault(step.name, repeated)
+            latencies, counts = self.samples.setdefault(step.name, ([], []))
+            latencies.append(elapsed * 1000)
+            counts.append(queries)
+
+    def summary(self):
+        result = {}
+        for name, (latencies, counts) in self.samples.items():
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            result[name] = {'requests': len(latencies), 'p50': round(float(p50), 2), 'p95': round(float(p95), 2),
+                            'p99': round(float(p99), 2), 'queries': int(np.median(counts))}
+        return result
+
+
+def run_client(app, scenarios, refs, recorder, repeat):
+    """测试客户端模式：单线程，每个角色一个客户端"""
+    clients = {'anon': app.test_client()}
+    for role, user_id in (('user', refs['users'][0]), ('organizer', refs['organizer']),
+                          ('reviewer', refs['reviewer']), ('admin', refs['admin'])):
+        client = clients[role] = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    for role, steps in scenarios:
+        client = clients[role]
+        for iteration in range(repeat + 1):
+            for step in steps:
+                with Timer() as timer:
+                    response = client.open(step.path, method=step.method, data=step.data)
+                    response.get_data()
+                # 第一轮用于预热（模板编译、语句缓存），不计入
+                if iteration:
+                    recorder.add(step, response.status_code, timer.elapsed,
+                                 int(response.headers.get(SQL_COUNT_HEADER, 0)),
+                                 response.headers.get(SQL_REPEATED_HEADER))
+
+
+def run_http(app, scenarios, refs, recorder, repeat, threads):
+    """HTTP 模式：多线程 WSGI 服务器 + 每个线程一个登录用户，各线程同时按顺序跑完全部场景"""
+    from urllib.parse import quote, urlencode
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    def request(step, cookie):
+        body = urlencode(step.data).encode() if step.data else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+        if cookie:
+            headers['Cookie'] = cookie
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        try:
+            with Timer() as timer:
+                connection.request(step.method, quote(step.path, safe='/?=&'), body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            return (response.status, timer.elapsed, int(response.getheader(SQL_COUNT_HEADER, 0)),
+                    response.getheader(SQL_REPEATED_HEADER))
+        finally:
+            connection.close()
+
+    def worker(index):
+        cookies = {
+            'anon': None,
+            'user': session_cookie(app, refs['users'][index]),
+            'organizer': session_cookie(app, refs['organizer']),
+            'reviewer': session_cookie(app, refs['reviewer']),
+            'admin': session_cookie(app, refs['admin']),
+        }
+        for role, steps in scenarios:
+            for iteration in range(repeat + 1):
+                for step in steps:
+                    status, elapsed, queries, repeated = request(step, cookies[role])
+                    if iteration:
+                        recorder.add(step, status, elapsed, queries, repeated)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    with Timer() as timer:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    server.shutdown()
+    total = sum(len(latencies) for latencies, _ in recorder.samples.values())
+    print(f'HTTP 模式：{threads} 个线程，共 {total} 个请求，{total / timer.elapsed:.0f} 请求/秒')
+
+
+def compare(summary, baseline, args, latency_baseline=None):
+    """返回退化项列表：(场景, 说明)；latency_baseline 为 None 时不比较延迟"""
+    regressions = []
+    for name, current in summary.items():
+        base = baseline.get(name)
+        if base is not None and current['queries'] > base['queries'] + args.query_threshold:
+            regressions.append((name, f'SQL 语句数 {base["queries"]} -> {current["queries"]}'))
+        base = (latency_baseline or {}).get(name)
+        if base is None:
+            continue
+        slower = current['p95'] - base['p95']
+        if current['p95'] > base['p95'] * (1 + args.latency_threshold) and slower > args.latency_floor:
+            regressions.append((name, f'p95 {base["p95"]:.1f} -> {current["p95"]:.1f} ms'))
+    return regressions
+
+
+def load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端路由基准测试')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client', help='测试客户端或多线程 HTTP')
+    parser.add_argument('--threads', type=int, default=4, help='HTTP 模式的并发线程数')
+    parser.add_argument('--repeat', type=int, default=20, help='每个场景的请求轮数（HTTP 模式为每个线程的轮数）')
+    parser.add_argument('--only', help='只运行名称包含该字符串的场景')
+    parser.add_argument('--scale', type=float, default=1.0, help='数据量倍数（基准数据量见 DATASET）')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='SQL 语句数基线文件路径')
+    parser.add_argument('--latency-baseline', help='本机的延迟基线文件路径，不给时不比较延迟')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基线文件（给了 --latency-baseline 时也写入延迟）')
+    parser.add_argument('--latency-threshold', type=float, default=0.5, help='p95 允许比基线慢的比例')
+    parser.add_argument('--latency-floor', type=float, default=5.0, help='p95 变慢不超过这么多毫秒时不算退化')
+    parser.add_argument('--query-threshold', type=int, default=0, help='SQL 语句数允许比基线多的条数')
+    args = parser.parse_args()
+
+    from generate_data import generate
+
+    app, db_path = make_app()
+    from extensions import db
+
+    # 语句数由 utils.sqlstats 按请求统计，写在响应头里
+    app.config['SQL_STATS_HEADERS'] = True
+    app.config['SQL_SLOW_REQUEST_MS'] = float('inf')
+    app.config['SQL_SLOW_REQUEST_QUERIES'] = float('inf')
+
+    try:
+        dataset = {key: int(value * args.scale) for key, value in DATASET.items()}
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        generate(app, log=lambda message: None, now=today, workers=1, **dataset)
+        with app.app_context():
+            from utils.jobs import enqueue
+
+            refs = find_refs(db, max(args.threads, 1))
+            refs['job_id'] = enqueue('exports.activity_csv', {'activity_id': refs['exportable_activity']},
+                                     user_id=refs['organizer']).id
+
+        scenarios = [(role, steps) for role, steps in build_scenarios(refs)
+                     if not args.only or any(args.only in step.name for step in steps)]
+        recorder = Recorder()
+        if args.mode == 'http':
+            run_http(app, scenarios, refs, recorder, args.repeat, args.threads)
+        else:
+            run_client(app, scenarios, refs, recorder, args.repeat)
+        summary = recorder.summary()
+
+        print(f'数据量: {dataset}，单位: 毫秒')
+        print(f'{"场景":<28}{"请求数":>8}{"p50":>10}{"p95":>10}{"p99":>10}{"SQL":>6}')
+        for name, row in summary.items():
+            print(f'{name:<30}{row["requests"]:>8}{row["p50"]:>10.1f}{row["p95"]:>10.1f}{row["p99"]:>10.1f}{row["queries"]:>6}')
+        for name, status in sorted(set(recorder.failures)):
+            print(f'状态码异常: {name} 返回 {status}')
+        nplusone = [(name, f'N+1: {shape}') for name, shape in sorted(recorder.repeated.items())
+                    if name not in KNOWN_NPLUSONE]
+        for name, reason in KNOWN_NPLUSONE.items():
+            if name in recorder.repeated:
+                print(f'已知 N+1（不计为退化）: {name}: {reason}')
+
+        if args.save_baseline:
+            save_json(args.baseline, {
+                'dataset': dataset,
+                'routes': {name: {'queries': row['queries']} for name, row in summary.items()}
+            })
+            print(f'SQL 语句数基线已保存到 {args.baseline}')
+            if args.latency_baseline:
+                save_json(args.latency_baseline, {'mode': args.mode, 'dataset': dataset, 'routes': summary})
+                print(f'延迟基线已保存到 {args.latency_baseline}')
+            for name, detail in nplusone:
+                print(f'退化: {name}: {detail}')
+            if nplusone or recorder.failures:
+                sys.exit(1)
+        elif os.path.exists(args.baseline):
+            baseline = load_json(args.baseline)
+            if baseline.get('dataset') != dataset:
+                print('基线的数据量与本次不同，语句数可能不可比')
+            latency_baseline = None
+            if args.latency_baseline and os.path.exists(args.latency_baseline):
+                latency_baseline = load_json(args.latency_baseline)
+                if latency_baseline.get('mode') != args.mode or latency_baseline.get('dataset') != dataset:
+                    print('延迟基线的模式或数据量与本次不同，不比较延迟')
+                    latency_baseline = None
+            elif args.latency_baseline:
+                print(f'没有延迟基线文件 {args.latency_baseline}，可加 --save-baseline 在本机录制')
+            regressions = nplusone + compare(summary, baseline['routes'], args,
+                                             latency_baseline and latency_baseline['routes'])
+            for name, detail in regressions:
+                print(f'退化: {name}: {detail}')
+            if regressions or recorder.failures:
+                sys.exit(1)
+            print('与基线相比没有退化')
+        else:
+            print(f'没有基线文件 {args.baseline}，可用 --save-baseline 生成')
+            for name, detail in nplusone:
+                print(f'退化: {name}: {detail}')
+            if nplusone or recorder.failures:
+                sys.exit(1)
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
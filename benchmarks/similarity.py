@@ -0,0 +1,110 @@
+"""相似活动基准测试：批量重建索引的耗时、增量更新的耗时，以及详情页取相似活动的 SQL 条数
+
+用法：python -m benchmarks.similarity [--activities 20000] [--min-lift 2]
+
+生成的活动标题按活动类型取模板，同类型的活动内容相近。检查：
+- 邻居与活动同类型的比例至少是随机配对的 --min-lift 倍
+- 新建一个与某个活动内容几乎相同的活动后，增量更新让两者互相出现在对方的列表中
+- 详情页展示相似活动只多一条 SQL
+不符合时以退出码 1 结束。
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from benchmarks.common import make_app, login_client, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='相似活动基准测试')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--activities', type=int, default=20000)
+    parser.add_argument('--min-lift', type=float, default=2, help='同类型邻居比例相对随机配对的最小倍数')
+    args = parser.parse_args()
+
+    from generate_data import generate
+
+    app, db_path = make_app()
+    app.config['SQL_STATS_HEADERS'] = True
+    index_folder = tempfile.mkdtemp(prefix='bench_similarity_')
+    app.config['SIMILARITY_INDEX_PATH'] = os.path.join(index_folder, 'index.npz')
+    from extensions import db
+    from models import Activity, ActivitySimilarity
+    from utils import similarity
+
+    failures = []
+    try:
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        generate(app, log=lambda message: None, now=today, workers=1, users=args.users,
+                 activities=args.activities, participations=0, likes=0, comments=0)
+
+        with app.app_context():
+            with Timer() as timer:
+                result = similarity.rebuild_similarity()
+            print(f"批量重建: {result['activities']} 个活动，{result['pairs']} 对邻居，{timer.elapsed:.2f} 秒")
+
+            types = dict(db.session.execute(db.select(Activity.id, Activity.activity_type_id)).all())
+            pairs = db.session.execute(db.select(ActivitySimilarity.activity_id, ActivitySimilarity.similar_id)).all()
+            same = sum(types[a] == types[b] for a, b in pairs) / max(len(pairs), 1)
+            counts = {}
+            for type_id in types.values():
+                counts[type_id] = counts.get(type_id, 0) + 1
+            baseline = sum(count * count for count in counts.values()) / len(types) ** 2
+            print(f'邻居同类型比例 {same:.1%}，随机配对 {baseline:.1%}')
+            if same < baseline * args.min_lift:
+                failures.append(f'同类型比例 {same:.1%} 不到随机配对的 {args.min_lift} 倍')
+
+            source = db.session.execute(
+                db.select(Activity).where(Activity.is_approved == True, Activity.status == 'active').limit(1)
+            ).scalar_one()
+            source_id, organizer_id = source.id, source.organizer_id
+            twin = Activity(title=source.title, description=source.description, tags=source.tags,
+                            start_time=source.start_time, end_time=source.end_time, organizer_id=organizer_id,
+                            activity_type_id=source.activity_type_id, status='active', review_status='approved',
+                            is_approved=True, max_participants=100, current_participants=0)
+            db.session.add(twin)
+            db.session.commit()
+            twin_id = twin.id
+            with Timer() as timer:
+                updated = similarity.update_activity(twin_id)
+            print(f"增量更新: {timer.elapsed * 1000:.1f} ms，邻居 {updated['neighbours']} 个，"
+                  f"更新其他活动 {updated['updated']} 个")
+
+            def neighbours_of(activity_id):
+                return db.session.scalars(
+                    db.select(ActivitySimilarity.similar_id).where(ActivitySimilarity.activity_id == activity_id)
+                ).all()
+
+            if source_id not in neighbours_of(twin_id):
+                failures.append('新活动的邻居中没有内容相同的活动')
+            if twin_id not in neighbours_of(source_id):
+                failures.append('内容相同的活动的列表中没有新活动')
+
+        client = login_client(app, organizer_id)
+        app.config['SIMILARITY_SHOWN'] = 0
+        baseline_count = int(client.get(f'/activity/{source_id}').headers['X-SQL-Count'])
+        app.config['SIMILARITY_SHOWN'] = 5
+        with Timer() as timer:
+            response = client.get(f'/activity/{source_id}')
+        count = int(response.headers['X-SQL-Count'])
+        print(f'详情页: {timer.elapsed * 1000:.1f} ms，SQL {count} 条')
+        if '相似活动' not in response.get_data(as_text=True):
+            failures.append('详情页没有显示相似活动')
+        if count - baseline_count > 1:
+            failures.append(f'相似活动用了 {count - baseline_count} 条 SQL')
+    finally:
+        os.remove(db_path)
+        shutil.rmtree(index_folder, ignore_errors=True)
+
+    for failure in failures:
+        print(f'失败: {failure}')
+    if failures:
+        sys.exit(1)
+    print('相似活动与同类型活动高度相关，增量更新生效，详情页只多一条 SQL')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""SSE 浸泡测试：保持数千个长连接，测量计数事件的扇出延迟
+
+用法：python -m benchmarks.sse_soak [--connections 2000] [--events 20] [--backend memory|spool]
+
+spool 模式下由另一个 EventBroker 实例发布事件，模拟另一个 worker 进程写入共享文件。
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import selectors
+import socket
+import tempfile
+import threading
+import time
+
+from benchmarks.common import make_app
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(hard, max(soft, needed))
+    if target > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+def open_stream(port, activity_ids):
+    sock = socket.create_connection(('127.0.0.1', port))
+    request = (
+        f'GET /events/activities?ids={",".join(map(str, activity_ids))} HTTP/1.1\r\n'
+        'Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'
+    )
+    sock.sendall(request.encode())
+    sock.setblocking(False)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSE 浸泡测试')
+    parser.add_argument('--connections', type=int, default=2000, help='同时保持的 SSE 连接数')
+    parser.add_argument('--events', type=int, default=20, help='发布的事件数')
+    parser.add_argument('--activities', type=int, default=10, help='连接分布到的活动数')
+    parser.add_argument('--backend', choices=['memory', 'spool'], default='memory')
+    parser.add_argument('--timeout', type=float, default=60.0, help='等待事件送达的超时秒数')
+    args = parser.parse_args()
+
+    spool_dir = tempfile.mkdtemp(prefix='sse_soak_')
+    os.environ['EVENT_BROKER_BACKEND'] = args.backend
+    os.environ['EVENT_SPOOL_PATH'] = os.path.join(spool_dir, 'events.spool')
+    fd_limit = raise_fd_limit(args.connections * 2 + 256)
+    if fd_limit < args.connections * 2 + 64:
+        print(f'文件描述符上限为 {fd_limit}，连接数可能无法全部建立')
+
+    app, db_path = make_app()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from werkzeug.serving import make_server
+    from extensions import event_broker
+    from utils.events import EventBroker, activity_channel
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    if args.backend == 'spool':
+        publisher = EventBroker()
+        with app.app_context():
+            publisher.init_app(app)
+    else:
+        publisher = event_broker
+
+    selector = selectors.DefaultSelector()
+    sockets = []
+    buffers = {}
+    received = {}
+    try:
+        start = time.perf_counter()
+        for i in range(args.connections):
+            activity_id = i % args.activities + 1
+            sock = open_stream(port, [activity_id])
+            sockets.append(sock)
+            buffers[sock] = b''
+            received[sock] = set()
+            selector.register(sock, selectors.EVENT_READ)
+        while event_broker.subscriber_count < args.connections and time.perf_counter() - start < args.timeout:
+            time.sleep(0.05)
+        connect_time = time.perf_counter() - start
+        print(f'已建立订阅: {event_broker.subscriber_count}/{args.connections}，耗时 {connect_time:.2f} s')
+
+        expected = args.connections * args.events
+        publish_times = {}
+        last_delivery = {}
+        state = {'delivered': 0}
+
+        def read_streams():
+            # 与发布并行读取，才能测到真实的扇出延迟
+            deadline = time.perf_counter() + args.timeout
+            while state['delivered'] < expected and time.perf_counter() < deadline:
+                for key, _ in selector.select(timeout=0.5):
+                    sock = key.fileobj
+                    try:
+                        data = sock.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        selector.unregister(sock)
+                        continue
+                    buffers[sock] += data
+                    *lines, buffers[sock] = buffers[sock].split(b'\n')
+                    now = time.perf_counter()
+                    for line in lines:
+                        if not line.startswith(b'data: '):
+                            continue
+                        seq = json.loads(line[6:])['seq']
+                        if seq not in received[sock]:
+                            received[sock].add(seq)
+                            state['delivered'] += 1
+                            last_delivery[seq] = now
+
+        reader = threading.Thread(target=read_streams)
+        reader.start()
+        # 每个事件发往所有活动频道，每个连接都应收到 args.events 条
+        for seq in range(args.events):
+            publish_times[seq] = time.perf_counter()
+            for activity_id in range(1, args.activities + 1):
+                publisher.publish(activity_channel(activity_id), {
+                    'activity_id': activity_id, 'current_participants': seq,
+                    'max_participants': 800, 'likes_count': seq, 'seq': seq
+                })
+            time.sleep(0.2)
+        reader.join()
+        delivered = state['delivered']
+
+        latencies = sorted(last_delivery[seq] - publish_times[seq] for seq in last_delivery)
+        print(f'后端: {args.backend}，连接数: {args.connections}，事件数: {args.events}')
+        print(f'送达: {delivered}/{expected}')
+        if latencies:
+            print(f'单个事件扇出到全部连接的耗时: 中位数 {latencies[len(latencies) // 2] * 1000:.1f} ms，'
+                  f'最大 {latencies[-1] * 1000:.1f} ms')
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.shutdown()
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""启动耗时基准：导入耗时（python -X importtime）、create_app 耗时、命令行启动耗时，以及新进程到第一个响应的时间
+
+用法：
+    python -m benchmarks.startup                     # 各测 5 次取中位数，超出预算时以退出码 1 结束
+    python -m benchmarks.startup --runs 10 --top 20  # 多测几次，列出更多最慢的模块
+    python -m benchmarks.startup --budget-ms 600     # 自定义“导入 + create_app”的预算
+
+每次测量都在新的 Python 进程里进行，数据库是临时 SQLite 文件：
+- 导入：解析 `python -X importtime -c "import app"` 的输出，app 这一行的累计耗时就是导入总耗时，
+  同时列出自身耗时最多的模块，方便找出新引入的重依赖
+- create_app：在子进程里计时 import app 和 create_app()
+- 命令行：`flask --app app --help` 的总耗时（每个 flask 命令都要先加载应用）
+- 新进程到第一个响应：启动一个 werkzeug 服务进程，轮询 --path 直到返回 200，相当于一个 worker 从 fork/exec 到能服务请求的时间
+
+预算有两条：“导入 + create_app” 的中位数不超过 --budget-ms；启动应用后不应加载 HEAVY_MODULES 中的任何模块
+（它们只在个别页面或命令里用到，应在函数内导入）。后一条与机器无关，前一条换机器后可能需要调整。
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ROOT_DIR, make_app
+
+DEFAULT_BUDGET_MS = 800
+HEAVY_MODULES = ('numpy', 'scipy', 'alembic', 'flask_migrate', 'wtforms', 'flask_wtf', 'email_validator',
+                 'PIL', 'qrcode', 'faker')
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+CREATE_APP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_ms': (created - imported) * 1000,
+                  'heavy': sorted(name for name in %r if name in sys.modules)}))
+"""
+
+SERVER_SCRIPT = """
+import os
+from werkzeug.serving import make_server
+from app import create_app
+make_server('127.0.0.1', int(os.environ['STARTUP_PORT']), create_app(), threaded=True).serve_forever()
+"""
+
+
+def _env(db_path):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{db_path}'
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def measure_importtime(env):
+    """返回 (导入总毫秒数, {模块: 自身毫秒数})"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    total, modules = None, {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        modules[name] = int(self_us) / 1000
+        if name == 'app':
+            total = int(cumulative_us) / 1000
+    return total, modules
+
+
+def measure_create_app(env):
+    result = subprocess.run([sys.executable, '-c', CREATE_APP_SCRIPT % (HEAVY_MODULES,)], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_cli(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', '--help'], cwd=ROOT_DIR, env=env,
+                   capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_response(env, path, timeout=30):
+    env = dict(env, STARTUP_PORT=str(_free_port()))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT], cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'服务进程提前退出：{process.stderr.read().decode()[-2000:]}')
+            connection = http.client.HTTPConnection('127.0.0.1', int(env['STARTUP_PORT']), timeout=5)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.005)
+            finally:
+                connection.close()
+        raise RuntimeError(f'{timeout} 秒内没有收到 {path} 的 200 响应')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时基准')
+    parser.add_argument('--runs', type=int, default=5, help='每项测量的次数，取中位数')
+    parser.add_argument('--top', type=int, default=10, help='列出自身导入耗时最多的前几个模块')
+    parser.add_argument('--path', default='/', help='新进程到第一个响应测量时请求的路径')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='导入 + create_app 的预算（毫秒）')
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(prefix='bench_startup_', suffix='.db')
+    os.close(fd)
+    os.remove(db_path)
+    try:
+        make_app(db_path)
+        env = _env(db_path)
+
+        imports, create, cli, first = [], [], [], []
+        self_times = {}
+        heavy = set()
+        for _ in range(args.runs):
+            total, modules = measure_importtime(env)
+            imports.append(total)
+            for name, ms in modules.items():
+                self_times.setdefault(name, []).append(ms)
+            timing = measure_create_app(env)
+            create.append(timing['import_ms'] + timing['create_ms'])
+            heavy.update(timing['heavy'])
+            cli.append(measure_cli(env))
+            first.append(measure_first_response(env, args.path))
+
+        median = statistics.median
+        print(f'{args.runs} 次测量的中位数，单位: 毫秒')
+        print(f'{"import app（-X importtime）":<36}{median(imports):>10.1f}')
+        print(f'{"import app + create_app()":<36}{median(create):>10.1f}')
+        print(f'{"flask --app app --help":<36}{median(cli):>10.1f}')
+        print(f'{"新进程到第一个响应 GET " + args.path:<36}{median(first):>10.1f}')
+        print(f'\n自身导入耗时最多的 {args.top} 个模块:')
+        slowest = sorted(((median(times), name) for name, times in self_times.items()), reverse=True)[:args.top]
+        for ms, name in slowest:
+            print(f'  {name:<50}{ms:>8.1f}')
+
+        failed = False
+        if median(create) > args.budget_ms:
+            print(f'\n超出预算：导入 + create_app 中位数 {median(create):.1f} 毫秒 > {args.budget_ms:.0f} 毫秒')
+            failed = True
+        if heavy:
+            print(f'\n启动时加载了重依赖：{", ".join(sorted(heavy))}，应改为在用到的函数内导入')
+            failed = True
+        if failed:
+            sys.exit(1)
+        print(f'\n在预算内（{args.budget_ms:.0f} 毫秒），启动时未加载重依赖')
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
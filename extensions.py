@@ -1,17 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
+from utils.fanout import NotificationFanout
+from utils.events import EventBroker
+from utils.checkin import CheckinWriter
+from utils.replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-migrate = Migrate()
 bcrypt = Bcrypt()
+notification_fanout = NotificationFanout()
+event_broker = EventBroker()
+checkin_writer = CheckinWriter()
 
 def init_app(app):
+    from flask_migrate import Migrate
+
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    Migrate(app, db)
     bcrypt.init_app(app)
     
     login_manager.login_view = 'auth.login'
@@ -1,3 +1,4 @@
+# 各视图在函数内导入表单类：Email 校验器在类定义时就会导入 email_validator，WTForms 整体约 60ms，不放进启动路径
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, DateTimeField, IntegerField, SelectField
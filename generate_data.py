@@ -0,0 +1,442 @@
+"""大规模测试数据生成器：为压测和扩展性测试造出十万级活动、百万级报名记录的数据集
+
+用法（写入 DATABASE_URL 指向的数据库，默认与应用相同）：
+    python generate_data.py --users 100000 --activities 100000 --participations 1000000 --workers 4
+    DATABASE_URL=sqlite:////tmp/load.db python generate_data.py --reset --rollup
+
+与 seed.py 逐条 ORM add 的做法不同：
+- 每一列都用 NumPy 向量化生成。用户和活动按 --chunk-size 切块，每块是一个任务，
+  随机数种子由 (--seed, 表, 块号) 派生，所以同样的参数（包括 --now）不论用几个进程，生成的内容都相同
+- 密码只做一次 bcrypt，所有普通用户共用这个哈希（默认密码 password123）
+- 用 Core insert + executemany 按 --batch-size 分批写入（SQLAlchemy 会合并成多行 VALUES），每块一个事务
+- 多进程并行：每个进程自建引擎，生成并写入自己的块。MySQL 上写入也是并行的；SQLite 同一时刻只有一个写者，
+  并行只能重叠生成的部分，写锁的等待交给 timeout
+- 用户和活动使用显式主键（接在现有最大 id 之后），报名、点赞和评论与所属活动在同一块里生成，
+  活动的 current_participants / likes_count / comments_count 直接由生成的行数得出；用户计数最后由 recount_user_counters() 一次重算
+
+分布：组织者、参与者、点赞和评论的用户都按 Zipf 分布偏向少数活跃用户（--user-skew），
+活动热度服从对数正态分布（--popularity-sigma），开始时间集中在北京时间 8-21 点。
+"""
+import argparse
+import functools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import multiprocessing
+import numpy as np
+from sqlalchemy import create_engine, event
+
+HOUR = 3600
+DAY = 24 * HOUR
+CST_OFFSET = 8 * HOUR
+
+DEPARTMENTS = ['计算机学院', '经济学院', '医学院', '文学院', '理学院', '工学院', '法学院', '艺术学院',
+               '外国语学院', '海洋学院', '材料学院', '汽车工程学院']
+INTERESTS = ['编程', '阅读', '音乐', '运动', '摄影', '旅行', '美食', '电影']
+ACTIVITY_TYPES = [
+    ('晚会', '各类文艺演出和娱乐活动', ['校园文艺晚会', '迎新晚会', '毕业晚会', '元旦晚会', '中秋晚会', '十佳歌手大赛', '舞蹈比赛']),
+    ('讲座', '学术报告和知识分享活动', ['学术讲座', '科研方法研讨会', '论文写作指导', '创新创业论坛', '人工智能前沿', '职业发展讲座']),
+    ('竞赛', '各类比赛和竞技活动', ['编程大赛', '数学建模比赛', '电子设计竞赛', '创业大赛', '演讲比赛', '辩论赛', '知识竞赛']),
+    ('体育', '体育运动和健身活动', ['校园篮球联赛', '足球友谊赛', '羽毛球公开赛', '乒乓球挑战赛', '校园马拉松', '排球联赛']),
+    ('其他', '其他类型的活动', ['社团招新', '志愿服务', '校友见面会', '开放日', '文化节', '美食节', '游园会']),
+]
+VENUES = [('体育馆', '校内体育馆', 500), ('图书馆报告厅', '图书馆附属报告厅', 200),
+          ('学生活动中心', '多功能学生活动场所', 300), ('操场', '学校室外操场', 1000), ('礼堂', '学校大型礼堂', 800)]
+DESCRIPTIONS = ['欢迎全校同学踊跃报名参加。', '活动由学生会主办，各学院协办。', '名额有限，先到先得。',
+                '请提前十分钟到场签到。', '现场设有抽奖环节。', '参与者可获得素质拓展学分。', '活动结束后将评选优秀作品。']
+COMMENTS = ['活动很棒，期待下次参与！', '组织得很好，收获很多。', '活动安排很合理，体验很好。',
+            '希望能多举办类似的活动。', '活动很有意义，感谢组织者。', '请问需要提前准备什么吗？']
+TAGS = ['学术', '文艺', '体育', '志愿', '创新', '交流', '比赛', '公益']
+CAPACITY_CHOICES = np.array([30, 50, 100, 200, 500])
+DURATION_HOURS = np.array([1, 2, 3, 4, 8])
+DURATION_WEIGHTS = np.array([0.25, 0.35, 0.2, 0.15, 0.05])
+# 北京时间 0-23 点作为开始时间的权重
+START_HOUR_WEIGHTS = np.array([0, 0, 0, 0, 0, 0, 0, 1, 4, 6, 6, 3, 1, 3, 6, 6, 5, 3, 2, 6, 6, 3, 1, 0], dtype=float)
+REVIEW_STATUSES = np.array(['pending', 'approved', 'rejected'])
+REVIEW_WEIGHTS = np.array([0.1, 0.85, 0.05])
+
+TABLE_KEYS = {'users': 1, 'activities': 2}
+
+
+def _rng(settings, table, chunk):
+    return np.random.default_rng([settings['seed'], TABLE_KEYS[table], chunk])
+
+
+def _choose(rng, options, size):
+    """从 options 里均匀取 size 个，返回对象数组"""
+    return np.asarray(options, dtype=object)[rng.integers(0, len(options), size=size)]
+
+
+def _datetimes(epoch_seconds):
+    """epoch 秒数组 -> 无时区的 UTC datetime 列表（库里统一存 UTC）"""
+    return np.asarray(epoch_seconds, dtype=np.int64).astype('datetime64[s]').astype(object).tolist()
+
+
+@functools.lru_cache(maxsize=4)
+def _zipf_table(size, skew, seed):
+    """前 k 名用户的累计权重和一个固定的随机排列（避免活跃用户全是 id 最小的那批）"""
+    cumulative = np.cumsum(np.arange(1, size + 1, dtype=float) ** -skew)
+    permutation = np.random.default_rng([seed, 0]).permutation(size)
+    return cumulative, permutation
+
+
+@functools.lru_cache(maxsize=2)
+def _user_pool(path):
+    return np.load(path, mmap_mode='r')
+
+
+def _pick_users(rng, settings, size):
+    """按 Zipf 分布抽 size 个用户 id"""
+    pool = _user_pool(settings['user_pool'])
+    cumulative, permutation = _zipf_table(len(pool), settings['user_skew'], settings['seed'])
+    ranks = np.searchsorted(cumulative, rng.random(size) * cumulative[-1])
+    return np.asarray(pool[permutation[np.minimum(ranks, len(pool) - 1)]], dtype=np.int64)
+
+
+def _between(rng, low, high):
+    """[low, high] 内均匀取整数秒，high < low 时取 low"""
+    return low + (rng.random(len(low)) * np.maximum(high - low, 0)).astype(np.int64)
+
+
+def _rows(columns):
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def generate_users(settings, chunk, first_id, count):
+    """生成 id 为 [first_id, first_id + count) 的用户行"""
+    rng = _rng(settings, 'users', chunk)
+    ids = np.arange(first_id, first_id + count)
+    names = [f'{settings["prefix"]}{user_id:07d}' for user_id in ids.tolist()]
+    interests = rng.random((count, len(INTERESTS))).argsort(axis=1)[:, :3]
+    created = settings['now'] - rng.integers(0, settings['days_back'] * DAY + 1, size=count)
+    return _rows({
+        'id': ids.tolist(),
+        'username': names,
+        'email': [f'{name}@stu.example.edu.cn' for name in names],
+        'password_hash': [settings['password_hash']] * count,
+        'department': _choose(rng, DEPARTMENTS, count).tolist(),
+        'interests': [','.join(INTERESTS[i] for i in row) for row in interests.tolist()],
+        'created_at': _datetimes(created),
+        'is_admin': [False] * count,
+        'is_reviewer': [False] * count,
+    })
+
+
+def generate_activities(settings, chunk, first_id, count):
+    """生成 id 为 [first_id, first_id + count) 的活动，以及它们的报名、点赞和评论，返回 {表名: 行列表}"""
+    rng = _rng(settings, 'activities', chunk)
+    now = settings['now']
+    ids = np.arange(first_id, first_id + count, dtype=np.int64)
+
+    # 开始日期均匀分布在 [now - days_back, now + days_ahead]，钟点按 START_HOUR_WEIGHTS，半点对齐
+    days = rng.integers(-settings['days_back'], settings['days_ahead'] + 1, size=count)
+    local_midnight = (now + CST_OFFSET) // DAY * DAY - CST_OFFSET
+    hours = rng.choice(24, size=count, p=START_HOUR_WEIGHTS / START_HOUR_WEIGHTS.sum())
+    start = local_midnight + days * DAY + hours * HOUR + rng.integers(0, 2, size=count) * 1800
+    end = start + rng.choice(DURATION_HOURS, size=count, p=DURATION_WEIGHTS) * HOUR
+    created = start - rng.integers(3 * DAY, 45 * DAY, size=count)
+    created = np.minimum(created, now)
+    lifecycle = np.where(now < start, 'upcoming', np.where(now <= end, 'ongoing', 'ended'))
+
+    type_index = rng.integers(0, len(settings['type_ids']), size=count)
+    venue_index = rng.integers(0, len(settings['venue_ids']), size=count)
+    capacity = np.minimum(rng.choice(CAPACITY_CHOICES, size=count), np.asarray(settings['venue_capacities'])[venue_index])
+    review = REVIEW_STATUSES[rng.choice(len(REVIEW_STATUSES), size=count, p=REVIEW_WEIGHTS)]
+    reviewed = review != 'pending'
+    organizers = _pick_users(rng, settings, count)
+
+    # 热度：均值为 1 的对数正态分布，未开始的活动报名还没满
+    sigma = settings['popularity_sigma']
+    popularity = rng.lognormal(-sigma ** 2 / 2, sigma, size=count)
+    fill = np.where(lifecycle == 'upcoming', 0.6, 1.0)
+
+    def children(total, scale, cap=None):
+        """按热度给每个活动分配行数，返回 (活动下标, 用户 id)，同一活动内用户去重"""
+        per_activity = rng.poisson(total / settings['activities'] * popularity * scale)
+        if cap is not None:
+            per_activity = np.minimum(per_activity, cap)
+        index = np.repeat(np.arange(count), per_activity)
+        users = _pick_users(rng, settings, len(index))
+        keep = users != organizers[index]
+        index, users = index[keep], users[keep]
+        _, first = np.unique(index * (int(users.max(initial=0)) + 1) + users, return_index=True)
+        first.sort()
+        return index[first], users[first]
+
+    join_index, join_users = children(settings['participations'], fill, capacity)
+    like_index, like_users = children(settings['likes'], 1.0)
+    participants = np.bincount(join_index, minlength=count)
+    likes = np.bincount(like_index, minlength=count)
+
+    # 评论允许同一用户多条
+    comment_counts = rng.poisson(settings['comments'] / settings['activities'] * popularity)
+    comment_index = np.repeat(np.arange(count), comment_counts)
+    comment_users = _pick_users(rng, settings, len(comment_index))
+
+    templates = dict(settings['titles'])
+    title_picks = rng.integers(0, 1 << 30, size=count).tolist()
+    numbers = rng.integers(1, 100, size=count).tolist()
+    titles = [f'{templates[settings["type_names"][t]][pick % len(templates[settings["type_names"][t]])]} 第{number}期'
+              for t, pick, number in zip(type_index.tolist(), title_picks, numbers)]
+    approved = review == 'approved'
+    reviewer_ids = np.asarray(settings['reviewer_ids'], dtype=object)[rng.integers(0, len(settings['reviewer_ids']), size=count)]
+    review_time = np.array(_datetimes(_between(rng, created, np.minimum(start, now))), dtype=object)
+
+    tables = {'activity': _rows({
+        'id': ids.tolist(),
+        'title': titles,
+        'description': [''.join(parts) for parts in _choose(rng, DESCRIPTIONS, (count, 2)).tolist()],
+        'start_time': _datetimes(start),
+        'end_time': _datetimes(end),
+        'organizer_id': organizers.tolist(),
+        'reviewer_id': np.where(reviewed, reviewer_ids, None).tolist(),
+        'max_participants': capacity.tolist(),
+        'current_participants': participants.tolist(),
+        'tags': [','.join(parts) for parts in _choose(rng, TAGS, (count, 2)).tolist()],
+        'status': np.where(approved, 'active', review).tolist(),
+        'lifecycle_status': lifecycle.tolist(),
+        'review_status': review.tolist(),
+        'review_comment': np.where(review == 'rejected', '活动内容需要调整，建议修改后重新提交。', None).tolist(),
+        'review_time': np.where(reviewed, review_time, None).tolist(),
+        'poster_url': [None] * count,
+        'likes_count': likes.tolist(),
+        'comments_count': comment_counts.tolist(),
+        'created_at': _datetimes(created),
+        'is_approved': approved.tolist(),
+        'venue_id': np.asarray(settings['venue_ids'])[venue_index].tolist(),
+        'activity_type_id': np.asarray(settings['type_ids'])[type_index].tolist(),
+    })}
+
+    # 报名时间在活动创建和开始之间，点赞和评论在创建之后
+    tables['participation'] = _rows({
+        'user_id': join_users.tolist(),
+        'activity_id': ids[join_index].tolist(),
+        'status': ['registered'] * len(join_index),
+        'registered_at': _datetimes(_between(rng, created[join_index], np.minimum(start[join_index], now))),
+    })
+    tables['likes'] = _rows({
+        'user_id': like_users.tolist(),
+        'activity_id': ids[like_index].tolist(),
+        'created_at': _datetimes(_between(rng, created[like_index], np.full(len(like_index), now))),
+    })
+    tables['comment'] = _rows({
+        'content': _choose(rng, COMMENTS, len(comment_index)).tolist(),
+        'user_id': comment_users.tolist(),
+        'activity_id': ids[comment_index].tolist(),
+        'created_at': _datetimes(_between(rng, created[comment_index], np.full(len(comment_index), now))),
+    })
+    return tables
+
+
+_engines = {}
+
+
+def _engine(url):
+    """每个进程一个引擎；SQLite 写锁可能要等其他进程提交，给足 timeout"""
+    if url not in _engines:
+        if url.startswith('sqlite'):
+            engine = create_engine(url, connect_args={'timeout': 600})
+
+            @event.listens_for(engine, 'connect')
+            def _sqlite_pragmas(dbapi_connection, connection_record):
+                # 只对本进程的连接生效：生成的是可以重来的测试数据，不需要每次提交都刷盘
+                dbapi_connection.execute('PRAGMA synchronous=OFF')
+        else:
+            engine = create_engine(url, pool_pre_ping=True)
+        _engines[url] = engine
+    return _engines[url]
+
+
+def _insert(connection, table, rows, batch_size):
+    for offset in range(0, len(rows), batch_size):
+        connection.execute(table.insert(), rows[offset:offset + batch_size])
+
+
+def run_chunk(task):
+    """进程池任务：生成一块数据并在一个事务里写入，返回 {表名: 行数}"""
+    from models import User, Activity, Participation, Like, Comment
+
+    kind, settings, chunk, first_id, count = task
+    if kind == 'users':
+        tables = {'user': generate_users(settings, chunk, first_id, count)}
+    else:
+        tables = generate_activities(settings, chunk, first_id, count)
+    models = {'user': User, 'activity': Activity, 'participation': Participation, 'likes': Like, 'comment': Comment}
+    with _engine(settings['url']).begin() as connection:
+        for name, rows in tables.items():
+            _insert(connection, models[name].__table__, rows, settings['batch_size'])
+    return {name: len(rows) for name, rows in tables.items()}
+
+
+def _run(tasks, workers):
+    """依次或并行执行任务，累计写入的行数"""
+    totals = {}
+    if workers > 1 and len(tasks) > 1:
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(run_chunk, tasks))
+    else:
+        results = map(run_chunk, tasks)
+    for result in results:
+        for name, rows in result.items():
+            totals[name] = totals.get(name, 0) + rows
+    return totals
+
+
+def _chunks(kind, settings, first_id, total, chunk_size):
+    return [(kind, settings, index, first_id + start, min(chunk_size, total - start))
+            for index, start in enumerate(range(0, total, chunk_size))]
+
+
+def _ensure_reference_data(db, password_hashes):
+    """管理员、审核员、活动类型和场地不存在时创建，返回 (审核员 id, 类型, 场地)"""
+    from models import User, ActivityType, Venue
+
+    now = datetime.now(timezone.utc)
+    if not User.query.filter_by(username='admin').first():
+        db.session.add(User(username='admin', email='admin@example.com', department='计算机学院', is_admin=True,
+                            password_hash=password_hashes['admin'], created_at=now))
+    for i, department in enumerate(['学生处', '团委', '教务处'], start=1):
+        if not User.query.filter_by(username=f'reviewer{i}').first():
+            db.session.add(User(username=f'reviewer{i}', email=f'reviewer{i}@example.com', department=department,
+                                is_reviewer=True, password_hash=password_hashes['reviewer'], created_at=now))
+    for name, description, _ in ACTIVITY_TYPES:
+        if not ActivityType.query.filter_by(name=name).first():
+            db.session.add(ActivityType(name=name, description=description))
+    for name, address, capacity in VENUES:
+        if not Venue.query.filter_by(name=name).first():
+            db.session.add(Venue(name=name, address=address, capacity=capacity))
+    db.session.commit()
+
+    reviewers = db.session.scalars(db.select(User.id).where(User.is_reviewer.is_(True)).order_by(User.id)).all()
+    types = db.session.execute(db.select(ActivityType.id, ActivityType.name).order_by(ActivityType.id)).all()
+    venues = db.session.execute(db.select(Venue.id, Venue.capacity).order_by(Venue.id)).all()
+    return reviewers, types, venues
+
+
+def _reset(db):
+    """按外键依赖的逆序清空全部业务表"""
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+DEFAULTS = {
+    'users': 10000, 'activities': 10000, 'participations': 100000, 'likes': 50000, 'comments': 20000,
+    'days_back': 365, 'days_ahead': 60, 'user_skew': 0.5, 'popularity_sigma': 1.0, 'seed': 42, 'now': None,
+    'chunk_size': 5000, 'batch_size': 5000, 'workers': 1, 'password': 'password123', 'prefix': 'load',
+    'reset': False, 'rollup': False,
+}
+
+
+def generate(app, log=print, **options):
+    """在 app 配置的数据库里生成数据，选项同命令行参数（见 DEFAULTS），返回 {表名: 写入行数}
+
+    基准测试脚本也用它在临时数据库里准备数据。
+    """
+    from extensions import db, bcrypt
+    from models import User, Activity
+    from utils.counters import recount_user_counters
+
+    args = argparse.Namespace(**{**DEFAULTS, **options})
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        if args.reset:
+            log('清空现有数据...')
+            _reset(db)
+        # bcrypt 很慢，每种密码只算一次
+        password_hashes = {key: bcrypt.generate_password_hash(password).decode('utf-8')
+                           for key, password in (('user', args.password), ('admin', 'admin123'), ('reviewer', 'reviewer123'))}
+        reviewer_ids, types, venues = _ensure_reference_data(db, password_hashes)
+        first_user_id = (db.session.scalar(db.select(db.func.max(User.id))) or 0) + 1
+        first_activity_id = (db.session.scalar(db.select(db.func.max(Activity.id))) or 0) + 1
+        url = db.engine.url.render_as_string(hide_password=False)
+        # 子进程自建连接，不能继承父进程连接池里的连接
+        db.engine.dispose()
+
+    settings = {
+        'url': url, 'seed': args.seed, 'now': int(args.now.replace(tzinfo=timezone.utc).timestamp()) if args.now else int(time.time()), 'batch_size': args.batch_size,
+        'prefix': args.prefix, 'password_hash': password_hashes['user'],
+        'days_back': args.days_back, 'days_ahead': args.days_ahead,
+        'user_skew': args.user_skew, 'popularity_sigma': args.popularity_sigma,
+        'activities': max(args.activities, 1), 'participations': args.participations,
+        'likes': args.likes, 'comments': args.comments,
+        'reviewer_ids': reviewer_ids, 'type_ids': [row.id for row in types], 'type_names': [row.name for row in types],
+        'titles': [(name, templates) for name, _, templates in ACTIVITY_TYPES],
+        'venue_ids': [row.id for row in venues], 'venue_capacities': [row.capacity or 1000 for row in venues],
+    }
+    # 类型名不在模板里（库里已有自定义类型）时按“其他”生成标题
+    known = dict(settings['titles'])
+    settings['type_names'] = [name if name in known else '其他' for name in settings['type_names']]
+
+    with tempfile.TemporaryDirectory(prefix='datagen_') as workdir:
+        phase = time.perf_counter()
+        totals = _run(_chunks('users', settings, first_user_id, args.users, args.chunk_size), args.workers)
+        log(f'用户: {totals.get("user", 0)} 行，{time.perf_counter() - phase:.1f} 秒')
+
+        # 参与者从库里的全部普通用户中抽取，id 列表写成文件给子进程按需映射
+        with app.app_context():
+            pool = np.array(db.session.scalars(
+                db.select(User.id).where(User.is_admin.is_(False), User.is_reviewer.is_(False)).order_by(User.id)
+            ).all(), dtype=np.int64)
+            db.engine.dispose()
+        if not len(pool):
+            raise ValueError('没有普通用户可以作为组织者和参与者，请指定 users')
+        settings['user_pool'] = os.path.join(workdir, 'user_ids.npy')
+        np.save(settings['user_pool'], pool)
+
+        phase = time.perf_counter()
+        totals.update(_run(_chunks('activities', settings, first_activity_id, args.activities, args.chunk_size), args.workers))
+        log(f'活动: {totals.get("activity", 0)} 行，报名: {totals.get("participation", 0)} 行，'
+              f'点赞: {totals.get("likes", 0)} 行，评论: {totals.get("comment", 0)} 行，'
+              f'{time.perf_counter() - phase:.1f} 秒')
+
+    with app.app_context():
+        phase = time.perf_counter()
+        recount_user_counters()
+        log(f'重算用户计数: {time.perf_counter() - phase:.1f} 秒')
+        if args.rollup:
+            from utils.analytics import backfill, today
+
+            phase = time.perf_counter()
+            rows = backfill(today() - timedelta(days=args.days_back + 1))
+            log(f'重算每日汇总 {rows} 行: {time.perf_counter() - phase:.1f} 秒')
+    log(f'完成，总耗时 {time.perf_counter() - started:.1f} 秒')
+    return totals
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成大规模测试数据')
+    parser.add_argument('--users', type=int, default=DEFAULTS['users'], help='新增普通用户数')
+    parser.add_argument('--activities', type=int, default=DEFAULTS['activities'], help='新增活动数')
+    parser.add_argument('--participations', type=int, default=DEFAULTS['participations'], help='报名记录目标总数（受活动人数上限约束，实际略少）')
+    parser.add_argument('--likes', type=int, default=DEFAULTS['likes'], help='点赞目标总数（同一用户对同一活动去重后略少）')
+    parser.add_argument('--comments', type=int, default=DEFAULTS['comments'], help='评论目标总数')
+    parser.add_argument('--days-back', type=int, default=DEFAULTS['days_back'], help='活动开始时间最早在多少天前')
+    parser.add_argument('--days-ahead', type=int, default=DEFAULTS['days_ahead'], help='活动开始时间最晚在多少天后')
+    parser.add_argument('--user-skew', type=float, default=DEFAULTS['user_skew'], help='用户活跃度的 Zipf 指数，越大越集中在少数用户')
+    parser.add_argument('--popularity-sigma', type=float, default=DEFAULTS['popularity_sigma'], help='活动热度对数正态分布的 sigma')
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'], help='随机数种子')
+    parser.add_argument('--now', type=datetime.fromisoformat, help='作为“当前时间”的 UTC 时间（如 2026-10-01T12:00），固定后多次生成的数据完全相同')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULTS['chunk_size'], help='每个任务生成的用户/活动数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULTS['batch_size'], help='每次 executemany 的行数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数')
+    parser.add_argument('--password', default=DEFAULTS['password'], help='普通用户的统一密码')
+    parser.add_argument('--prefix', default=DEFAULTS['prefix'], help='生成的用户名前缀，多次追加生成时需要不同的前缀')
+    parser.add_argument('--reset', action='store_true', help='先清空所有业务表')
+    parser.add_argument('--rollup', action='store_true', help='生成后重算运营统计的每日汇总')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    generate(create_app(), **vars(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,91 @@ from datetime import datetime, timezone, timedelta
 from flask_login import UserMixin
 from extensions import db, bcrypt
 
+CST = timezone(timedelta(hours=8))
+
+# 活动生命周期状态及其显示文本
+LIFECYCLE_LABELS = {
+    'upcoming': '报名中',
+    'ongoing': '进行中',
+    'ended': '已结束'
+}
+
+def to_cst(value):
+    """把数据库中的时间（无时区时视为UTC）转换为北京时间"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(CST)
+
+def compute_lifecycle(start_time, end_time, now=None):
+    """根据开始和结束时间计算活动生命周期状态"""
+    now = now or datetime.now(timezone.utc)
+    start_time = start_time.replace(tzinfo=timezone.utc) if start_time and start_time.tzinfo is None else start_time
+    end_time = end_time.replace(tzinfo=timezone.utc) if end_time and end_time.tzinfo is None else end_time
+    if start_time and now < start_time:
+        return 'upcoming'
+    if start_time and end_time and now <= end_time:
+        return 'ongoing'
+    return 'ended'
+
+# 活动显示相关的属性，热表 Activity 和归档表 ArchivedActivity 共用
+class ActivityDisplayMixin:
+    is_archived = False
+
+    def _cst(self, name):
+        # 同一次渲染中会多次访问，按原始值缓存转换结果
+        raw = getattr(self, name)
+        cache = self.__dict__.setdefault('_cst_cache', {})
+        cached = cache.get(name)
+        if cached is None or cached[0] != raw:
+            cached = cache[name] = (raw, to_cst(raw))
+        return cached[1]
+
+    @property
+    def start_time_cst(self):
+        return self._cst('start_time')
+
+    @property
+    def end_time_cst(self):
+        return self._cst('end_time')
+
+    @property
+    def created_at_cst(self):
+        return self._cst('created_at')
+
+    @property
+    def current_status(self):
+        # 仅用于显示：优先读取由调度器维护的 lifecycle_status，旧数据为空时再按时间计算；
+        # 报名等写操作按时间实时判断（compute_lifecycle），不依赖后台任务是否及时推进
+        lifecycle = self.lifecycle_status or compute_lifecycle(self.start_time, self.end_time)
+        return LIFECYCLE_LABELS[lifecycle]
+
 # 用户模型
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    department = db.Column(db.String(50))
+    department = db.Column(db.String(50), index=True)
     interests = db.Column(db.String(200))
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
     is_admin = db.Column(db.Boolean, default=False)
     is_reviewer = db.Column(db.Boolean, default=False)
-    activities = db.relationship('Activity', backref='organizer', lazy=True, foreign_keys='Activity.organizer_id')
-    reviewed_activities = db.relationship('Activity', backref='reviewer', lazy=True, foreign_keys='Activity.reviewer_id')
-    participations = db.relationship('Participation', backref='user', lazy=True)
-    likes = db.relationship('Like', backref='user', lazy=True)
+    # 个人中心的统计数，由发布/报名/点赞/评论等写操作在同一事务中增减，见 utils/counters.py
+    organized_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    joined_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    likes_given_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 软删除时间：非空的用户立即从所有查询中隐藏、无法登录，由 utils.purge 的后台任务分块清理后真正删除
+    deleted_at = db.Column(db.DateTime(timezone=True), index=True)
+    # 子表外键由数据库 ON DELETE 处理，passive_deletes 避免删除前把整个集合加载到内存
+    activities = db.relationship('Activity', backref='organizer', lazy=True, foreign_keys='Activity.organizer_id',
+                                 passive_deletes=True)
+    reviewed_activities = db.relationship('Activity', backref='reviewer', lazy=True, foreign_keys='Activity.reviewer_id',
+                                          passive_deletes=True)
+    participations = db.relationship('Participation', backref='user', lazy=True, passive_deletes=True)
+    likes = db.relationship('Like', backref='user', lazy=True, passive_deletes=True)
 
     def set_password(self, password):
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
@@ -35,78 +105,60 @@ class ActivityType(db.Model):
         return f'<ActivityType {self.name}>'
 
 # 活动模型
-class Activity(db.Model):
+class Activity(ActivityDisplayMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
     location = db.Column(db.String(100))
-    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    reviewer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    reviewer_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
     max_participants = db.Column(db.Integer)
     current_participants = db.Column(db.Integer, default=0)
     tags = db.Column(db.String(200))
     status = db.Column(db.String(20), default='pending')
+    lifecycle_status = db.Column(db.String(20), default='upcoming', index=True) # upcoming, ongoing, ended，由调度器在开始/结束时间点批量更新
     review_status = db.Column(db.String(20), default='pending')
     review_comment = db.Column(db.Text)
     review_time = db.Column(db.DateTime(timezone=True))
     poster_url = db.Column(db.String(200))
     likes_count = db.Column(db.Integer, default=0)
+    # 评论数，发表评论时在同一事务中加一；与报名数、点赞数一样由 flask counters reconcile 定期校正，见 utils/counters.py
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
     is_approved = db.Column(db.Boolean, default=False)
-    comments = db.relationship('Comment', backref='activity', lazy=True)
+    # 软删除时间：非空的活动立即从所有查询中隐藏，报名、评论、点赞和通知由 utils.purge 的后台任务分块删除
+    deleted_at = db.Column(db.DateTime(timezone=True), index=True)
+    comments = db.relationship('Comment', backref='activity', lazy=True, passive_deletes=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'))
     activity_type_id = db.Column(db.Integer, db.ForeignKey('activity_type.id'))
-    likes = db.relationship('Like', backref='activity', lazy=True, cascade="all, delete-orphan")
+    likes = db.relationship('Like', backref='activity', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
-    @property
-    def start_time_cst(self):
-        cst = timezone(timedelta(hours=8))
-        start_time_utc = self.start_time.replace(tzinfo=timezone.utc) if self.start_time and self.start_time.tzinfo is None else self.start_time
-        return start_time_utc.astimezone(cst) if start_time_utc else None
-
-    @property
-    def end_time_cst(self):
-        cst = timezone(timedelta(hours=8))
-        end_time_utc = self.end_time.replace(tzinfo=timezone.utc) if self.end_time and self.end_time.tzinfo is None else self.end_time
-        return end_time_utc.astimezone(cst) if end_time_utc else None
-
-    @property
-    def created_at_cst(self):
-        cst = timezone(timedelta(hours=8))
-        created_at_utc = self.created_at.replace(tzinfo=timezone.utc) if self.created_at and self.created_at.tzinfo is None else self.created_at
-        return created_at_utc.astimezone(cst) if created_at_utc else None
-
-    @property
-    def current_status(self):
-        cst = timezone(timedelta(hours=8))
-        now_cst = datetime.now(cst)
-
-        if self.start_time_cst and now_cst < self.start_time_cst:
-            return '报名中'
-        elif self.start_time_cst and self.end_time_cst and self.start_time_cst <= now_cst <= self.end_time_cst:
-            return '进行中'
-        else:
-            return '已结束'
+    # 个人中心“我发起的活动”按 (organizer_id, start_time) 分页
+    __table_args__ = (db.Index('ix_activity_organizer_start', 'organizer_id', 'start_time'),)
 
 # 活动参与记录
 class Participation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'))
-    status = db.Column(db.String(20), default='registered')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), index=True)
+    status = db.Column(db.String(20), default='registered') # registered, checked_in
     registered_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
-    activity = db.relationship('Activity', backref='participations')
+    checked_in_at = db.Column(db.DateTime(timezone=True)) # 现场扫码签到的时间，由 utils.checkin 批量写入
+    activity = db.relationship('Activity', backref=db.backref('participations', passive_deletes=True))
+
+    # 个人中心“我参与的活动”按 (user_id, registered_at) 分页
+    __table_args__ = (db.Index('ix_participation_user_registered', 'user_id', 'registered_at'),)
 
 # 评论模型
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), index=True)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
-    user = db.relationship('User', backref='comments')
+    user = db.relationship('User', backref=db.backref('comments', passive_deletes=True))
 
 # 场地模型
 class Venue(db.Model):
@@ -124,8 +176,8 @@ class Venue(db.Model):
 class Like(db.Model):
     __tablename__ = 'likes'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False, index=True)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
 
     # 组合唯一索引，确保一个用户只能给一个活动点赞一次
@@ -134,15 +186,165 @@ class Like(db.Model):
 # 通知模型
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False)
-    notification_type = db.Column(db.String(50), nullable=False, default='general') # 例如：activity_review, participation, comment
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=True) # 活动取消通知中为空
+    notification_type = db.Column(db.String(50), nullable=False, default='general') # 例如：activity_review, activity_updated, activity_cancelled
     activity_title = db.Column(db.String(200))
     review_status = db.Column(db.String(20)) # approved, rejected
     review_comment = db.Column(db.Text)
+    detail = db.Column(db.Text) # 活动变更说明
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
     
     # 关系
-    user = db.relationship('User', backref='notifications')
-    activity = db.relationship('Activity', backref='notifications', lazy=True) 
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('notifications', passive_deletes=True))
+    activity = db.relationship('Activity', backref=db.backref('notifications', passive_deletes=True), lazy=True)
+
+# 相似活动：每个活动按内容相似度排好的前 SIMILARITY_TOP_K 个邻居，由 utils.similarity 批量重建，创建/编辑活动后增量更新。
+# 详情页按主键 (activity_id, rank) 一次取出
+class ActivitySimilarity(db.Model):
+    __tablename__ = 'activity_similarity'
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    similar_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+# 后台任务模型
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text) # JSON 格式的任务参数
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, succeeded, failed
+    priority = db.Column(db.Integer, nullable=False, default=0) # 数值越大越先执行
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False) # 最早执行时间，用于延迟任务和重试退避
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime(timezone=True))
+    progress = db.Column(db.Integer, nullable=False, default=0) # 0-100
+    result = db.Column(db.Text) # JSON 格式的执行结果
+    last_error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL')) # 提交任务的用户
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    # 工作进程按 (status, run_at) 取到期任务
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+# 归档表：结束超过 ARCHIVE_AFTER_DAYS 天的活动及其参与、评论、点赞、通知由 utils.archive 分批迁移到这里，
+# 保留原主键，列与热表一致，另加 archived_at
+class ArchivedActivity(ActivityDisplayMixin, db.Model):
+    __tablename__ = 'activity_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    location = db.Column(db.String(100))
+    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)
+    reviewer_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)
+    max_participants = db.Column(db.Integer)
+    current_participants = db.Column(db.Integer, default=0)
+    tags = db.Column(db.String(200))
+    status = db.Column(db.String(20))
+    lifecycle_status = db.Column(db.String(20))
+    review_status = db.Column(db.String(20))
+    review_comment = db.Column(db.Text)
+    review_time = db.Column(db.DateTime(timezone=True))
+    poster_url = db.Column(db.String(200))
+    likes_count = db.Column(db.Integer, default=0)
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime(timezone=True))
+    is_approved = db.Column(db.Boolean, default=False)
+    deleted_at = db.Column(db.DateTime(timezone=True))
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='SET NULL'))
+    activity_type_id = db.Column(db.Integer, db.ForeignKey('activity_type.id', ondelete='SET NULL'))
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    organizer = db.relationship('User', foreign_keys=[organizer_id])
+    reviewer = db.relationship('User', foreign_keys=[reviewer_id])
+    venue = db.relationship('Venue')
+    activity_type = db.relationship('ActivityType')
+    participations = db.relationship('ArchivedParticipation', backref='activity', lazy=True)
+    comments = db.relationship('ArchivedComment', backref='activity', lazy=True)
+    likes = db.relationship('ArchivedLike', backref='activity', lazy=True)
+
+    is_archived = True
+
+    def __repr__(self):
+        return f'<ArchivedActivity {self.id}>'
+
+class ArchivedParticipation(db.Model):
+    __tablename__ = 'participation_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity_archive.id', ondelete='CASCADE'), index=True)
+    status = db.Column(db.String(20))
+    registered_at = db.Column(db.DateTime(timezone=True))
+    checked_in_at = db.Column(db.DateTime(timezone=True))
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    user = db.relationship('User')
+
+class ArchivedComment(db.Model):
+    __tablename__ = 'comment_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity_archive.id', ondelete='CASCADE'), index=True)
+    created_at = db.Column(db.DateTime(timezone=True))
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    user = db.relationship('User')
+
+class ArchivedLike(db.Model):
+    __tablename__ = 'likes_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity_archive.id', ondelete='CASCADE'), index=True)
+    created_at = db.Column(db.DateTime(timezone=True))
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+class ArchivedNotification(db.Model):
+    __tablename__ = 'notification_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity_archive.id', ondelete='CASCADE'))
+    notification_type = db.Column(db.String(50), nullable=False)
+    activity_title = db.Column(db.String(200))
+    review_status = db.Column(db.String(20))
+    review_comment = db.Column(db.Text)
+    detail = db.Column(db.Text)
+    is_read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime(timezone=True))
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+# 统计汇总表：按 日期(北京时间) × 活动类型 × 场地 × 报名者院系 汇总报名、点赞、评论数，由 utils.analytics 维护。
+# 维度列不允许为空，未设置的类型/场地记为 0，未填写的院系记为空字符串，保证唯一键能用于 upsert
+class DailyActivityStat(db.Model):
+    __tablename__ = 'daily_activity_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    activity_type_id = db.Column(db.Integer, nullable=False, default=0)
+    venue_id = db.Column(db.Integer, nullable=False, default=0)
+    department = db.Column(db.String(50), nullable=False, default='')
+    joins = db.Column(db.Integer, nullable=False, default=0) # 当天新增且仍有效的报名
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    comments = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'activity_type_id', 'venue_id', 'department', name='uq_daily_activity_stats_key'),
+    )
+
+# 批量汇总任务的水位线：name 对应一个汇总表，value 之前的数据已经汇总
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermark'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime(timezone=True), nullable=False)
+
+# 副本延迟检测的心跳：只有一行，web 进程定期在主库更新 beat_at，再到各副本读回，差值即复制延迟（见 utils.replicas）
+class ReplicaHeartbeat(db.Model):
+    __tablename__ = 'replica_heartbeat'
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime(timezone=True), nullable=False)
@@ -1,13 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
+from collections import Counter
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, send_file
 from flask_login import login_required, current_user
-from models import Activity, User, Venue, ActivityType
-from forms import VenueForm, ActivityTypeForm
+from models import Activity, User, Venue, ActivityType, to_cst
 from extensions import db
+from utils.analytics import dashboard_data
+from utils.utilization import venue_utilization, invalidate_venue
+from utils.ical import invalidate_feeds, feed_url
+from utils.users import UserFilter, ROLES, ROLE_LABELS, search_users, bulk_set_role, bulk_delete_users
+from utils.purge import schedule_purge
+from utils.profiling import SUFFIXES, list_profiles, get_profile, summarize
 import random
 import string
 
 admin_bp = Blueprint('admin', __name__)
 
+USERS_PER_PAGE = 50
+
 def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin:
@@ -20,18 +30,53 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    return render_template('admin_dashboard.html')
+    days = request.args.get('days', type=int)
+    if days not in (7, 30, 90, 365):
+        days = None
+    return render_template('admin_dashboard.html', stats=dashboard_data(days))
 
 @admin_bp.route('/users')
 @login_required
 @admin_required
 def users():
-    search_query = request.args.get('search', '')
-    query = User.query
-    if search_query:
-        query = query.filter(User.username.ilike(f'%{search_query}%'))
-    users = query.all()
-    return render_template('admin_users.html', users=users, search_query=search_query)
+    user_filter = UserFilter.from_args(request.args)
+    pagination = search_users(user_filter, request.args.get('page', 1, type=int), USERS_PER_PAGE)
+    return render_template('admin_users.html', users=pagination.items, pagination=pagination,
+                           user_filter=user_filter, search_query=user_filter.search)
+
+@admin_bp.route('/users/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_users():
+    """批量设置角色或删除：scope=selected 作用于勾选的用户，scope=filtered 作用于当前筛选条件下的全部用户"""
+    user_filter = UserFilter.from_args(request.form)
+    action = request.form.get('action')
+    if action != 'delete' and action not in ROLES:
+        flash('未知的批量操作', 'warning')
+        return redirect(url_for('admin.users', **user_filter.as_args()))
+
+    if request.form.get('scope') == 'filtered':
+        criteria = user_filter.conditions()
+    else:
+        user_ids = request.form.getlist('user_ids', type=int)
+        if not user_ids:
+            flash('请先选择用户', 'warning')
+            return redirect(url_for('admin.users', **user_filter.as_args()))
+        criteria = [User.id.in_(user_ids)]
+    # 不能修改或删除自己
+    criteria.append(User.id != current_user.id)
+
+    if action == 'delete':
+        count = bulk_delete_users(criteria)
+        message = f'已删除 {count} 个用户（管理员不会被删除）'
+    else:
+        count = bulk_set_role(criteria, action)
+        message = f'已将 {count} 个用户设为{ROLE_LABELS[action]}（管理员不会被修改）'
+    db.session.commit()
+    if action == 'delete' and count:
+        schedule_purge()
+    flash(message, 'success')
+    return redirect(url_for('admin.users', **user_filter.as_args()))
 
 @admin_bp.route('/edit_user_permissions/<int:user_id>', methods=['POST'])
 @login_required
@@ -58,17 +103,57 @@ def edit_user_permissions(user_id):
     flash(f'用户 {user.username} 的权限已更新', 'success')
     return redirect(url_for('admin.users'))
 
+@admin_bp.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    entries = list_profiles()
+    endpoints = sorted(Counter(entry['endpoint'] for entry in entries).items())
+    selected = request.args.get('view')
+    if selected:
+        entries = [entry for entry in entries if entry['endpoint'] == selected]
+    for entry in entries:
+        entry['created_at_cst'] = to_cst(datetime.fromisoformat(entry['created_at'])).strftime('%m-%d %H:%M:%S')
+    return render_template('admin_profiles.html', profiles=entries, endpoints=endpoints, selected=selected)
+
+@admin_bp.route('/profiles/<profile_id>')
+@login_required
+@admin_required
+def profile_detail(profile_id):
+    meta, path = get_profile(profile_id)
+    if meta is None:
+        abort(404)
+    meta['created_at_cst'] = to_cst(datetime.fromisoformat(meta['created_at'])).strftime('%Y-%m-%d %H:%M:%S')
+    return render_template('admin_profile_detail.html', meta=meta, summary=summarize(meta, path))
+
+@admin_bp.route('/profiles/<profile_id>/download')
+@login_required
+@admin_required
+def download_profile(profile_id):
+    meta, path = get_profile(profile_id)
+    if meta is None:
+        abort(404)
+    return send_file(path, as_attachment=True,
+                     download_name=f"{meta['endpoint']}-{profile_id}{SUFFIXES[meta['mode']]}")
+
 @admin_bp.route('/venues')
 @login_required
 @admin_required
 def venues():
     venues = Venue.query.all()
-    return render_template('admin_venues.html', venues=venues)
+    utilization = {venue.id: venue_utilization(venue) for venue in venues}
+    selected_id = request.args.get('venue_id', type=int)
+    selected = next((venue for venue in venues if venue.id == selected_id), venues[0] if venues else None)
+    calendar_urls = {venue.id: feed_url('venue', venue.id) for venue in venues}
+    return render_template('admin_venues.html', venues=venues, utilization=utilization, selected=selected,
+                           calendar_urls=calendar_urls)
 
 @admin_bp.route('/venues/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def create_venue():
+    from forms import VenueForm
+
     form = VenueForm()
     if form.validate_on_submit():
         venue = Venue(
@@ -87,10 +172,14 @@ def create_venue():
 @admin_required
 def edit_venue(venue_id):
     venue = Venue.query.get_or_404(venue_id)
+    from forms import VenueForm
+
     form = VenueForm(obj=venue)
     if form.validate_on_submit():
         form.populate_obj(venue)
         db.session.commit()
+        invalidate_venue(venue.id)
+        invalidate_feeds(venue_ids=[venue.id])
         flash('场地更新成功！', 'success')
         return redirect(url_for('admin.venues'))
     return render_template('edit_venue.html', form=form, venue=venue)
@@ -106,6 +195,8 @@ def delete_venue(venue_id):
     else:
         db.session.delete(venue)
         db.session.commit()
+        invalidate_venue(venue_id)
+        invalidate_feeds(venue_ids=[venue_id])
         flash('场地删除成功', 'success')
     return redirect(url_for('admin.venues'))
 
@@ -120,6 +211,8 @@ def activity_types():
 @login_required
 @admin_required
 def create_activity_type():
+    from forms import ActivityTypeForm
+
     form = ActivityTypeForm()
     if form.validate_on_submit():
         activity_type = ActivityType(
@@ -137,6 +230,8 @@ def create_activity_type():
 @admin_required
 def edit_activity_type(type_id):
     activity_type = ActivityType.query.get_or_404(type_id)
+    from forms import ActivityTypeForm
+
     form = ActivityTypeForm(obj=activity_type)
     if form.validate_on_submit():
         form.populate_obj(activity_type)
@@ -167,8 +262,10 @@ def delete_user(user_id):
     if user.is_admin:
         flash('无法删除管理员用户', 'warning')
     else:
-        db.session.delete(user)
+        # 与批量删除相同：软删除后由后台任务删除报名、点赞和通知，发起的活动和评论保留
+        bulk_delete_users([User.id == user.id])
         db.session.commit()
+        schedule_purge()
         flash('用户删除成功', 'success')
     return redirect(url_for('admin.users'))
 
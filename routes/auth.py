@@ -1,7 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user
 from models import User
-from forms import LoginForm, RegistrationForm
 from extensions import db
 
 auth_bp = Blueprint('auth', __name__)
@@ -11,6 +10,8 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('public.index'))
     
+    from forms import LoginForm
+
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
@@ -27,9 +28,12 @@ def register():
     if current_user.is_authenticated:
         return redirect(url_for('public.index'))
     
+    from forms import RegistrationForm
+
     form = RegistrationForm()
     if form.validate_on_submit():
-        if User.query.filter_by(username=form.username.data).first():
+        # 已删除但尚未清理的用户仍占用用户名
+        if User.query.filter_by(username=form.username.data).execution_options(include_deleted=True).first():
             flash('用户名已存在', 'error')
             return redirect(url_for('auth.register'))
         
@@ -0,0 +1,35 @@
+from flask import Blueprint, Response, request, abort, current_app
+from werkzeug.http import is_resource_modified
+from utils import ical
+
+calendar_bp = Blueprint('calendar', __name__)
+
+def feed_response(kind, object_id, token):
+    """日历应用轮询的订阅地址：命中缓存且没有变化时返回 304，不访问数据库"""
+    if not ical.check_token(current_app.config, kind, object_id, token):
+        abort(404)
+    feed = ical.get_feed(kind, object_id)
+    if not is_resource_modified(request.environ, etag=feed.etag, last_modified=feed.last_modified):
+        response = Response(status=304)
+    else:
+        try:
+            with open(feed.path, 'rb') as body:
+                response = Response(body.read(), mimetype='text/calendar')
+        except FileNotFoundError:
+            # 读文件前恰好被失效，重新生成一次
+            feed = ical.build_feed(kind, object_id)
+            with open(feed.path, 'rb') as body:
+                response = Response(body.read(), mimetype='text/calendar')
+        response.headers['Content-Disposition'] = f'inline; filename={kind}_{object_id}.ics'
+    response.set_etag(feed.etag)
+    response.last_modified = feed.last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@calendar_bp.route('/calendar/user/<int:object_id>/<token>.ics')
+def user_feed(object_id, token):
+    return feed_response('user', object_id, token)
+
+@calendar_bp.route('/calendar/venue/<int:object_id>/<token>.ics')
+def venue_feed(object_id, token):
+    return feed_response('venue', object_id, token)
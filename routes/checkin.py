@@ -0,0 +1,116 @@
+from flask import Blueprint, render_template, request, url_for, abort, current_app, jsonify
+from flask_login import login_required, current_user
+from markupsafe import Markup
+from datetime import datetime, timezone
+from models import Activity, Participation, to_cst
+from extensions import db, checkin_writer
+from utils.checkin import SCANS, sign_ticket, verify_ticket, issue_scanner_token, load_scanner_token, build_roster
+from utils.badges import LAYOUTS, FORMATS
+from utils.jobs import enqueue
+
+checkin_bp = Blueprint('checkin', __name__)
+
+# 单次提交最多的扫码记录数（离线补交时按批提交）
+MAX_SCANS_PER_REQUEST = 1000
+
+def get_managed_activity_or_403(activity_id):
+    activity = db.get_or_404(Activity, activity_id)
+    if activity.organizer_id != current_user.id and not current_user.is_admin:
+        abort(403)
+    return activity
+
+@checkin_bp.route('/activity/<int:activity_id>/ticket')
+@login_required
+def ticket(activity_id):
+    """报名者的电子票：签名后的报名记录，以二维码展示"""
+    import qrcode
+    import qrcode.image.svg
+
+    participation = db.first_or_404(db.select(Participation).where(
+        Participation.user_id == current_user.id,
+        Participation.activity_id == activity_id
+    ))
+    token = sign_ticket(current_app.config, participation)
+    image = qrcode.make(token, image_factory=qrcode.image.svg.SvgPathImage, box_size=10)
+    return render_template('checkin/ticket.html', activity=participation.activity,
+                           checked_in_at=to_cst(participation.checked_in_at),
+                           token=token, qr_svg=Markup(image.to_string(encoding='unicode')))
+
+@checkin_bp.route('/activity/<int:activity_id>/checkin')
+@login_required
+def scanner(activity_id):
+    activity = get_managed_activity_or_403(activity_id)
+    return render_template('checkin/scanner.html', activity=activity)
+
+@checkin_bp.route('/activity/<int:activity_id>/checkin/roster')
+@login_required
+def roster(activity_id):
+    """扫码页面下载的离线名单，附带提交签到用的扫码令牌"""
+    activity = get_managed_activity_or_403(activity_id)
+    data = build_roster(current_app.config, activity)
+    data['scanner_token'] = issue_scanner_token(current_app.config, activity.id, current_user.id)
+    data['scan_url'] = url_for('checkin.scan', activity_id=activity.id)
+    return jsonify(data)
+
+@checkin_bp.route('/activity/<int:activity_id>/checkin/badges', methods=['POST'])
+@login_required
+def render_badges(activity_id):
+    """提交批量生成胸牌或门票的后台任务，进度和下载通过 /jobs/<id> 查询"""
+    activity = get_managed_activity_or_403(activity_id)
+    layout = request.form.get('layout', 'badge')
+    fmt = request.form.get('format', 'pdf')
+    if layout not in LAYOUTS or fmt not in FORMATS:
+        return jsonify({'success': False, 'message': '未知的版式或格式'}), 400
+    render_job = enqueue('badges.render', {'activity_id': activity.id, 'layout': layout, 'format': fmt},
+                         priority=3, user_id=current_user.id)
+    return jsonify({
+        'job_id': render_job.id,
+        'status_url': url_for('jobs.job_status', job_id=render_job.id),
+        'download_url': url_for('jobs.download_job_result', job_id=render_job.id)
+    }), 202
+
+@checkin_bp.route('/activity/<int:activity_id>/checkin/scan', methods=['POST'])
+def scan(activity_id):
+    """提交签到：{"scans": [{"token": 电子票, "at": 扫码时间(Unix 秒，离线补交时提供)}]}
+
+    只校验扫码令牌和电子票的签名，不查询数据库，签到记录由后台队列批量写入。
+    结果为 invalid、wrong_activity、checked_in、duplicate 或 not_registered（已知报名已退出，见 utils.checkin）。
+    """
+    scheme, _, scanner_token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or load_scanner_token(current_app.config, scanner_token) != activity_id:
+        return jsonify({'success': False, 'message': '扫码令牌无效或已过期，请重新打开签到页面'}), 401
+
+    data = request.get_json(silent=True) or {}
+    scans = data.get('scans')
+    if scans is None and data.get('token'):
+        scans = [{'token': data['token']}]
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'success': False, 'message': '缺少电子票'}), 400
+    if len(scans) > MAX_SCANS_PER_REQUEST:
+        return jsonify({'success': False, 'message': f'单次最多提交 {MAX_SCANS_PER_REQUEST} 条'}), 400
+
+    now = datetime.now(timezone.utc)
+    earliest = now.timestamp() - current_app.config['CHECKIN_SCANNER_TTL']
+    results = []
+    for item in scans:
+        token = item.get('token') if isinstance(item, dict) else None
+        ticket = verify_ticket(current_app.config, token) if isinstance(token, str) else None
+        if ticket is None:
+            status = 'invalid'
+        elif ticket.activity_id != activity_id:
+            status = 'wrong_activity'
+        else:
+            # 离线扫码的时间以设备记录为准，明显不合理的时间按收到的时间算
+            at = item.get('at')
+            if isinstance(at, (int, float)) and earliest <= at <= now.timestamp():
+                checked_in_at = datetime.fromtimestamp(at, timezone.utc)
+            else:
+                checked_in_at = now
+            status = checkin_writer.submit(ticket.participation_id, checked_in_at)
+        SCANS.inc((status,))
+        results.append({
+            'token': token,
+            'status': status,
+            'participation_id': ticket.participation_id if ticket else None
+        })
+    return jsonify({'success': True, 'results': results})
@@ -0,0 +1,47 @@
+from flask import Blueprint, jsonify, abort, current_app, send_from_directory
+from flask_login import login_required, current_user
+from models import Job
+from extensions import db
+import json
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.last_error.strip().splitlines()[-1] if job.last_error and job.status == 'failed' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def get_own_job_or_403(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.user_id != current_user.id and not current_user.is_admin:
+        abort(403)
+    return job
+
+@jobs_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = get_own_job_or_403(job_id)
+    return jsonify(job_to_dict(job))
+
+@jobs_bp.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job_result(job_id):
+    job = get_own_job_or_403(job_id)
+    result = json.loads(job.result) if job.result else {}
+    if job.status != 'succeeded' or not result.get('file'):
+        abort(404)
+    return send_from_directory(
+        current_app.config['JOB_OUTPUT_FOLDER'],
+        result['file'],
+        as_attachment=True,
+        download_name=result.get('download_name', result['file'])
+    )
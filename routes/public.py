@@ -1,25 +1,35 @@
-from flask import Blueprint, render_template, request, redirect, url_for, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, Response
 from flask_login import current_user, login_required
 from datetime import datetime, timezone, timedelta
-from models import Activity, ActivityType, Participation, Comment, Like, Venue
-from extensions import db
+from models import Activity, ActivityType, Participation, Comment, Like, Venue, ArchivedActivity, ArchivedParticipation, ArchivedComment
+from extensions import db, event_broker
+from utils.events import activity_channel, publish_activity_counts
+from utils import archive, similarity
+from utils.filters import ActivityFilter
+from utils.counters import bump_user_counters
+from utils.analytics import record_event
 from sqlalchemy import true, false
 import io
 import csv
+import json
 
 public_bp = Blueprint('public', __name__)
 
+# 单个 SSE 连接最多订阅的活动数（首页每页 9 个活动 + 8 个热门活动）
+MAX_LIVE_ACTIVITIES = 50
+
 @public_bp.route('/')
 def index():
     page = request.args.get('page', 1, type=int)
-    search_query = request.args.get('search', '')
-    activity_type_id = request.args.get('activity_type_id', type=int)
     hot = request.args.get('hot', '0')
-    status_filter = request.args.get('status', '')
     recommend_flag = request.args.get('recommend', '0')
-    venue_id = request.args.get('venue_id', type=int)
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
+    filters = ActivityFilter.from_request()
+    if filters.search:
+        # 搜索时忽略类型和状态筛选
+        filters.activity_type_id = None
+        filters.status = ''
+    if filters.activity_type_id:
+        hot = '0'
     recommend_activities = []
     hot_activities = []
 
@@ -35,7 +45,7 @@ def index():
                 recommend_query = Activity.query.filter(
                     Activity.is_approved==True,
                     Activity.status=='active',
-                    Activity.start_time > datetime.now(timezone.utc),
+                    Activity.lifecycle_status == 'upcoming',
                     Activity.id.notin_(participated_activity_ids)
                 ).options(db.joinedload(Activity.venue), db.joinedload(Activity.activity_type))
                 type_recommendations = recommend_query.filter(
@@ -54,38 +64,36 @@ def index():
                     recommend_activities = type_recommendations
             else:
                 # 新用户推荐热门活动
-                now_utc = datetime.now(timezone.utc)
                 upcoming_activities = Activity.query.filter(
                     Activity.is_approved==True,
                     Activity.status == 'active',
-                    Activity.start_time > now_utc
-                ).options(db.joinedload(Activity.comments)).all()
+                    Activity.lifecycle_status == 'upcoming'
+                ).all()
                 def calculate_hot_score(activity):
                     like_weight = 2.0
                     comment_weight = 1.5
                     participation_weight = 10.0
                     participation_ratio = activity.current_participants / activity.max_participants if activity.max_participants > 0 else 0
                     likes = activity.likes_count or 0
-                    comments = len(activity.comments)
+                    comments = activity.comments_count or 0
                     hot_score = likes * like_weight + comments * comment_weight + participation_ratio * participation_weight
                     return hot_score
                 activities_with_scores = [(activity, calculate_hot_score(activity)) for activity in upcoming_activities]
                 recommend_activities = [activity for activity, score in sorted(activities_with_scores, key=lambda item: item[1], reverse=True)[:8]]
         else:
             # 未登录用户推荐热门活动
-            now_utc = datetime.now(timezone.utc)
             upcoming_activities = Activity.query.filter(
                 Activity.is_approved==True,
                 Activity.status == 'active',
-                Activity.start_time > now_utc
-            ).options(db.joinedload(Activity.comments)).all()
+                Activity.lifecycle_status == 'upcoming'
+            ).all()
             def calculate_hot_score(activity):
                 like_weight = 2.0
                 comment_weight = 1.5
                 participation_weight = 10.0
                 participation_ratio = activity.current_participants / activity.max_participants if activity.max_participants > 0 else 0
                 likes = activity.likes_count or 0
-                comments = len(activity.comments)
+                comments = activity.comments_count or 0
                 hot_score = likes * like_weight + comments * comment_weight + participation_ratio * participation_weight
                 return hot_score
             activities_with_scores = [(activity, calculate_hot_score(activity)) for activity in upcoming_activities]
@@ -95,77 +103,21 @@ def index():
         recommend_mode = True
     else:
         recommend_mode = False
-        query = Activity.query.filter_by(status='active', is_approved=True)
-        query = query.options(db.joinedload(Activity.venue), db.joinedload(Activity.activity_type))
-        if search_query:
-            query = query.filter(Activity.title.ilike(f'%{search_query}%'))
-            activity_type_id = None
-            status_filter = ''
-        if activity_type_id:
-            query = query.filter_by(activity_type_id=activity_type_id)
-            hot = '0'
-        if venue_id:
-            query = query.filter_by(venue_id=venue_id)
-        if start_date:
-            try:
-                start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-                query = query.filter(Activity.start_time >= start_dt)
-            except Exception:
-                pass
-        if end_date:
-            try:
-                end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-                query = query.filter(Activity.end_time <= end_dt + timedelta(days=1))
-            except Exception:
-                pass
-        now_utc = datetime.now(timezone.utc)
-        if status_filter == 'upcoming':
-            query = query.filter(Activity.start_time > now_utc)
-        elif status_filter == 'ongoing':
-            query = query.filter(Activity.start_time <= now_utc, Activity.end_time >= now_utc)
-        elif status_filter == 'ended':
-            query = query.filter(Activity.end_time < now_utc)
-        if hot == '1' and not search_query and not activity_type_id and not status_filter:
-            query = query.order_by(Activity.current_participants.desc(), Activity.created_at.desc())
+        if hot == '1' and not filters.search and not filters.status:
+            key, order_by = 'index.hot', (Activity.current_participants.desc(), Activity.created_at.desc())
         else:
-            query = query.order_by(Activity.start_time.desc())
-        activities = query.paginate(page=page, per_page=9)
+            key, order_by = 'index', (Activity.start_time.desc(),)
+        activities = filters.paginate(key, lambda: db.select(Activity).where(
+            Activity.status == 'active', Activity.is_approved == True
+        ).options(
+            db.joinedload(Activity.venue), db.joinedload(Activity.activity_type)
+        ).order_by(*order_by), page=page, per_page=9)
 
-    cst = timezone(timedelta(hours=8))
-    if recommend_mode:
-        for activity in activities:
-            if activity.start_time:
-                start_time_utc = activity.start_time.replace(tzinfo=timezone.utc) if activity.start_time.tzinfo is None else activity.start_time
-                activity.display_start_time = start_time_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_start_time = 'N/A'
-            if activity.end_time:
-                end_time_utc = activity.end_time.replace(tzinfo=timezone.utc) if activity.end_time.tzinfo is None else activity.end_time
-                activity.display_end_time = end_time_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_end_time = 'N/A'
-            if activity.created_at:
-                created_at_utc = activity.created_at.replace(tzinfo=timezone.utc) if activity.created_at.tzinfo is None else activity.created_at
-                activity.display_created_at = created_at_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_created_at = 'N/A'
-    else:
-        for activity in activities.items:
-            if activity.start_time:
-                start_time_utc = activity.start_time.replace(tzinfo=timezone.utc) if activity.start_time.tzinfo is None else activity.start_time
-                activity.display_start_time = start_time_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_start_time = 'N/A'
-            if activity.end_time:
-                end_time_utc = activity.end_time.replace(tzinfo=timezone.utc) if activity.end_time.tzinfo is None else activity.end_time
-                activity.display_end_time = end_time_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_end_time = 'N/A'
-            if activity.created_at:
-                created_at_utc = activity.created_at.replace(tzinfo=timezone.utc) if activity.created_at.tzinfo is None else activity.created_at
-                activity.display_created_at = created_at_utc.astimezone(cst).strftime('%Y-%m-%d %H:%M')
-            else:
-                activity.display_created_at = 'N/A'
+    # 使用模型上缓存的北京时间，避免每个字段重复做时区换算
+    for activity in (activities if recommend_mode else activities.items):
+        for field in ('start_time', 'end_time', 'created_at'):
+            value = getattr(activity, f'{field}_cst')
+            setattr(activity, f'display_{field}', value.strftime('%Y-%m-%d %H:%M') if value else 'N/A')
 
     if current_user.is_authenticated:
         for activity in activities:
@@ -183,12 +135,11 @@ def index():
     all_venues = Venue.query.all()
     
     # 热门活动推荐逻辑
-    now_utc = datetime.now(timezone.utc)
     upcoming_activities = Activity.query.filter(
         Activity.is_approved==True,
         Activity.status == 'active',
-        Activity.start_time > now_utc
-    ).options(db.joinedload(Activity.comments)).all()
+        Activity.lifecycle_status == 'upcoming'
+    ).all()
 
     def calculate_hot_score(activity):
         like_weight = 2.0
@@ -196,7 +147,7 @@ def index():
         participation_weight = 10.0
         participation_ratio = activity.current_participants / activity.max_participants if activity.max_participants > 0 else 0
         likes = activity.likes_count or 0
-        comments = len(activity.comments)
+        comments = activity.comments_count or 0
         hot_score = likes * like_weight + comments * comment_weight + participation_ratio * participation_weight
         return hot_score, likes, comments, participation_ratio
 
@@ -216,24 +167,30 @@ def index():
 
     return render_template('index.html', 
                            activities=activities, 
-                           search_query=search_query, 
-                           activity_type_id=activity_type_id,
+                           search_query=filters.search, 
+                           activity_type_id=filters.activity_type_id,
                            recommend_activities=[], # 不再传递为你推荐
                            hot=hot,
                            activity_types=all_activity_types,
                            venues=all_venues,
                            is_admin=current_user.is_authenticated and current_user.is_admin,
-                           status_filter=status_filter,
+                           status_filter=filters.status,
                            hot_activities=hot_activities,
                            recommend_mode=recommend_mode,
-                           venue_id=venue_id,
-                           start_date=start_date,
-                           end_date=end_date
+                           venue_id=filters.venue_id,
+                           start_date=filters.start_date,
+                           end_date=filters.end_date
                            )
 
 @public_bp.route('/activity/<int:activity_id>')
 def activity_detail(activity_id):
-    activity = db.session.query(Activity).options(db.joinedload(Activity.venue)).filter_by(id=activity_id).first_or_404()
+    # 结束已久的活动在归档表中，只读展示
+    activity = archive.get_activity_or_404(
+        activity_id,
+        hot_options=(db.joinedload(Activity.venue), db.selectinload(Activity.comments).joinedload(Comment.user)),
+        archived_options=(db.joinedload(ArchivedActivity.venue),
+                          db.selectinload(ArchivedActivity.comments).joinedload(ArchivedComment.user))
+    )
     db.session.refresh(activity)
     comments = activity.comments
     comments = sorted(comments, key=lambda c: c.created_at, reverse=True)
@@ -246,12 +203,8 @@ def activity_detail(activity_id):
     if not activity.is_approved and (not current_user.is_authenticated or (current_user.id != activity.organizer_id and not current_user.is_admin and not current_user.is_reviewer)):
         abort(403)
     is_joined = False
-    if current_user.is_authenticated:
-        participation = Participation.query.filter_by(
-            user_id=current_user.id,
-            activity_id=activity_id
-        ).first()
-        is_joined = participation is not None
+    if current_user.is_authenticated and not activity.is_archived:
+        is_joined = archive.is_participant(current_user.id, activity)
     is_exportable = False
     if activity.end_time:
         now = datetime.now(timezone.utc)
@@ -261,7 +214,10 @@ def activity_detail(activity_id):
             activity_end_time = activity.end_time
         if (now - activity_end_time).days >= 7:
             is_exportable = current_user.is_authenticated and current_user.id == activity.organizer_id
-    return render_template('activity_detail.html', activity=activity, comments=comments, is_joined=is_joined, is_exportable=is_exportable)
+    # 归档的活动不在相似度索引中
+    similar = [] if activity.is_archived else similarity.similar_activities(activity.id)
+    return render_template('activity_detail.html', activity=activity, comments=comments, is_joined=is_joined,
+                           is_exportable=is_exportable, similar_activities=similar)
 
 @public_bp.route('/activity/<int:activity_id>/like', methods=['POST'])
 def like_activity(activity_id):
@@ -276,22 +232,71 @@ def like_activity(activity_id):
 
     if existing_like:
         # Unlike the activity
+        record_event(activity, current_user, at=existing_like.created_at, likes=-1)
         db.session.delete(existing_like)
         activity.likes_count -= 1
+        bump_user_counters(current_user.id, likes_given_count=-1)
         db.session.commit()
+        publish_activity_counts(event_broker, activity)
         return {'success': True, 'likes': activity.likes_count, 'liked': False}
     else:
         # Like the activity
-        new_like = Like(user_id=current_user.id, activity_id=activity_id)
+        new_like = Like(user_id=current_user.id, activity_id=activity_id, created_at=datetime.now(timezone.utc))
         db.session.add(new_like)
         activity.likes_count += 1
+        bump_user_counters(current_user.id, likes_given_count=1)
+        record_event(activity, current_user, likes=1)
         db.session.commit()
+        publish_activity_counts(event_broker, activity)
         return {'success': True, 'likes': activity.likes_count, 'liked': True}
 
+@public_bp.route('/events/activities')
+def activity_events():
+    """以 Server-Sent Events 推送活动报名人数和点赞数的变化"""
+    activity_ids = []
+    for value in request.args.get('ids', '').split(','):
+        if value.strip().isdigit() and int(value) not in activity_ids:
+            activity_ids.append(int(value))
+    activity_ids = activity_ids[:MAX_LIVE_ACTIVITIES]
+    if not activity_ids:
+        return {'error': '缺少活动ID'}, 400
+
+    heartbeat_interval = current_app.config['EVENT_HEARTBEAT_INTERVAL']
+    subscription = event_broker.subscribe([activity_channel(activity_id) for activity_id in activity_ids])
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.get(timeout=heartbeat_interval)
+                if message is None:
+                    # 心跳注释，让代理保持连接并尽早发现已断开的客户端
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: counts\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @public_bp.route('/activity/<int:activity_id>/export')
 @login_required
 def export_activity(activity_id):
-    activity = Activity.query.get_or_404(activity_id)
+    # 报名者和用户一次性加载，避免逐行读取 p.user
+    activity = archive.get_activity_or_404(
+        activity_id,
+        hot_options=(
+            db.joinedload(Activity.venue), db.joinedload(Activity.activity_type),
+            db.selectinload(Activity.participations).joinedload(Participation.user)
+        ),
+        archived_options=(
+            db.joinedload(ArchivedActivity.venue), db.joinedload(ArchivedActivity.activity_type),
+            db.selectinload(ArchivedActivity.participations).joinedload(ArchivedParticipation.user)
+        )
+    )
     # 只允许发起者导出
     if activity.organizer_id != current_user.id:
         abort(403)
@@ -324,8 +329,9 @@ def export_activity(activity_id):
     writer.writerow(['参与用户ID', '用户名', '报名时间'])
     for p in activity.participations:
         writer.writerow([
-            p.user.id,
-            p.user.username,
+            # 归档的报名记录在用户被清理后 user_id 为空
+            p.user.id if p.user else '',
+            p.user.username if p.user else '',
             p.registered_at.strftime('%Y-%m-%d %H:%M')
         ])
     output.seek(0)
@@ -2,9 +2,16 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from models import Activity, db, Notification
 from datetime import datetime, timezone
+from utils import archive
+from utils.filters import ActivityFilter
+from utils.utilization import invalidate_venue
+from utils.ical import invalidate_feeds
 
 reviewer_bp = Blueprint('reviewer', __name__)
 
+# 单条 SQL 中 IN 列表的最大长度，避免超出数据库的参数个数限制
+BULK_REVIEW_CHUNK_SIZE = 500
+
 @reviewer_bp.before_request
 @login_required
 def before_request():
@@ -14,16 +21,12 @@ def before_request():
 
 @reviewer_bp.route('/review/list')
 def review_list():
-    search_query = request.args.get('search', '')
-    
-    activities_query = Activity.query.filter_by(review_status='pending')
-    
-    if search_query:
-        activities_query = activities_query.filter(Activity.title.ilike(f'%{search_query}%'))
-        
-    activities = activities_query.order_by(Activity.created_at.desc()).all()
-    
-    return render_template('reviewer/list.html', activities=activities, search_query=search_query)
+    filters = ActivityFilter.from_request()
+    activities = filters.scalars('review_list', lambda: db.select(Activity).where(
+        Activity.review_status == 'pending'
+    ).options(db.joinedload(Activity.organizer), db.joinedload(Activity.venue)).order_by(Activity.created_at.desc()))
+
+    return render_template('reviewer/list.html', activities=activities, search_query=filters.search)
 
 @reviewer_bp.route('/review/<int:activity_id>', methods=['GET', 'POST'])
 def review_activity(activity_id):
@@ -62,16 +65,100 @@ def review_activity(activity_id):
         )
         db.session.add(notification)
         db.session.commit()
+        invalidate_venue(activity.venue_id)
+        invalidate_feeds(user_ids=[activity.organizer_id], venue_ids=[activity.venue_id])
         
         flash('审核完成', 'success')
         return redirect(url_for('reviewer.review_list'))
         
     return render_template('reviewer/review.html', activity=activity)
 
+@reviewer_bp.route('/review/bulk', methods=['POST'])
+def bulk_review():
+    activity_ids = request.form.getlist('activity_ids', type=int)
+    review_status = request.form.get('review_status')
+    review_comment = request.form.get('review_comment')
+
+    if review_status not in ('approved', 'rejected'):
+        flash('请选择审核结果', 'warning')
+        return redirect(url_for('reviewer.review_list'))
+    if not activity_ids:
+        flash('请至少选择一个活动', 'warning')
+        return redirect(url_for('reviewer.review_list'))
+
+    reviewed_count = apply_bulk_review(activity_ids, review_status, review_comment, current_user.id)
+    skipped_count = len(set(activity_ids)) - reviewed_count
+    if skipped_count:
+        flash(f'批量审核完成：已审核 {reviewed_count} 个活动，跳过 {skipped_count} 个已审核的活动', 'success')
+    else:
+        flash(f'批量审核完成：已审核 {reviewed_count} 个活动', 'success')
+    return redirect(url_for('reviewer.review_list'))
+
+def apply_bulk_review(activity_ids, review_status, review_comment, reviewer_id):
+    """在一个事务内批量审核活动，返回实际被审核的活动数。
+
+    只处理仍处于 pending 状态的活动，重复提交同一批活动不会重复更新或重复发送通知。
+    """
+    is_approved = review_status == 'approved'
+    review_time = datetime.now(timezone.utc)
+    review_comment_msg = review_comment if review_comment else '无'
+    ids = sorted(set(activity_ids))
+
+    reviewed_count = 0
+    venue_ids = set()
+    organizer_ids = set()
+    for i in range(0, len(ids), BULK_REVIEW_CHUNK_SIZE):
+        chunk = ids[i:i + BULK_REVIEW_CHUNK_SIZE]
+        # 锁定仍待审核的行，防止两个审核员同时处理同一批活动时重复发送通知
+        rows = db.session.execute(
+            db.select(Activity.id, Activity.organizer_id, Activity.title, Activity.venue_id)
+            .where(Activity.id.in_(chunk), Activity.review_status == 'pending')
+            .with_for_update()
+        ).all()
+        if not rows:
+            continue
+        pending_ids = [row.id for row in rows]
+
+        db.session.execute(
+            db.update(Activity)
+            .where(Activity.id.in_(pending_ids), Activity.review_status == 'pending')
+            .values(
+                review_status=review_status,
+                review_comment=review_comment,
+                review_time=review_time,
+                reviewer_id=reviewer_id,
+                status='active' if is_approved else 'rejected',
+                is_approved=is_approved
+            )
+            .execution_options(synchronize_session=False)
+        )
+        # 多行 INSERT 一次写入本批全部通知
+        notifications = [
+            {
+                'user_id': row.organizer_id,
+                'activity_id': row.id,
+                'notification_type': 'activity_review',
+                'activity_title': row.title,
+                'review_status': review_status,
+                'review_comment': review_comment_msg,
+                'is_read': False,
+                'created_at': review_time
+            }
+            for row in rows if row.organizer_id is not None
+        ]
+        if notifications:
+            db.session.execute(db.insert(Notification), notifications)
+        reviewed_count += len(rows)
+        venue_ids.update(row.venue_id for row in rows)
+        organizer_ids.update(row.organizer_id for row in rows)
+
+    db.session.commit()
+    invalidate_venue(*venue_ids)
+    invalidate_feeds(user_ids=organizer_ids, venue_ids=venue_ids)
+    return reviewed_count
+
 @reviewer_bp.route('/review/history')
 def review_history():
-    activities = Activity.query.filter(
-        Activity.reviewer_id == current_user.id,
-        Activity.review_status != 'pending'
-    ).all()
+    # 包含已归档的活动
+    activities = archive.reviewed_activities(current_user.id)
     return render_template('reviewer/history.html', activities=activities) 
\ No newline at end of file
@@ -1,9 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, make_response, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timezone, timedelta
-from models import Activity, Participation, Comment, Venue, ActivityType, Notification
-from forms import ActivityForm
-from extensions import db
+from models import Activity, Participation, Comment, Venue, ActivityType, Notification, compute_lifecycle, LIFECYCLE_LABELS
+from models import ArchivedActivity, ArchivedParticipation, ArchivedComment
+from extensions import db, notification_fanout, event_broker, checkin_writer
+from utils.events import publish_activity_counts
+from utils.jobs import job, enqueue
+from utils.lifecycle import refresh_lifecycle, schedule_advance
+from utils import archive
+from utils.filters import ActivityFilter
+from utils.counters import bump_user_counters
+from utils import timeline
+from utils.analytics import record_event
+from utils.utilization import invalidate_venue
+from utils.ical import invalidate_feeds, invalidate_activity, feed_url
+from utils.purge import soft_delete_activity, schedule_purge
+from utils.similarity import schedule_update as schedule_similarity_update
 from werkzeug.utils import secure_filename
 import random
 import os
@@ -21,13 +33,41 @@ def allowed_file(filename):
 @user_bp.route('/profile')
 @login_required
 def profile():
-    user_activities = Activity.query.filter_by(organizer_id=current_user.id).all()
-    participations = Participation.query.filter_by(user_id=current_user.id).all()
-    return render_template('profile.html', user=current_user, activities=user_activities, participations=participations)
+    # 统计数直接取自 current_user 的计数列，两个列表各取第一页，其余通过 profile_timeline 按游标加载
+    activities, organized_cursor = timeline.organized_page(current_user.id)
+    participations, participated_cursor = timeline.participated_page(current_user.id)
+    return render_template('profile.html', user=current_user,
+                           activities=activities, organized_cursor=organized_cursor,
+                           participations=participations, participated_cursor=participated_cursor)
+
+@user_bp.route('/profile/timeline')
+@login_required
+def profile_timeline():
+    """个人中心列表的下一页：kind=organized|participated，cursor 为上一页返回的 next_cursor"""
+    kind = request.args.get('kind', 'participated')
+    if kind not in ('organized', 'participated'):
+        return jsonify({'success': False, 'message': '未知的列表类型'}), 400
+    try:
+        if kind == 'organized':
+            activities, next_cursor = timeline.organized_page(
+                current_user.id, request.args.get('cursor'), request.args.get('limit', type=int))
+        else:
+            participations, next_cursor = timeline.participated_page(
+                current_user.id, request.args.get('cursor'), request.args.get('limit', type=int))
+            activities = [p.activity for p in participations]
+    except ValueError:
+        return jsonify({'success': False, 'message': '无效的分页游标'}), 400
+    return jsonify({
+        'success': True,
+        'items': [timeline.activity_item(activity) for activity in activities],
+        'next_cursor': next_cursor
+    })
 
 @user_bp.route('/create_activity', methods=['GET', 'POST'])
 @login_required
 def create_activity():
+    from forms import ActivityForm
+
     form = ActivityForm()
     activity_types = ActivityType.query.all()
     venues = Venue.query.all()
@@ -112,9 +152,16 @@ def create_activity():
             activity.review_status = 'pending'
             activity.status = 'pending'
             activity.review_comment = '等待审核员审核'
+            boundary = refresh_lifecycle(activity)
 
             db.session.add(activity)
+            bump_user_counters(current_user.id, organized_count=1)
             db.session.commit()
+            invalidate_venue(activity.venue_id)
+            invalidate_feeds(user_ids=[activity.organizer_id], venue_ids=[activity.venue_id])
+            if boundary is not None:
+                schedule_advance(boundary)
+            schedule_similarity_update(activity.id)
 
             flash('活动创建成功，等待审核员审核。', 'success')
             return redirect(url_for('user.my_activities'))
@@ -134,8 +181,10 @@ def create_activity():
 def join_activity(activity_id):
     activity = Activity.query.get_or_404(activity_id)
     
-    if activity.current_status != '报名中':
-        flash(f'活动当前状态为 \'{activity.current_status}\', 无法报名。', 'warning')
+    # 按开始/结束时间实时判断：lifecycle_status 由后台任务推进，worker 停止或落后时会过期，只用于列表筛选和显示
+    lifecycle = compute_lifecycle(activity.start_time, activity.end_time)
+    if lifecycle != 'upcoming':
+        flash(f'活动当前状态为 \'{LIFECYCLE_LABELS[lifecycle]}\', 无法报名。', 'warning')
         return redirect(url_for('public.activity_detail', activity_id=activity_id))
 
     existing_participation = Participation.query.filter_by(
@@ -148,10 +197,20 @@ def join_activity(activity_id):
         return redirect(url_for('public.activity_detail', activity_id=activity_id))
     
     if activity.current_participants < activity.max_participants:
-        participation = Participation(user_id=current_user.id, activity_id=activity_id)
+        participation = Participation(
+            user_id=current_user.id,
+            activity_id=activity_id,
+            registered_at=datetime.now(timezone.utc)
+        )
         activity.current_participants += 1
         db.session.add(participation)
+        # 提交后 current_user 会过期，先取出 id，失效日历时不必重新加载
+        user_id = current_user.id
+        bump_user_counters(user_id, joined_count=1)
+        record_event(activity, current_user, joins=1)
         db.session.commit()
+        publish_activity_counts(event_broker, activity)
+        invalidate_feeds(user_ids=[user_id])
         flash('成功参加活动！', 'success')
     else:
         flash('活动已满！', 'error')
@@ -170,6 +229,9 @@ def add_comment(activity_id):
             created_at=datetime.now(timezone.utc)
         )
         db.session.add(comment)
+        activity.comments_count = Activity.comments_count + 1
+        bump_user_counters(current_user.id, comments_count=1)
+        record_event(activity, current_user, comments=1)
         db.session.commit()
         flash('评论发布成功！', 'success')
     return redirect(url_for('public.activity_detail', activity_id=activity_id))
@@ -191,6 +253,8 @@ def edit_activity(activity_id):
     elif activity.organizer_id != current_user.id and not current_user.is_admin:
         abort(403) # 如果不是组织者也不是管理员，且活动未被拒绝，则不允许编辑
 
+    from forms import ActivityForm
+
     form = ActivityForm(obj=activity)
 
     venues = Venue.query.all()
@@ -284,6 +348,11 @@ def edit_activity(activity_id):
         if request.form.get('remove_poster') == '1':
             poster_url = None
 
+        # 记录时间和场地变更，提交后通知已报名的用户
+        changes = describe_activity_changes(activity, start_time, end_time, venue_id)
+        previous_venue_id = activity.venue_id
+        content_changed = (activity.title, activity.description, activity.tags) != (title, description, tags)
+
         activity.title = title
         activity.description = description
         activity.start_time = start_time
@@ -293,6 +362,7 @@ def edit_activity(activity_id):
         activity.max_participants = max_participants
         activity.tags = tags
         activity.poster_url = poster_url
+        boundary = refresh_lifecycle(activity)
 
         # 如果活动之前被拒绝，重新提交时将其审核状态重置为pending
         if activity.review_status == 'rejected':
@@ -306,20 +376,61 @@ def edit_activity(activity_id):
             flash('活动更新成功！', 'success')
 
         db.session.commit()
+        invalidate_venue(previous_venue_id, activity.venue_id)
+        invalidate_activity(activity.id, activity.organizer_id, previous_venue_id, activity.venue_id)
+        if boundary is not None:
+            schedule_advance(boundary)
+        # 只有标题、简介、标签变化时才需要重算相似活动
+        if content_changed:
+            schedule_similarity_update(activity.id)
+        if changes and activity.current_participants:
+            notification_fanout.enqueue({
+                'notification_type': 'activity_updated',
+                'activity_id': activity.id,
+                'activity_title': activity.title,
+                'detail': '；'.join(changes),
+                'source_activity_id': activity.id
+            })
         return redirect(url_for('public.activity_detail', activity_id=activity.id))
 
     return render_template('edit_activity.html', form=form, activity=activity)
 
+def describe_activity_changes(activity, start_time, end_time, venue_id):
+    """比较活动的时间和场地，返回面向报名者的变更说明列表"""
+    cst = timezone(timedelta(hours=8))
+
+    def as_utc(dt):
+        return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+    changes = []
+    if activity.start_time and (as_utc(activity.start_time) != as_utc(start_time) or as_utc(activity.end_time) != as_utc(end_time)):
+        changes.append('时间变更为 {} 至 {}'.format(
+            start_time.astimezone(cst).strftime('%Y-%m-%d %H:%M'),
+            end_time.astimezone(cst).strftime('%Y-%m-%d %H:%M')
+        ))
+    if venue_id != activity.venue_id:
+        venue = db.session.get(Venue, venue_id) if venue_id else None
+        changes.append(f'场地变更为 {venue.name}' if venue else '场地已取消')
+    return changes
+
 @user_bp.route('/activity/<int:activity_id>/quit', methods=['POST'])
 @login_required
 def quit_activity(activity_id):
     participation = Participation.query.filter_by(user_id=current_user.id, activity_id=activity_id).first()
     activity = Activity.query.get_or_404(activity_id)
     if participation:
+        record_event(activity, current_user, at=participation.registered_at, joins=-1)
+        participation_id = participation.id
         db.session.delete(participation)
         if activity.current_participants > 0:
             activity.current_participants -= 1
+        user_id = current_user.id
+        bump_user_counters(user_id, joined_count=-1)
         db.session.commit()
+        # 电子票的签名无法撤销，让本进程的签到接口不再接受这张票
+        checkin_writer.revoke([participation_id])
+        publish_activity_counts(event_broker, activity)
+        invalidate_feeds(user_ids=[user_id])
         flash('已成功退出活动', 'info')
     else:
         flash('您未参加该活动', 'warning')
@@ -331,88 +442,46 @@ def delete_activity(activity_id):
     activity = Activity.query.get_or_404(activity_id)
     if activity.organizer_id != current_user.id and not current_user.is_admin:
         abort(403)
-    
-    db.session.delete(activity)
+
+    activity_title = activity.title
+    venue_id = activity.venue_id
+    organizer_id = activity.organizer_id
+
+    # 软删除后立即对所有查询不可见；报名、评论、点赞和通知由后台任务分块删除，请求不随报名人数变慢。
+    # 取消通知按报名记录扇出，清理任务在 PURGE_DELAY 秒后才删除报名记录；报名者的日历也由清理任务失效
+    soft_delete_activity(activity)
     db.session.commit()
+    schedule_purge()
+    invalidate_venue(venue_id)
+    invalidate_feeds(user_ids=[organizer_id], venue_ids=[venue_id])
+    notification_fanout.enqueue({
+        'notification_type': 'activity_cancelled',
+        'activity_id': None,
+        'activity_title': activity_title,
+        'detail': '活动已被取消',
+        'source_activity_id': activity_id
+    })
     flash('活动已删除', 'success')
     return redirect(url_for('public.index'))
 
 @user_bp.route('/my_activities')
 @login_required
 def my_activities():
-    # 获取筛选参数
-    activity_type_id = request.args.get('activity_type_id', type=int)
-    status_filter = request.args.get('status', '')
-    venue_id = request.args.get('venue_id', type=int)
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
+    filters = ActivityFilter.from_request()
 
     # 获取所有类型和场地
     activity_types = ActivityType.query.all()
     venues = Venue.query.all()
 
-    # 我发布的活动筛选 - 显示所有发布的活动
-    organized_query = Activity.query.filter_by(organizer_id=current_user.id)
-    if activity_type_id:
-        organized_query = organized_query.filter_by(activity_type_id=activity_type_id)
-    if venue_id:
-        organized_query = organized_query.filter_by(venue_id=venue_id)
-    if start_date:
-        try:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            organized_query = organized_query.filter(Activity.start_time >= start_dt)
-        except Exception:
-            pass
-    if end_date:
-        try:
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            organized_query = organized_query.filter(Activity.end_time <= end_dt + timedelta(days=1))
-        except Exception:
-            pass
-    if status_filter:
-        now_utc = datetime.now(timezone.utc)
-        if status_filter == 'upcoming':
-            organized_query = organized_query.filter(Activity.start_time > now_utc)
-        elif status_filter == 'ongoing':
-            organized_query = organized_query.filter(Activity.start_time <= now_utc, Activity.end_time >= now_utc)
-        elif status_filter == 'ended':
-            organized_query = organized_query.filter(Activity.end_time < now_utc)
-    organized_activities = organized_query.order_by(Activity.start_time.desc()).all()
-
-    # 我参与的活动筛选（只显示未结束或结束时间在一周内的活动）
-    participated_query = Activity.query.join(Participation).filter(
-        Participation.user_id==current_user.id,
-        Activity.organizer_id!=current_user.id
-    )
-    now_utc = datetime.now(timezone.utc)
-    one_week_ago = now_utc - timedelta(days=7)
-    participated_query = participated_query.filter(
-        (Activity.end_time >= now_utc) | (Activity.end_time >= one_week_ago)
-    )
-    if activity_type_id:
-        participated_query = participated_query.filter(Activity.activity_type_id==activity_type_id)
-    if venue_id:
-        participated_query = participated_query.filter(Activity.venue_id==venue_id)
-    if start_date:
-        try:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            participated_query = participated_query.filter(Activity.start_time >= start_dt)
-        except Exception:
-            pass
-    if end_date:
-        try:
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            participated_query = participated_query.filter(Activity.end_time <= end_dt + timedelta(days=1))
-        except Exception:
-            pass
-    if status_filter:
-        if status_filter == 'upcoming':
-            participated_query = participated_query.filter(Activity.start_time > now_utc)
-        elif status_filter == 'ongoing':
-            participated_query = participated_query.filter(Activity.start_time <= now_utc, Activity.end_time >= now_utc)
-        elif status_filter == 'ended':
-            participated_query = participated_query.filter(Activity.end_time < now_utc)
-    participated_activities = participated_query.order_by(Activity.start_time.desc()).all()
+    # 我发布的活动 - 显示所有发布的活动（含已归档的历史活动）
+    organized_activities = archive.organized_activities(current_user.id, filters)
+
+    # 我参与的活动（只显示未结束或结束时间在一周内的活动）
+    participated_activities = filters.scalars('my_activities.participated', lambda: db.select(Activity).join(Participation).where(
+        Participation.user_id == db.bindparam('user_id'),
+        Activity.organizer_id != db.bindparam('user_id'),
+        Activity.end_time >= db.bindparam('one_week_ago')
+    ).order_by(Activity.start_time.desc()), user_id=current_user.id, one_week_ago=datetime.now(timezone.utc) - timedelta(days=7))
 
     return render_template(
         'my_activities.html',
@@ -420,26 +489,38 @@ def my_activities():
         participated_activities=participated_activities,
         activity_types=activity_types,
         venues=venues,
-        activity_type_id=activity_type_id,
-        status_filter=status_filter,
-        venue_id=venue_id,
-        start_date=start_date,
-        end_date=end_date
+        calendar_url=feed_url('user', current_user.id),
+        activity_type_id=filters.activity_type_id,
+        status_filter=filters.status,
+        venue_id=filters.venue_id,
+        start_date=filters.start_date,
+        end_date=filters.end_date
     )
 
 @user_bp.route('/export_activity_data', methods=['POST'])
 @login_required
 def export_activity_data():
-    activity_id = request.form.get('activity_id')
+    activity_id = request.form.get('activity_id', type=int)
     if not activity_id:
         flash('请选择要导出的活动', 'warning')
         return redirect(url_for('user.my_activities'))
 
+    # 后台导出：提交任务后立即返回，由任务工作进程生成文件
+    if request.form.get('async') == '1':
+        activity = archive.get_activity_or_404(activity_id)
+        if activity.organizer_id != current_user.id and not current_user.is_admin:
+            abort(403)
+        export_job = enqueue('exports.activity_csv', {'activity_id': activity.id}, priority=5, user_id=current_user.id)
+        return jsonify({
+            'job_id': export_job.id,
+            'status_url': url_for('jobs.job_status', job_id=export_job.id),
+            'download_url': url_for('jobs.download_job_result', job_id=export_job.id)
+        }), 202
+
     # 使用 joinedload 加载评论和用户数据
-    activity = Activity.query.options(
-        db.joinedload(Activity.comments).joinedload(Comment.user),
-        db.joinedload(Activity.participations).joinedload(Participation.user)
-    ).get_or_404(activity_id)
+    activity = load_activity_for_export(activity_id)
+    if activity is None:
+        abort(404)
 
     if activity.organizer_id != current_user.id and not current_user.is_admin:
         abort(403)
@@ -450,6 +531,35 @@ def export_activity_data():
     response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
+def load_activity_for_export(activity_id):
+    # 已归档的活动从归档表读取，CSV 内容相同
+    return archive.get_activity(
+        activity_id,
+        hot_options=(
+            db.joinedload(Activity.comments).joinedload(Comment.user),
+            db.joinedload(Activity.participations).joinedload(Participation.user)
+        ),
+        archived_options=(
+            db.joinedload(ArchivedActivity.comments).joinedload(ArchivedComment.user),
+            db.joinedload(ArchivedActivity.participations).joinedload(ArchivedParticipation.user)
+        )
+    )
+
+@job('exports.activity_csv')
+def export_activity_csv_job(payload, context):
+    """后台任务：生成活动数据 CSV 文件"""
+    activity = load_activity_for_export(payload['activity_id'])
+    if activity is None:
+        raise LookupError(f"活动 {payload['activity_id']} 不存在")
+    context.set_progress(30)
+
+    output_folder = current_app.config['JOB_OUTPUT_FOLDER']
+    os.makedirs(output_folder, exist_ok=True)
+    filename = f"activity_{activity.id}_data_{context.job_id}.csv"
+    with open(os.path.join(output_folder, filename), 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(generate_csv_data(activity))
+    return {'file': filename, 'download_name': f'activity_{activity.id}_data.csv'}
+
 def generate_csv_data(activity):
     output = io.StringIO()
     writer = csv.writer(output)
@@ -478,7 +588,7 @@ def generate_csv_data(activity):
     # 活动统计
     writer.writerow(['活动统计'])
     likes = activity.likes_count or 0
-    comments_count = len(activity.comments)
+    comments_count = activity.comments_count or 0
     participants_count = activity.current_participants or 0
     activity_score = (likes + comments_count) / max(participants_count, 1)
     writer.writerow(['点赞数', likes])
@@ -489,27 +599,27 @@ def generate_csv_data(activity):
 
     # 参与用户
     writer.writerow(['参与用户信息'])
-    writer.writerow(['用户ID', '用户名', '参与状态', '报名时间'])
+    writer.writerow(['用户ID', '用户名', '参与状态', '报名时间', '签到时间'])
     for p in activity.participations:
         writer.writerow([
             p.user.id if p.user else '',
             p.user.username if p.user else '',
             p.status,
-            p.registered_at.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M') if p.registered_at else ''
+            p.registered_at.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M') if p.registered_at else '',
+            p.checked_in_at.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M') if p.checked_in_at else ''
         ])
     writer.writerow([])
 
     # 评论详情
     writer.writerow(['评论详情'])
-    writer.writerow(['评论ID', '用户ID', '用户名', '评论内容', '评论时间', '点赞数'])
+    writer.writerow(['评论ID', '用户ID', '用户名', '评论内容', '评论时间'])
     for c in activity.comments:
         writer.writerow([
             c.id,
             c.user.id if c.user else '',
             c.user.username if c.user else '',
             c.content,
-            c.created_at.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M') if c.created_at else '',
-            c.likes_count or 0
+            c.created_at.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M') if c.created_at else ''
         ])
 
     return output.getvalue()
@@ -517,17 +627,10 @@ def generate_csv_data(activity):
 @user_bp.route('/notifications')
 @login_required
 def notifications():
-    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
+    notifications = archive.user_notifications(current_user.id)
     
     cst = timezone(timedelta(hours=8))
     for notification in notifications:
-        # Debugging prints
-        print(f"Notification ID: {notification.id}")
-        print(f"  Type: {notification.notification_type}")
-        print(f"  Title: {notification.activity_title}")
-        print(f"  Status: {notification.review_status}")
-        print(f"  Comment: {notification.review_comment}")
-        
         if notification.created_at:
             # Ensure created_at is timezone-aware before converting
             if notification.created_at.tzinfo is None:
@@ -541,7 +644,7 @@ def notifications():
 @user_bp.route('/notifications/<int:notification_id>/mark_read', methods=['POST'])
 @login_required
 def mark_notification_as_read(notification_id):
-    notification = Notification.query.get_or_404(notification_id)
+    notification = archive.get_notification_or_404(notification_id)
     if notification.user_id != current_user.id:
         abort(403)
     
@@ -8,7 +8,8 @@ from sqlalchemy import text
 # 导入必要的模块
 from app import create_app
 from extensions import db
-from models import User, Activity, Venue, ActivityType, Participation, Comment
+from models import User, Activity, Venue, ActivityType, Participation, Comment, compute_lifecycle
+from utils.counters import recount_user_counters, reconcile_activity_counters
 
 fake = Faker('zh_CN')  # 使用中文数据
 
@@ -269,6 +270,7 @@ def seed_data():
                     description=description,
                     start_time=start_time,
                     end_time=end_time,
+                    lifecycle_status=compute_lifecycle(start_time, end_time),
                     venue_id=venue.id,
                     activity_type_id=activity_type.id,
                     organizer_id=organizer.id,
@@ -350,6 +352,10 @@ def seed_data():
 
             db.session.commit()
 
+            # 上面随机生成的报名数和点赞数只是造数据的目标值，活动计数和个人中心的统计数都按实际记录重算
+            reconcile_activity_counters()
+            recount_user_counters()
+
         print(f'数据库填充完毕。总活动数: {Activity.query.count()}, 总用户数: {User.query.count()}, 总参与记录数: {Participation.query.count()}')
 
         print(f'数据库填充完毕。总活动数: {Activity.query.count()}, 总用户数: {User.query.count()}, 总参与记录数: {Participation.query.count()}, 总评论数: {Comment.query.count()}')
@@ -0,0 +1,313 @@
+"""运营统计：按 日期 × 活动类型 × 场地 × 院系 汇总的每日报名、点赞、评论数
+
+管理后台的图表只读 daily_activity_stats 汇总表（每天最多 类型数×场地数×院系数 行），
+不再对报名、点赞、评论表做 JOIN + GROUP BY 全表扫描。汇总表有两种维护方式，由 ANALYTICS_ROLLUP_MODE 选择：
+
+- events（默认）：报名/退出/点赞/取消点赞/评论在同一事务中 upsert 对应的汇总行（x = x + delta），实时准确。
+- batch：写操作不碰汇总表，任务 `analytics.rollup` 每 ANALYTICS_ROLLUP_INTERVAL 秒从水位线所在的日期开始，
+  用原始表（热表 + 归档表）重算到今天，再推进水位线。
+
+两种方式口径相同：报名数是当天报名且至今未退出的人数，退出和取消点赞计入原报名/点赞的那一天。
+`flask analytics backfill` 按原始表重算任意日期范围，用于首次部署、切换模式或修正偏差
+（例如 events 模式下活动修改了类型或场地后，之前的报名仍记在原来的维度下）。
+日期按北京时间划分。
+"""
+import logging
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Date
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_JOB = 'analytics.rollup'
+WATERMARK_NAME = 'daily_activity_stats'
+KEY_COLUMNS = ('day', 'activity_type_id', 'venue_id', 'department')
+METRICS = ('joins', 'likes', 'comments')
+# 回填时每个事务重算的天数
+BACKFILL_CHUNK_DAYS = 31
+
+
+class cst_date(FunctionElement):
+    """把按 UTC 存储的时间列换算成北京时间的日期"""
+    type = Date()
+    name = 'cst_date'
+    inherit_cache = True
+
+
+@compiles(cst_date)
+def _compile_cst_date(element, compiler, **kw):
+    return 'DATE(DATE_ADD(%s, INTERVAL 8 HOUR))' % compiler.process(element.clauses, **kw)
+
+
+@compiles(cst_date, 'sqlite')
+def _compile_cst_date_sqlite(element, compiler, **kw):
+    return "date(%s, '+8 hours')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(cst_date, 'postgresql')
+def _compile_cst_date_postgresql(element, compiler, **kw):
+    return "CAST(%s + INTERVAL '8 hours' AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+def today():
+    from models import to_cst
+    return to_cst(datetime.now(timezone.utc)).date()
+
+
+def _day_start_utc(day):
+    """北京时间某日 0 点对应的 UTC 时间（无时区，与库中存储格式一致）"""
+    from models import CST
+    return datetime.combine(day, time.min, CST).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _upsert(db, rows):
+    """把 rows 中的增量累加到汇总行上，行不存在时插入"""
+    from models import DailyActivityStat
+
+    table = DailyActivityStat.__table__
+    dialect = db.session.get_bind(mapper=DailyActivityStat).dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in METRICS}
+        )
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={name: table.c[name] + statement.excluded[name] for name in METRICS}
+        )
+    db.session.execute(statement, rows)
+
+
+def record_event(activity, user, at=None, **deltas):
+    """写操作在提交前调用，例如 record_event(activity, current_user, joins=1)
+
+    at 为事件所属的时间（退出/取消点赞时传原报名/点赞时间），默认为现在。batch 模式下不做任何事。
+    """
+    if current_app.config['ANALYTICS_ROLLUP_MODE'] != 'events':
+        return
+    from extensions import db
+    from models import to_cst
+
+    day = to_cst(at or datetime.now(timezone.utc)).date()
+    _upsert(db, [{
+        'day': day,
+        'activity_type_id': activity.activity_type_id or 0,
+        'venue_id': activity.venue_id or 0,
+        'department': user.department or '',
+        **{name: deltas.get(name, 0) for name in METRICS}
+    }])
+
+
+def _raw_events(db, start, end):
+    """[start, end) 之间的原始事件（热表 + 归档表），每行带维度和一个计数为 1 的指标"""
+    from models import (User, Activity, Participation, Like, Comment,
+                        ArchivedActivity, ArchivedParticipation, ArchivedLike, ArchivedComment)
+
+    sources = [
+        (Participation, Participation.registered_at, 'joins', Activity),
+        (ArchivedParticipation, ArchivedParticipation.registered_at, 'joins', ArchivedActivity),
+        (Like, Like.created_at, 'likes', Activity),
+        (ArchivedLike, ArchivedLike.created_at, 'likes', ArchivedActivity),
+        (Comment, Comment.created_at, 'comments', Activity),
+        (ArchivedComment, ArchivedComment.created_at, 'comments', ArchivedActivity),
+    ]
+    selects = []
+    for model, timestamp, metric, activity in sources:
+        selects.append(
+            db.select(
+                cst_date(timestamp).label('day'),
+                db.func.coalesce(activity.activity_type_id, 0).label('activity_type_id'),
+                db.func.coalesce(activity.venue_id, 0).label('venue_id'),
+                db.func.coalesce(User.department, '').label('department'),
+                *[db.literal(int(name == metric)).label(name) for name in METRICS]
+            )
+            .select_from(model)
+            # 活动被删除后报名和评论仍然保留，按“未设置”的类型和场地计入
+            .outerjoin(activity, model.activity_id == activity.id)
+            .outerjoin(User, model.user_id == User.id)
+            .where(timestamp >= start, timestamp < end)
+        )
+    return db.union_all(*selects).subquery()
+
+
+def rebuild_days(start_day, end_day):
+    """按原始表重算 [start_day, end_day] 的汇总行，在一个事务中先删后插，返回写入的行数"""
+    from extensions import db
+    from models import DailyActivityStat
+
+    events = _raw_events(db, _day_start_utc(start_day), _day_start_utc(end_day + timedelta(days=1)))
+    grouped = db.select(
+        *[events.c[name] for name in KEY_COLUMNS],
+        *[db.func.sum(events.c[name]) for name in METRICS]
+    ).group_by(*[events.c[name] for name in KEY_COLUMNS])
+    try:
+        db.session.execute(
+            db.delete(DailyActivityStat)
+            .where(DailyActivityStat.day >= start_day, DailyActivityStat.day <= end_day)
+            .execution_options(synchronize_session=False)
+        )
+        result = db.session.execute(
+            DailyActivityStat.__table__.insert().from_select(list(KEY_COLUMNS) + list(METRICS), grouped)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result.rowcount
+
+
+def _set_watermark(db, value):
+    from models import RollupWatermark
+
+    watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+    if watermark is None:
+        db.session.add(RollupWatermark(name=WATERMARK_NAME, value=value))
+    else:
+        watermark.value = value
+    db.session.commit()
+
+
+def _rebuild_range(start_day, end_day, chunk_days=BACKFILL_CHUNK_DAYS):
+    """每 chunk_days 天一个事务，避免回填长时间持有锁"""
+    rows = 0
+    chunk_start = start_day
+    while chunk_start <= end_day:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_day)
+        rows += rebuild_days(chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+    logger.info('统计汇总已重算 %s 至 %s，写入 %d 行', start_day, end_day, rows)
+    return rows
+
+
+def backfill(start_day, end_day=None):
+    """重算 [start_day, end_day]，重算到今天时推进水位线，返回写入的行数"""
+    from extensions import db
+
+    end_day = end_day or today()
+    started_at = datetime.now(timezone.utc)
+    rows = _rebuild_range(start_day, end_day)
+    if end_day >= today():
+        _set_watermark(db, started_at)
+    return rows
+
+
+def rollup_since_watermark():
+    """batch 模式的增量汇总：从水位线所在的日期重算到今天，没有水位线时只算今天"""
+    from extensions import db
+    from models import RollupWatermark, to_cst
+
+    started_at = datetime.now(timezone.utc)
+    watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+    start_day = to_cst(watermark.value).date() if watermark else today()
+    end_day = today()
+    rows = _rebuild_range(start_day, end_day)
+    _set_watermark(db, started_at)
+    return {'from': start_day.isoformat(), 'to': end_day.isoformat(), 'rows': rows}
+
+
+def dashboard_data(days=None):
+    """管理后台图表数据：最近 days 天的每日趋势，以及按类型、场地、院系的排行"""
+    from extensions import db
+    from models import DailyActivityStat as Stat, ActivityType, Venue
+
+    days = days or current_app.config['ANALYTICS_DASHBOARD_DAYS']
+    end_day = today()
+    start_day = end_day - timedelta(days=days - 1)
+    in_range = (Stat.day >= start_day, Stat.day <= end_day)
+    totals = [db.func.sum(getattr(Stat, name)).label(name) for name in METRICS]
+
+    daily = {row.day: row for row in db.session.execute(
+        db.select(Stat.day, *totals).where(*in_range).group_by(Stat.day)
+    )}
+    labels = [start_day + timedelta(days=offset) for offset in range(days)]
+    series = {
+        name: [int(getattr(daily[day], name) or 0) if day in daily else 0 for day in labels]
+        for name in METRICS
+    }
+
+    def ranking(column, label, limit=10):
+        rows = db.session.execute(
+            db.select(column, *totals).where(*in_range).group_by(column)
+            .order_by(db.func.sum(Stat.joins).desc()).limit(limit)
+        ).all()
+        return [
+            {'name': label(row[0]), **{name: int(getattr(row, name) or 0) for name in METRICS}}
+            for row in rows
+        ]
+
+    type_names = dict(db.session.execute(db.select(ActivityType.id, ActivityType.name)).all())
+    venue_names = dict(db.session.execute(db.select(Venue.id, Venue.name)).all())
+    return {
+        'days': days,
+        'labels': [day.strftime('%m-%d') for day in labels],
+        'series': series,
+        'totals': {name: sum(values) for name, values in series.items()},
+        'by_type': ranking(Stat.activity_type_id, lambda value: type_names.get(value, '未设置')),
+        'by_venue': ranking(Stat.venue_id, lambda value: venue_names.get(value, '未设置')),
+        'by_department': ranking(Stat.department, lambda value: value or '未填写', limit=15),
+    }
+
+
+@job(ROLLUP_JOB)
+def rollup_job(payload, context):
+    result = rollup_since_watermark()
+    # 每隔 ANALYTICS_ROLLUP_INTERVAL 秒执行一次，已有排队中的任务时不重复排
+    from extensions import db
+    from models import Job
+    queued = db.session.scalar(
+        db.select(db.func.count(Job.id)).where(Job.name == ROLLUP_JOB, Job.status == 'queued')
+    )
+    if not queued:
+        enqueue(ROLLUP_JOB, priority=-5, delay=current_app.config['ANALYTICS_ROLLUP_INTERVAL'])
+    return result
+
+
+analytics_cli = AppGroup('analytics', help='运营统计汇总')
+
+
+@analytics_cli.command('backfill')
+@click.option('--days', type=int, default=365, help='重算最近多少天，默认 365')
+@click.option('--since', default=None, help='从指定日期（YYYY-MM-DD）开始重算，优先于 --days')
+@click.option('--until', default=None, help='重算到指定日期（YYYY-MM-DD），默认今天')
+def backfill_command(days, since, until):
+    """按原始报名、点赞、评论记录重算每日汇总"""
+    end_day = date.fromisoformat(until) if until else today()
+    start_day = date.fromisoformat(since) if since else end_day - timedelta(days=days - 1)
+    rows = backfill(start_day, end_day)
+    click.echo(f'已重算 {start_day} 至 {end_day}，写入 {rows} 行汇总')
+
+
+@analytics_cli.command('rollup')
+@click.option('--background', is_flag=True, help='提交为后台任务（之后按 ANALYTICS_ROLLUP_INTERVAL 自动执行）')
+def rollup_command(background):
+    """从水位线开始增量汇总（batch 模式）"""
+    if background:
+        rollup = enqueue(ROLLUP_JOB, priority=-5)
+        click.echo(f'已提交汇总任务 {rollup.id}')
+        return
+    result = rollup_since_watermark()
+    click.echo(f"已重算 {result['from']} 至 {result['to']}，写入 {result['rows']} 行汇总")
+
+
+def init_app(app):
+    app.config.setdefault('ANALYTICS_ROLLUP_MODE', os.environ.get('ANALYTICS_ROLLUP_MODE', 'events'))
+    app.config.setdefault('ANALYTICS_ROLLUP_INTERVAL', 300)
+    app.config.setdefault('ANALYTICS_DASHBOARD_DAYS', 30)
+    if app.config['ANALYTICS_ROLLUP_MODE'] not in ('events', 'batch'):
+        raise ValueError(f"未知的 ANALYTICS_ROLLUP_MODE: {app.config['ANALYTICS_ROLLUP_MODE']}")
+    app.cli.add_command(analytics_cli)
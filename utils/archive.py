@@ -0,0 +1,215 @@
+"""冷热分离：把结束已久的活动及其子记录分批迁移到归档表
+
+列表、推荐等高频查询只关心即将开始或刚结束的活动，结束超过 ARCHIVE_AFTER_DAYS 天的
+活动连同参与记录、评论、点赞和通知一起移到 *_archive 表，热表和它们的索引保持较小。
+
+每一批在一个事务中执行：INSERT ... SELECT 复制到归档表，再按主键 DELETE 热表中的行。
+历史、导出和审核历史通过本模块的读取函数同时查询热表和归档表，调用方不需要关心数据在哪里。
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import abort, current_app
+from flask.cli import AppGroup
+
+from utils import similarity
+from utils.filters import ActivityFilter
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_JOB = 'archive.ended_activities'
+
+
+def _archive_pairs():
+    """(热表模型, 归档表模型, 关联活动的列名)，按插入顺序排列，删除时倒序"""
+    from models import (Activity, Participation, Comment, Like, Notification,
+                        ArchivedActivity, ArchivedParticipation, ArchivedComment, ArchivedLike,
+                        ArchivedNotification)
+    return [
+        (Activity, ArchivedActivity, 'id'),
+        (Participation, ArchivedParticipation, 'activity_id'),
+        (Comment, ArchivedComment, 'activity_id'),
+        (Like, ArchivedLike, 'activity_id'),
+        (Notification, ArchivedNotification, 'activity_id'),
+    ]
+
+
+def _move_rows(db, hot, archived, key, activity_ids, now):
+    columns = [column.name for column in hot.__table__.columns]
+    source = db.select(
+        *[hot.__table__.c[name] for name in columns],
+        db.literal(now, db.DateTime(timezone=True))
+    ).where(hot.__table__.c[key].in_(activity_ids))
+    result = db.session.execute(archived.__table__.insert().from_select(columns + ['archived_at'], source))
+    return result.rowcount
+
+
+def archive_ended_activities(days=None, batch_size=None, max_batches=None):
+    """把结束超过 days 天的活动分批归档，返回各表迁移的行数"""
+    from extensions import db
+    from models import Activity
+
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    pairs = _archive_pairs()
+    totals = {hot.__tablename__: 0 for hot, _, _ in pairs}
+    batches = 0
+    archived_ids = []
+    while max_batches is None or batches < max_batches:
+        activity_ids = db.session.scalars(
+            db.select(Activity.id)
+            .where(Activity.end_time < cutoff)
+            .order_by(Activity.id)
+            .limit(batch_size)
+        ).all()
+        if not activity_ids:
+            break
+        now = datetime.now(timezone.utc)
+        try:
+            for hot, archived, key in pairs:
+                totals[hot.__tablename__] += _move_rows(db, hot, archived, key, activity_ids, now)
+            # 先删子表再删活动，避免外键约束；相似活动只对热表有意义，不归档
+            similarity.delete_rows(activity_ids)
+            for hot, _, key in reversed(pairs):
+                db.session.execute(
+                    db.delete(hot)
+                    .where(hot.__table__.c[key].in_(activity_ids))
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        archived_ids.extend(activity_ids)
+        batches += 1
+    similarity.remove_from_index(archived_ids)
+    if batches:
+        logger.info('已归档 %d 批：%s', batches, totals)
+    return totals
+
+
+def get_activity(activity_id, hot_options=(), archived_options=()):
+    """按ID读取活动，热表中没有时查归档表，都没有返回 None"""
+    from extensions import db
+    from models import Activity, ArchivedActivity
+
+    activity = db.session.get(Activity, activity_id, options=hot_options)
+    if activity is None:
+        activity = db.session.get(ArchivedActivity, activity_id, options=archived_options)
+    return activity
+
+
+def get_activity_or_404(activity_id, hot_options=(), archived_options=()):
+    activity = get_activity(activity_id, hot_options, archived_options)
+    if activity is None:
+        abort(404)
+    return activity
+
+
+def is_participant(user_id, activity):
+    """用户是否报名了该活动（热表或归档表）"""
+    from extensions import db
+    from models import Participation, ArchivedParticipation
+
+    model = ArchivedParticipation if activity.is_archived else Participation
+    return db.session.scalar(
+        db.select(model.id).where(model.user_id == user_id, model.activity_id == activity.id).limit(1)
+    ) is not None
+
+
+def organized_activities(user_id, filters=None):
+    """用户发布的全部活动（含已归档），可按 ActivityFilter 筛选，按开始时间倒序"""
+    from extensions import db
+    from models import Activity, ArchivedActivity
+
+    filters = filters or ActivityFilter()
+    results = []
+    for model in (Activity, ArchivedActivity):
+        results.extend(filters.scalars('organized', lambda: db.select(model).where(
+            model.organizer_id == db.bindparam('organizer_id')
+        ).order_by(model.start_time.desc()), model=model, organizer_id=user_id))
+    return sorted(results, key=lambda activity: _as_utc(activity.start_time), reverse=True)
+
+
+def reviewed_activities(reviewer_id):
+    """审核员审核过的全部活动（含已归档），按审核时间倒序；发起人在同一条语句中取出"""
+    from extensions import db
+    from models import Activity, ArchivedActivity
+
+    results = []
+    for model in (Activity, ArchivedActivity):
+        results.extend(db.session.scalars(db.select(model).where(
+            model.reviewer_id == reviewer_id, model.review_status != 'pending'
+        ).options(db.joinedload(model.organizer)).order_by(model.review_time.desc())).all())
+    return sorted(results, key=lambda activity: _as_utc(activity.review_time), reverse=True)
+
+
+def _as_utc(value):
+    if value is None:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def user_notifications(user_id):
+    """用户的全部通知（含已归档），按时间倒序"""
+    from extensions import db
+    from models import Notification, ArchivedNotification
+
+    results = []
+    for model in (Notification, ArchivedNotification):
+        results.extend(db.session.scalars(
+            db.select(model).where(model.user_id == user_id).order_by(model.created_at.desc())
+        ).all())
+    return sorted(results, key=lambda notification: _as_utc(notification.created_at), reverse=True)
+
+
+def get_notification_or_404(notification_id):
+    from extensions import db
+    from models import Notification, ArchivedNotification
+
+    notification = db.session.get(Notification, notification_id) or db.session.get(ArchivedNotification, notification_id)
+    if notification is None:
+        abort(404)
+    return notification
+
+
+@job(ARCHIVE_JOB)
+def archive_ended_activities_job(payload, context):
+    totals = archive_ended_activities(days=payload.get('days'), batch_size=payload.get('batch_size'))
+    # 每天执行一次，已有排队中的任务时不重复排
+    from extensions import db
+    from models import Job
+    queued = db.session.scalar(
+        db.select(db.func.count(Job.id)).where(Job.name == ARCHIVE_JOB, Job.status == 'queued')
+    )
+    if not queued:
+        enqueue(ARCHIVE_JOB, payload, priority=-5, delay=current_app.config['ARCHIVE_INTERVAL'])
+    return totals
+
+
+archive_cli = AppGroup('archive', help='活动数据归档')
+
+
+@archive_cli.command('run')
+@click.option('--days', type=int, default=None, help='归档结束超过多少天的活动，默认 ARCHIVE_AFTER_DAYS')
+@click.option('--batch-size', type=int, default=None, help='每批活动数，默认 ARCHIVE_BATCH_SIZE')
+@click.option('--background', is_flag=True, help='提交为后台任务（之后每天自动执行），而不是立即执行')
+def run_command(days, batch_size, background):
+    """归档结束已久的活动及其参与、评论、点赞和通知"""
+    if background:
+        archive_job = enqueue(ARCHIVE_JOB, {'days': days, 'batch_size': batch_size}, priority=-5)
+        click.echo(f'已提交归档任务 {archive_job.id}')
+        return
+    totals = archive_ended_activities(days=days, batch_size=batch_size)
+    for table, count in totals.items():
+        click.echo(f'{table}: {count}')
+
+
+def init_app(app):
+    app.config.setdefault('ARCHIVE_AFTER_DAYS', 90)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 200)
+    app.config.setdefault('ARCHIVE_INTERVAL', 86400)
+    app.cli.add_command(archive_cli)
@@ -0,0 +1,297 @@
+"""批量生成电子票和胸牌的打印文件
+
+后台任务 badges.render 把一个活动的全部报名者排版到 A4 页面上，每人一张带签到二维码（与“我的电子票”相同，
+见 utils.checkin）的胸牌或门票，输出多页 PDF，或每页一张 PNG 打包成 zip：
+
+- 生成二维码和排版是 CPU 密集型工作，按页拆分到进程池（BADGE_RENDER_PROCESSES 个进程，默认 CPU 核数）里并行，
+  子进程只拿到纯数据（电子票、姓名、院系），不访问数据库也不需要应用上下文；进程数为 1 时直接在当前进程里渲染。
+- 页面按顺序收回，先写入临时的多页 TIFF，最后一次转成 PDF：内存里同时只有一页位图，几千人的活动也不会占用几 GB 内存。
+- 结果按名单版本缓存：名单版本是报名者（报名 id、姓名、院系）、活动标题/时间/场地、版式和签名密钥的摘要，
+  名单没有变化时再次提交直接返回已有文件；生成新版本后删除同一活动同一版式的旧文件。
+- 进度通过 JobContext 上报，前端轮询 /jobs/<id>。
+
+名字是中文时需要中文字体：BADGE_FONT_PATH 指定字体文件，未设置时在常见的系统字体路径中查找，都没有时退回 Pillow 内置字体（中文显示为方框）。
+"""
+import glob
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta, timezone
+
+from flask import current_app
+
+from utils.jobs import job
+
+logger = logging.getLogger(__name__)
+
+# 排版或绘制方式变化时加一，让旧的缓存文件失效
+RENDER_REVISION = 1
+A4_MM = (210, 297)
+PAGE_MARGIN_MM = 10
+LAYOUTS = {
+    # 胸牌：2 × 4，左侧姓名和院系，右侧二维码
+    'badge': {'label': '胸牌', 'columns': 2, 'rows': 4},
+    # 门票：3 × 5，二维码居中，下方姓名
+    'ticket': {'label': '门票', 'columns': 3, 'rows': 5},
+}
+FORMATS = ('pdf', 'png')
+FONT_CANDIDATES = (
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/wqy-microhei/wqy-microhei.ttc',
+    '/System/Library/Fonts/PingFang.ttc',
+    'C:/Windows/Fonts/msyh.ttc',
+)
+
+# 子进程内按 (字体文件, 字号) 缓存字体对象
+_fonts = {}
+
+
+def find_font():
+    path = current_app.config['BADGE_FONT_PATH']
+    if path:
+        return path
+    return next((candidate for candidate in FONT_CANDIDATES if os.path.exists(candidate)), None)
+
+
+def _font(path, size):
+    from PIL import ImageFont
+
+    key = (path, size)
+    if key not in _fonts:
+        _fonts[key] = ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+    return _fonts[key]
+
+
+def _fit(draw, text, font, width):
+    """按宽度截断文本"""
+    text = text or ''
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def _qr_image(token, size):
+    import qrcode
+    from PIL import Image
+
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=1, border=2)
+    code.add_data(token)
+    code.make(fit=True)
+    image = code.make_image().get_image().convert('L')
+    # 按整数倍放大，模块边缘保持清晰
+    scale = max(size // image.width, 1)
+    return image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+
+
+def render_page(spec):
+    """在子进程中渲染一页，返回 PNG 字节；spec 只包含可序列化的纯数据"""
+    from PIL import Image, ImageDraw
+
+    dpi = spec['dpi']
+    layout = LAYOUTS[spec['layout']]
+
+    def px(mm):
+        return int(round(mm * dpi / 25.4))
+
+    page = Image.new('L', (px(A4_MM[0]), px(A4_MM[1])), 255)
+    draw = ImageDraw.Draw(page)
+    margin = px(PAGE_MARGIN_MM)
+    cell_w = (page.width - 2 * margin) // layout['columns']
+    cell_h = (page.height - 2 * margin) // layout['rows']
+    pad = px(4)
+    title_font = _font(spec['font'], px(3.5))
+    name_font = _font(spec['font'], px(7 if spec['layout'] == 'badge' else 5))
+    small_font = _font(spec['font'], px(3))
+
+    for index, entry in enumerate(spec['entries']):
+        left = margin + (index % layout['columns']) * cell_w
+        top = margin + (index // layout['columns']) * cell_h
+        # 裁切线
+        draw.rectangle((left, top, left + cell_w, top + cell_h), outline=160)
+        inner_w = cell_w - 2 * pad
+        draw.text((left + pad, top + pad), _fit(draw, spec['title'], title_font, inner_w), font=title_font, fill=0)
+        draw.text((left + pad, top + pad + px(4.5)), _fit(draw, spec['time'], small_font, inner_w), font=small_font, fill=80)
+        if spec['layout'] == 'badge':
+            qr = _qr_image(entry['token'], cell_h - 2 * pad - px(10))
+            page.paste(qr, (left + cell_w - pad - qr.width, top + cell_h - pad - qr.height))
+            text_w = cell_w - 3 * pad - qr.width
+            name_top = top + cell_h // 2 - px(4)
+            draw.text((left + pad, name_top), _fit(draw, entry['name'], name_font, text_w), font=name_font, fill=0)
+            draw.text((left + pad, name_top + px(9)), _fit(draw, entry['department'], small_font, text_w),
+                      font=small_font, fill=60)
+            draw.text((left + pad, top + cell_h - pad - px(3)), f"#{entry['id']}", font=small_font, fill=120)
+        else:
+            qr = _qr_image(entry['token'], min(inner_w, cell_h - 2 * pad - px(18)))
+            page.paste(qr, (left + (cell_w - qr.width) // 2, top + pad + px(9)))
+            name = _fit(draw, entry['name'], name_font, inner_w)
+            name_left = left + (cell_w - int(draw.textlength(name, font=name_font))) // 2
+            draw.text((name_left, top + pad + px(9) + qr.height + px(1)), name, font=name_font, fill=0)
+            draw.text((left + pad, top + cell_h - pad - px(3)), f"#{entry['id']}", font=small_font, fill=120)
+
+    output = io.BytesIO()
+    page.save(output, 'PNG', optimize=False)
+    return output.getvalue()
+
+
+def load_roster(activity):
+    """返回 [{'id', 'token', 'name', 'department'}]，按报名 id 排序"""
+    from extensions import db
+    from models import Participation, User
+    from utils.checkin import sign_ticket
+
+    rows = db.session.execute(
+        db.select(Participation.id, Participation.activity_id, Participation.user_id, User.username, User.department)
+        .join(User, User.id == Participation.user_id)
+        .where(Participation.activity_id == activity.id)
+        .order_by(Participation.id)
+    ).all()
+    return [
+        {'id': row.id, 'token': sign_ticket(current_app.config, row), 'name': row.username,
+         'department': row.department or ''}
+        for row in rows
+    ]
+
+
+def roster_version(activity, entries, layout, fmt):
+    """名单版本：报名者、活动信息、版式和签名密钥任何一项变化都会得到新版本"""
+    from utils.checkin import activity_key
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'revision': RENDER_REVISION,
+        'layout': layout,
+        'format': fmt,
+        'dpi': current_app.config['BADGE_DPI'],
+        'font': find_font(),
+        'title': activity.title,
+        'start_time': activity.start_time.isoformat() if activity.start_time else None,
+        'venue': activity.venue.name if activity.venue else None,
+        'key': hashlib.sha256(activity_key(current_app.config, activity.id)).hexdigest(),
+        'entries': [[entry['id'], entry['name'], entry['department']] for entry in entries],
+    }, ensure_ascii=False, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def _page_specs(activity, entries, layout, font):
+    per_page = LAYOUTS[layout]['columns'] * LAYOUTS[layout]['rows']
+    start = activity.start_time.replace(tzinfo=timezone.utc) if activity.start_time.tzinfo is None else activity.start_time
+    start = start.astimezone(timezone(timedelta(hours=8)))
+    when = start.strftime('%Y-%m-%d %H:%M') + (f' · {activity.venue.name}' if activity.venue else '')
+    return [
+        {'layout': layout, 'dpi': current_app.config['BADGE_DPI'], 'font': font, 'title': activity.title,
+         'time': when, 'entries': entries[offset:offset + per_page]}
+        for offset in range(0, len(entries), per_page)
+    ]
+
+
+def _render_pages(specs, processes):
+    """按页的顺序逐个产出 PNG 字节"""
+    if processes <= 1 or len(specs) <= 1:
+        for spec in specs:
+            yield render_page(spec)
+        return
+    # 与 generate_data 相同：能 fork 时用 fork，子进程不必重新导入应用
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    with ProcessPoolExecutor(max_workers=min(processes, len(specs)), mp_context=context) as pool:
+        yield from pool.map(render_page, specs)
+
+
+def render_file(path, fmt, specs, processes, on_page=None):
+    """渲染全部页面写入 path（先写临时文件再替换），on_page(已完成页数) 用于上报进度"""
+    from PIL import Image, TiffImagePlugin
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    spool_path = f'{path}.{os.getpid()}.tiff'
+    try:
+        if fmt == 'png':
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+                for number, png in enumerate(_render_pages(specs, processes), 1):
+                    archive.writestr(f'page_{number:03d}.png', png)
+                    if on_page:
+                        on_page(number)
+        else:
+            with TiffImagePlugin.AppendingTiffWriter(spool_path, True) as spool:
+                for number, png in enumerate(_render_pages(specs, processes), 1):
+                    Image.open(io.BytesIO(png)).save(spool, 'TIFF', compression='packbits')
+                    spool.newFrame()
+                    if on_page:
+                        on_page(number)
+            with Image.open(spool_path) as pages:
+                pages.save(temp_path, 'PDF', save_all=True, resolution=specs[0]['dpi'])
+        os.replace(temp_path, path)
+    finally:
+        for leftover in (temp_path, spool_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def output_name(activity_id, layout, version, fmt):
+    extension = 'pdf' if fmt == 'pdf' else 'zip'
+    return os.path.join('badges', f'activity_{activity_id}_{layout}_{version}.{extension}')
+
+
+@job('badges.render')
+def render_badges_job(payload, context):
+    """后台任务：生成活动全部报名者的胸牌或门票打印文件"""
+    from extensions import db
+    from models import Activity
+
+    layout, fmt = payload.get('layout', 'badge'), payload.get('format', 'pdf')
+    if layout not in LAYOUTS or fmt not in FORMATS:
+        raise ValueError(f'未知的版式或格式: {layout}, {fmt}')
+    activity = db.session.get(Activity, payload['activity_id'])
+    if activity is None:
+        raise LookupError(f"活动 {payload['activity_id']} 不存在")
+    entries = load_roster(activity)
+    if not entries:
+        raise LookupError('活动还没有报名者')
+
+    activity_id = activity.id
+    version = roster_version(activity, entries, layout, fmt)
+    name = output_name(activity_id, layout, version, fmt)
+    output_folder = current_app.config['JOB_OUTPUT_FOLDER']
+    path = os.path.join(output_folder, name)
+    download_name = f"activity_{activity_id}_{layout}.{'pdf' if fmt == 'pdf' else 'zip'}"
+    result = {'file': name, 'download_name': download_name, 'version': version, 'participants': len(entries)}
+    if os.path.exists(path):
+        return dict(result, cached=True)
+
+    font = find_font()
+    if font is None:
+        logger.warning('没有找到中文字体，胸牌上的中文会显示为方框，请设置 BADGE_FONT_PATH')
+    specs = _page_specs(activity, entries, layout, font)
+    # 渲染期间不占用数据库连接；set_progress 会提交并使 activity 过期，之后只用上面取出的值
+    db.session.close()
+    context.set_progress(5)
+
+    reported = [5]
+
+    def on_page(done):
+        progress = 5 + 90 * done // len(specs)
+        if progress - reported[0] >= 5:
+            reported[0] = progress
+            context.set_progress(progress)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    render_file(path, fmt, specs, current_app.config['BADGE_RENDER_PROCESSES'], on_page)
+    # 同一活动、同一版式、同一格式的旧版本已经过时；另一种格式的文件可能还有任务在提供下载，保留
+    extension = os.path.splitext(path)[1]
+    for stale in glob.glob(os.path.join(output_folder, 'badges', f'activity_{activity_id}_{layout}_*{extension}')):
+        if os.path.basename(stale) != os.path.basename(path):
+            os.remove(stale)
+    return dict(result, cached=False, pages=len(specs))
+
+
+def init_app(app):
+    app.config.setdefault('BADGE_RENDER_PROCESSES', int(os.environ.get('BADGE_RENDER_PROCESSES', os.cpu_count() or 1)))
+    app.config.setdefault('BADGE_DPI', int(os.environ.get('BADGE_DPI', 150)))
+    app.config.setdefault('BADGE_FONT_PATH', os.environ.get('BADGE_FONT_PATH'))
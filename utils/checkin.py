@@ -0,0 +1,289 @@
+"""现场扫码签到：签名电子票、批量写入的签到队列和离线名单
+
+电子票是报名记录的签名：`c1.<报名id>.<活动id>.<用户id>.<签名>`，签名为活动密钥对前面几段的 HMAC-SHA256
+（base64url，取前 22 个字符）。活动密钥由 CHECKIN_SECRET（默认 SECRET_KEY）按活动 id 派生，
+泄露一个活动的密钥只能伪造这个活动的票。
+
+- 签到接口只做 HMAC 校验，不读数据库：扫码设备带着发起人签发的扫码令牌（itsdangerous，有效期 CHECKIN_SCANNER_TTL），
+  请求里不访问 current_user；同一进程内扫过的票记在内存里，重复扫码直接提示“已签到”。
+- 签名不能撤销，退出活动后电子票仍能通过校验：退出时本进程记下该报名，之后扫码返回 not_registered；
+  其他进程在批量写入时发现报名记录已不存在，也记下来，之后同样返回 not_registered。
+  因此另一个进程收到的第一次扫码仍可能答复 checked_in，扫码页面以离线名单为准（名单只含当前的报名者，定期刷新）。
+- 签到结果交给 CheckinWriter 写入：后台线程每 CHECKIN_FLUSH_INTERVAL 秒或攒够 CHECKIN_BATCH_SIZE 条，
+  用一条 executemany 的 UPDATE 批量写 checked_in_at；只更新还没签到的行，重复提交和多进程并发都不会覆盖最早的签到时间。
+- 离线名单包含活动密钥和报名者列表，扫码页面下载后保存在浏览器里，断网时在本地校验签名并记录，
+  联网后把离线期间的记录连同扫码时间一起补交。进程崩溃时队列中尚未写入的记录会丢失，扫码页面会在收到确认前一直保留它们。
+"""
+import atexit
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.exc import SQLAlchemyError
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TICKET_VERSION = 'c1'
+SIGNATURE_LENGTH = 22
+
+SCANS = registry.counter('app_checkin_scans_total', '签到扫码次数', ('result',))
+BATCH_ROWS = registry.histogram('app_checkin_batch_rows', '每批写入的签到记录数', (),
+                                buckets=(1, 5, 10, 50, 100, 200, 500, 1000))
+
+Ticket = namedtuple('Ticket', 'participation_id activity_id user_id')
+
+
+def _master_key(config):
+    secret = config.get('CHECKIN_SECRET') or config['SECRET_KEY']
+    return secret if isinstance(secret, bytes) else secret.encode()
+
+
+def activity_key(config, activity_id):
+    """派生活动密钥（32 字节）；离线名单中以 base64url 下发给扫码页面"""
+    return hmac.new(_master_key(config), f'checkin-activity:{activity_id}'.encode(), hashlib.sha256).digest()
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _signature(key, message):
+    return _b64(hmac.new(key, message.encode(), hashlib.sha256).digest())[:SIGNATURE_LENGTH]
+
+
+def sign_ticket(config, participation):
+    message = f'{TICKET_VERSION}.{participation.id}.{participation.activity_id}.{participation.user_id}'
+    return f'{message}.{_signature(activity_key(config, participation.activity_id), message)}'
+
+
+def verify_ticket(config, token):
+    """校验电子票，签名正确时返回 Ticket，否则返回 None"""
+    parts = token.strip().split('.') if token else []
+    if len(parts) != 5 or parts[0] != TICKET_VERSION or not all(part.isdigit() for part in parts[1:4]):
+        return None
+    message, signature = token.strip().rsplit('.', 1)
+    expected = _signature(activity_key(config, int(parts[2])), message)
+    if not hmac.compare_digest(signature, expected):
+        return None
+    return Ticket(int(parts[1]), int(parts[2]), int(parts[3]))
+
+
+def _scanner_serializer(config):
+    return URLSafeTimedSerializer(_master_key(config), salt='checkin-scanner')
+
+
+def issue_scanner_token(config, activity_id, user_id):
+    return _scanner_serializer(config).dumps({'activity_id': activity_id, 'user_id': user_id})
+
+
+def load_scanner_token(config, token):
+    """返回扫码令牌对应的活动 id，令牌无效或过期时返回 None"""
+    try:
+        data = _scanner_serializer(config).loads(token, max_age=config['CHECKIN_SCANNER_TTL'])
+    except BadSignature:
+        return None
+    return data.get('activity_id')
+
+
+def build_roster(config, activity):
+    """扫码页面使用的离线名单：活动密钥 + 全部报名者及其签到状态"""
+    from extensions import db
+    from models import Participation, User
+
+    rows = db.session.execute(
+        db.select(Participation.id, Participation.user_id, Participation.checked_in_at,
+                  User.username, User.department)
+        .join(User, User.id == Participation.user_id)
+        .where(Participation.activity_id == activity.id)
+        .order_by(Participation.id)
+    )
+    return {
+        'activity_id': activity.id,
+        'title': activity.title,
+        'key': _b64(activity_key(config, activity.id)),
+        'signature_length': SIGNATURE_LENGTH,
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'participants': [
+            {
+                'id': row.id,
+                'user_id': row.user_id,
+                'username': row.username,
+                'department': row.department,
+                'checked_in_at': _as_utc(row.checked_in_at).isoformat(timespec='seconds') if row.checked_in_at else None
+            }
+            for row in rows
+        ]
+    }
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class CheckinWriter:
+    """把签到记录攒成批写入 participation 的后台队列
+
+    - 背压：队列有界，已满时 submit 最多阻塞 CHECKIN_PUT_TIMEOUT 秒，仍放不进去则在调用方线程直接写入。
+    - 分批：取到第一条记录后最多再等 CHECKIN_FLUSH_INTERVAL 秒，把期间到达的记录合成一批（同一报名只保留最早的时间）。
+    - 重试：一批失败时回滚并按指数退避重试。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._worker = None
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._withdrawn = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHECKIN_QUEUE_SIZE', 10000)
+        app.config.setdefault('CHECKIN_BATCH_SIZE', 500)
+        app.config.setdefault('CHECKIN_FLUSH_INTERVAL', 0.2)
+        app.config.setdefault('CHECKIN_MAX_RETRIES', 3)
+        app.config.setdefault('CHECKIN_RETRY_DELAY', 0.5)
+        app.config.setdefault('CHECKIN_PUT_TIMEOUT', 1.0)
+        # 进程内记住的已签到报名数和已退出的报名数，用于不查库地提示重复扫码和未报名
+        app.config.setdefault('CHECKIN_SEEN_SIZE', 100000)
+        # 为空时用 SECRET_KEY；多 worker 部署时两者都必须在所有进程中一致，否则一个进程签发的票另一个进程不认
+        app.config.setdefault('CHECKIN_SECRET', os.environ.get('CHECKIN_SECRET'))
+        app.config.setdefault('CHECKIN_SCANNER_TTL', 24 * 3600)
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['CHECKIN_QUEUE_SIZE'])
+        app.extensions['checkin_writer'] = self
+
+    def submit(self, participation_id, checked_in_at):
+        """提交一条签到，返回 'checked_in'；本进程已经签到过这张票时返回 'duplicate'，
+        已知报名已退出时返回 'not_registered'，两者都不写入"""
+        with self._seen_lock:
+            if participation_id in self._withdrawn:
+                return 'not_registered'
+            if participation_id in self._seen:
+                return 'duplicate'
+            self._seen[participation_id] = True
+            if len(self._seen) > self.app.config['CHECKIN_SEEN_SIZE']:
+                self._seen.popitem(last=False)
+        self._ensure_worker()
+        try:
+            self._queue.put((participation_id, checked_in_at), timeout=self.app.config['CHECKIN_PUT_TIMEOUT'])
+        except queue.Full:
+            logger.warning('签到队列已满，在请求线程中直接写入')
+            self.write([(participation_id, checked_in_at)])
+        return 'checked_in'
+
+    def revoke(self, participation_ids):
+        """记下已退出的报名，本进程之后收到这些电子票时返回 not_registered"""
+        with self._seen_lock:
+            for participation_id in participation_ids:
+                self._seen.pop(participation_id, None)
+                self._withdrawn[participation_id] = True
+                self._withdrawn.move_to_end(participation_id)
+            limit = self.app.config['CHECKIN_SEEN_SIZE'] if self.app is not None else 0
+            while limit and len(self._withdrawn) > limit:
+                self._withdrawn.popitem(last=False)
+
+    def flush(self, timeout=10.0):
+        """等待队列中的记录全部写入（用于脚本、基准测试和进程退出），返回是否在超时前完成"""
+        if self._queue is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline or self._worker is None or not self._worker.is_alive():
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='checkin-writer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.app.config['CHECKIN_FLUSH_INTERVAL']
+            batch_size = self.app.config['CHECKIN_BATCH_SIZE']
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self.write(batch)
+            except Exception:
+                logger.exception('写入 %d 条签到记录失败', len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def write(self, items):
+        """把 [(报名id, 签到时间)] 写入数据库，已签到的行保持不变，返回写入的记录数
+
+        报名记录已不存在（报名者已退出）的票由 revoke() 记下，不计入返回值。
+        """
+        from extensions import db
+        from models import Participation
+
+        earliest = {}
+        for participation_id, checked_in_at in items:
+            if participation_id not in earliest or checked_in_at < earliest[participation_id]:
+                earliest[participation_id] = checked_in_at
+        rows = [{'participation_id': key, 'checked_in_at_value': value} for key, value in earliest.items()]
+        table = Participation.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == db.bindparam('participation_id'), table.c.checked_in_at.is_(None))
+            .values(status='checked_in', checked_in_at=db.bindparam('checked_in_at_value'))
+        )
+        max_retries = self.app.config['CHECKIN_MAX_RETRIES']
+        delay = self.app.config['CHECKIN_RETRY_DELAY']
+        for attempt in range(max_retries + 1):
+            try:
+                db.session.execute(statement, rows)
+                existing = set(db.session.scalars(
+                    db.select(table.c.id).where(table.c.id.in_(list(earliest)))
+                ))
+                db.session.commit()
+                BATCH_ROWS.observe((), len(rows))
+                withdrawn = [key for key in earliest if key not in existing]
+                if withdrawn:
+                    logger.warning('%d 张电子票对应的报名已退出，未签到: %s', len(withdrawn), withdrawn[:20])
+                    self.revoke(withdrawn)
+                return len(rows) - len(withdrawn)
+            except SQLAlchemyError:
+                db.session.rollback()
+                if attempt == max_retries:
+                    logger.exception('写入 %d 条签到记录失败，已放弃', len(rows))
+                    return 0
+                logger.warning('写入签到记录失败，%.1f 秒后第 %d 次重试', delay * 2 ** attempt, attempt + 1)
+                time.sleep(delay * 2 ** attempt)
+
+
+def _flush_on_exit():
+    from extensions import checkin_writer
+
+    if checkin_writer.app is not None:
+        checkin_writer.flush(timeout=5.0)
+
+
+atexit.register(_flush_on_exit)
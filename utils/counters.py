@@ -0,0 +1,224 @@
+"""用户统计数（发起、参与、点赞、评论）和活动计数（报名、点赞、评论）的维护
+
+个人中心的头部统计直接读 user 表上的计数列，不再对活动、报名、点赞和评论表做 COUNT。
+计数包含归档表中的记录（归档只是搬移，不改变计数），由各写操作在同一事务中用
+`SET x = x + :delta` 原子增减，并发请求不会互相覆盖。
+
+活动上的 current_participants、likes_count、comments_count 同样随写操作增减，但请求失败、手工改库或
+seed.py 造数据后会和实际记录对不上。`flask counters reconcile` 按活动 id 分批校正（见 reconcile_activity_counters），
+再调用 recount_user_counters() 重算用户计数，可以在线上运行。
+"""
+import logging
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+USER_COUNTERS = ('organized_count', 'joined_count', 'likes_given_count', 'comments_count')
+ACTIVITY_COUNTERS = ('current_participants', 'likes_count', 'comments_count')
+RECONCILE_JOB = 'counters.reconcile'
+
+
+def bump_user_counters(user_id, **deltas):
+    """在当前事务中增减用户计数，例如 bump_user_counters(uid, joined_count=1)"""
+    from extensions import db
+    from models import User
+
+    if user_id is None or not deltas:
+        return
+    db.session.execute(
+        db.update(User)
+        .where(User.id == user_id)
+        .values({name: getattr(User, name) + delta for name, delta in deltas.items()})
+    )
+
+
+def release_activity_counters(activity):
+    """删除活动时调用：扣减发起人的发起数
+
+    报名、点赞和评论由 utils.purge 的清理任务分块删除，对应的用户计数在删除同一事务中按块扣减。
+    """
+    bump_user_counters(activity.organizer_id, organized_count=-1)
+
+
+def recount_user_counters(batch_size=1000):
+    """按实际记录（热表 + 归档表）重算全部用户的计数，用于填充数据和修正偏差，返回改动的用户数
+
+    每张表只做一次 GROUP BY，与 user 表现有的值比较后，只把不一致的用户按主键批量更新。
+    （逐用户的关联子查询在没有索引的列上是 用户数 × 行数 的扫描，百万级数据下要跑几十分钟。）
+    """
+    from extensions import db
+    from models import (User, Activity, Participation, Like, Comment,
+                        ArchivedActivity, ArchivedParticipation, ArchivedLike, ArchivedComment)
+
+    sources = {
+        'organized_count': (Activity.organizer_id, ArchivedActivity.organizer_id),
+        'joined_count': (Participation.user_id, ArchivedParticipation.user_id),
+        'likes_given_count': (Like.user_id, ArchivedLike.user_id),
+        'comments_count': (Comment.user_id, ArchivedComment.user_id),
+    }
+    expected = {}
+    for name, columns in sources.items():
+        for column in columns:
+            rows = db.session.execute(
+                db.select(column, db.func.count()).where(column.is_not(None)).group_by(column)
+            )
+            for user_id, count in rows:
+                expected.setdefault(user_id, dict.fromkeys(USER_COUNTERS, 0))[name] += count
+
+    zero = dict.fromkeys(USER_COUNTERS, 0)
+    changes = []
+    for row in db.session.execute(db.select(User.id, *(getattr(User, name) for name in USER_COUNTERS))):
+        values = expected.get(row.id, zero)
+        if any(getattr(row, name) != values[name] for name in USER_COUNTERS):
+            changes.append({'id': row.id, **values})
+    for offset in range(0, len(changes), batch_size):
+        db.session.execute(db.update(User), changes[offset:offset + batch_size])
+    db.session.commit()
+    return len(changes)
+
+
+def _activity_sources():
+    """(活动表, {计数列: 子表})，热表和归档表各自独立校正"""
+    from models import (Activity, Participation, Like, Comment,
+                        ArchivedActivity, ArchivedParticipation, ArchivedLike, ArchivedComment)
+    return [
+        (Activity, {'current_participants': Participation, 'likes_count': Like, 'comments_count': Comment}),
+        (ArchivedActivity, {'current_participants': ArchivedParticipation, 'likes_count': ArchivedLike,
+                            'comments_count': ArchivedComment}),
+    ]
+
+
+def reconcile_activity_counters(batch_size=None, dry_run=False, pause=None, samples=10):
+    """按实际的报名、点赞、评论记录校正活动计数，返回 {表名: 偏差报告}
+
+    按主键顺序每次取 batch_size 个活动，对这段 id 区间的每张子表做一次 GROUP BY activity_id（走外键索引），
+    与计数列比较后只更新有偏差的行。每批是一个短事务：读取在同一个快照里，更新时带上读到的旧值作为条件
+    （UPDATE ... WHERE id = :id AND current_participants = :旧值 ...），期间有并发报名、点赞或评论改过计数的行
+    不会被覆盖，计入 skipped，下次运行再校正。批与批之间休眠 pause 秒，给线上写入让路。
+    """
+    from extensions import db
+
+    batch_size = batch_size or current_app.config['COUNTER_RECONCILE_BATCH_SIZE']
+    pause = current_app.config['COUNTER_RECONCILE_PAUSE'] if pause is None else pause
+    reports = {}
+    for model, sources in _activity_sources():
+        table = model.__table__
+        report = reports[table.name] = {
+            'scanned': 0, 'drifted': 0, 'updated': 0, 'skipped': 0,
+            'counters': {name: {'rows': 0, 'total': 0, 'max': 0, 'samples': []} for name in sources},
+        }
+        # NULL 视为 -1：旧数据里为空的计数同样需要校正，而 NULL = NULL 不成立
+        statement = db.update(table).where(
+            table.c.id == db.bindparam('b_id'),
+            *(db.func.coalesce(table.c[name], -1) == db.bindparam(f'b_old_{name}') for name in sources)
+        ).values({name: db.bindparam(f'b_{name}') for name in sources})
+
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(table.c.id, *(table.c[name] for name in sources))
+                .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            low, last_id = rows[0].id, rows[-1].id
+            expected = {}
+            for name, child in sources.items():
+                column = child.__table__.c.activity_id
+                expected[name] = dict(db.session.execute(
+                    db.select(column, db.func.count()).where(column.between(low, last_id)).group_by(column)
+                ).all())
+
+            changes = []
+            for row in rows:
+                values = {name: expected[name].get(row.id, 0) for name in sources}
+                if all(getattr(row, name) == values[name] for name in sources):
+                    continue
+                for name in sources:
+                    observed = getattr(row, name)
+                    if observed == values[name]:
+                        continue
+                    stats = report['counters'][name]
+                    drift = values[name] - (observed or 0)
+                    stats['rows'] += 1
+                    stats['total'] += abs(drift)
+                    stats['max'] = max(stats['max'], abs(drift))
+                    if len(stats['samples']) < samples:
+                        stats['samples'].append((row.id, observed, values[name]))
+                changes.append({
+                    'b_id': row.id,
+                    **{f'b_old_{name}': -1 if getattr(row, name) is None else getattr(row, name) for name in sources},
+                    **{f'b_{name}': values[name] for name in sources},
+                })
+            report['scanned'] += len(rows)
+            report['drifted'] += len(changes)
+            if changes and not dry_run:
+                updated = db.session.execute(statement, changes).rowcount
+                report['updated'] += updated
+                report['skipped'] += len(changes) - updated
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            if pause:
+                time.sleep(pause)
+        logger.info('%s 计数校正：扫描 %d 行，偏差 %d 行，更新 %d 行，跳过 %d 行', table.name,
+                    report['scanned'], report['drifted'], report['updated'], report['skipped'])
+    return reports
+
+
+def format_drift_report(reports):
+    """偏差报告的文本形式，命令行和日志共用"""
+    lines = []
+    for table, report in reports.items():
+        lines.append(f"{table}: 扫描 {report['scanned']} 行，偏差 {report['drifted']} 行，"
+                     f"已更新 {report['updated']} 行，并发修改跳过 {report['skipped']} 行")
+        for name, stats in report['counters'].items():
+            if not stats['rows']:
+                continue
+            samples = '，'.join(f'#{activity_id} {old}→{new}' for activity_id, old, new in stats['samples'])
+            lines.append(f"  {name}: {stats['rows']} 行，偏差合计 {stats['total']}，最大 {stats['max']}；{samples}")
+    return '\n'.join(lines)
+
+
+@job(RECONCILE_JOB)
+def reconcile_job(payload, context):
+    """后台任务：校正活动计数和用户计数"""
+    reports = reconcile_activity_counters(batch_size=payload.get('batch_size'), dry_run=payload.get('dry_run', False))
+    context.set_progress(90)
+    users = None if payload.get('dry_run') else recount_user_counters()
+    return {'activities': reports, 'users': users}
+
+
+counters_cli = AppGroup('counters', help='计数列校正')
+
+
+@counters_cli.command('reconcile')
+@click.option('--batch-size', type=int, default=None, help='每批活动数，默认 COUNTER_RECONCILE_BATCH_SIZE')
+@click.option('--pause', type=float, default=None, help='批间休眠秒数，默认 COUNTER_RECONCILE_PAUSE')
+@click.option('--dry-run', is_flag=True, help='只报告偏差，不写入')
+@click.option('--skip-users', is_flag=True, help='不重算用户计数')
+@click.option('--background', is_flag=True, help='提交为后台任务，而不是立即执行')
+def reconcile_command(batch_size, pause, dry_run, skip_users, background):
+    """按实际记录校正活动的报名数、点赞数、评论数和用户计数，并报告偏差"""
+    if background:
+        queued = enqueue(RECONCILE_JOB, {'batch_size': batch_size, 'dry_run': dry_run}, priority=-5)
+        click.echo(f'已提交计数校正任务 {queued.id}')
+        return
+    started = time.perf_counter()
+    click.echo(format_drift_report(reconcile_activity_counters(batch_size=batch_size, dry_run=dry_run, pause=pause)))
+    if not dry_run and not skip_users:
+        click.echo(f'用户计数：修正 {recount_user_counters()} 个用户')
+    click.echo(f'耗时 {time.perf_counter() - started:.1f} 秒')
+
+
+def init_app(app):
+    app.config.setdefault('COUNTER_RECONCILE_BATCH_SIZE', 1000)
+    app.config.setdefault('COUNTER_RECONCILE_PAUSE', 0.0)
+    app.cli.add_command(counters_cli)
@@ -0,0 +1,192 @@
+"""活动计数变更的发布/订阅，用于 Server-Sent Events 推送
+
+每个 worker 进程内有一个 EventBroker，SSE 连接订阅若干频道（每个活动一个频道），
+报名、退出、点赞在提交后发布最新计数。
+
+后端：
+- memory：只在当前进程内分发，适用于单 worker。
+- spool：多 worker 的本地替代方案。所有进程把事件追加写入同一个共享文件，
+  每个进程用一个后台线程读取文件尾部并分发给本进程的订阅者。
+  文件超过 EVENT_SPOOL_MAX_BYTES 时由写入者改名为 <路径>.1（覆盖上一个），读取线程读完旧文件后切换到新文件。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def activity_channel(activity_id):
+    return f'activity:{activity_id}'
+
+
+class Subscription:
+    """一个 SSE 连接的订阅，持有一个有界队列"""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        # 计数消息是最新快照，消费过慢时丢弃最旧的一条即可，不阻塞发布者
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """进程内的发布/订阅中心"""
+
+    def __init__(self, app=None):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._backend = 'memory'
+        self._spool_path = None
+        self._spool_max_bytes = 0
+        self._tail_thread = None
+        self._queue_size = 100
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_BROKER_BACKEND', os.environ.get('EVENT_BROKER_BACKEND', 'memory'))
+        app.config.setdefault('EVENT_SPOOL_PATH', os.environ.get(
+            'EVENT_SPOOL_PATH', os.path.join(app.instance_path, 'events.spool')))
+        app.config.setdefault('EVENT_SPOOL_MAX_BYTES', 16 * 1024 * 1024)
+        app.config.setdefault('EVENT_SUBSCRIBER_QUEUE_SIZE', 100)
+        app.config.setdefault('EVENT_HEARTBEAT_INTERVAL', 15)
+        self._backend = app.config['EVENT_BROKER_BACKEND']
+        self._spool_path = app.config['EVENT_SPOOL_PATH']
+        self._spool_max_bytes = app.config['EVENT_SPOOL_MAX_BYTES']
+        self._queue_size = app.config['EVENT_SUBSCRIBER_QUEUE_SIZE']
+        if self._backend not in ('memory', 'spool'):
+            raise ValueError(f'未知的 EVENT_BROKER_BACKEND: {self._backend}')
+        app.extensions['event_broker'] = self
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len({id(sub) for subs in self._subscribers.values() for sub in subs})
+
+    def subscribe(self, channels):
+        if self._backend == 'spool':
+            self._ensure_tail_thread()
+        subscription = Subscription(self, channels, self._queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subs = self._subscribers.get(channel)
+                if subs:
+                    subs.discard(subscription)
+                    if not subs:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, data):
+        message = {'channel': channel, 'data': data}
+        if self._backend == 'spool':
+            self._append_to_spool(message)
+        else:
+            self._dispatch(message)
+
+    def _dispatch(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(message['channel'], ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def _append_to_spool(self, message):
+        line = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        os.makedirs(os.path.dirname(self._spool_path), exist_ok=True)
+        # O_APPEND 下单次小于 PIPE_BUF 的写入在多进程间是原子的
+        fd = os.open(self._spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            if self._spool_max_bytes and os.fstat(fd).st_size > self._spool_max_bytes:
+                self._rotate_spool(fd)
+        finally:
+            os.close(fd)
+
+    def _rotate_spool(self, fd):
+        # 读取线程只从文件末尾读，旧文件保留一份供还没读完的线程读完；
+        # 只在路径仍指向刚写入的文件时改名，避免并发写入者把别人刚轮转出的新文件再改名一次
+        try:
+            if os.stat(self._spool_path).st_ino == os.fstat(fd).st_ino:
+                os.replace(self._spool_path, f'{self._spool_path}.1')
+        except FileNotFoundError:
+            pass
+
+    def _ensure_tail_thread(self):
+        if self._tail_thread is not None and self._tail_thread.is_alive():
+            return
+        with self._lock:
+            if self._tail_thread is None or not self._tail_thread.is_alive():
+                self._tail_thread = threading.Thread(target=self._tail_spool, name='event-spool-tail', daemon=True)
+                self._tail_thread.start()
+
+    def _tail_spool(self):
+        os.makedirs(os.path.dirname(self._spool_path), exist_ok=True)
+        open(self._spool_path, 'ab').close()
+        spool = open(self._spool_path, 'rb')
+        # 只关心订阅之后的事件，从文件末尾开始读
+        spool.seek(0, os.SEEK_END)
+        buffer = b''
+        while True:
+            chunk = spool.readline()
+            if not chunk:
+                try:
+                    current = os.stat(self._spool_path)
+                except FileNotFoundError:
+                    current = None
+                if current is not None and current.st_ino != os.fstat(spool.fileno()).st_ino:
+                    # 已轮转：旧文件已读完，从头读新文件
+                    spool.close()
+                    spool = open(self._spool_path, 'rb')
+                    buffer = b''
+                    continue
+                # 文件被外部截断时从头开始
+                if current is not None and current.st_size < spool.tell():
+                    spool.seek(0)
+                time.sleep(0.05)
+                continue
+            buffer += chunk
+            if not buffer.endswith(b'\n'):
+                continue
+            try:
+                self._dispatch(json.loads(buffer))
+            except ValueError:
+                logger.warning('忽略无法解析的事件: %r', buffer[:200])
+            buffer = b''
+
+
+def publish_activity_counts(broker, activity):
+    """发布活动的最新报名人数和点赞数"""
+    broker.publish(activity_channel(activity.id), {
+        'activity_id': activity.id,
+        'current_participants': activity.current_participants or 0,
+        'max_participants': activity.max_participants or 0,
+        'likes_count': activity.likes_count or 0
+    })
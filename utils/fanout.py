@@ -0,0 +1,122 @@
+"""活动变更通知的异步扇出
+
+请求处理函数只写入一个 notifications.fanout 任务（utils.jobs 的任务表），由后台任务工作进程
+按批次为所有报名者写入 Notification，避免在请求内逐条插入成千上万行。事件与任务一起持久化在数据库中，
+web 进程重启或崩溃不会丢失尚未投递的通知。
+"""
+import logging
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+FANOUT_JOB = 'notifications.fanout'
+
+
+class NotificationFanout:
+    """把活动事件扇出为报名者通知。
+
+    - 持久化：每个事件是任务表中的一行，高于维护类任务的优先级执行；工作进程未运行时事件留在表中，启动后补发。
+    - 分批：按 Participation.id 做键集分页，每批一次多行 INSERT 并提交。
+    - 重试：单批失败时回滚并按指数退避重试，仍然失败时任务失败，由任务系统整体重试。
+      投递是至少一次：整体重试或工作进程在扇出中途崩溃后重新执行时，已提交批次的接收者可能收到重复的通知。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFICATION_FANOUT_CHUNK_SIZE', 500)
+        app.config.setdefault('NOTIFICATION_FANOUT_MAX_RETRIES', 3)
+        app.config.setdefault('NOTIFICATION_FANOUT_RETRY_DELAY', 0.5)
+        self.app = app
+        app.extensions['notification_fanout'] = self
+
+    def enqueue(self, event):
+        """提交一个扇出事件（写入任务表并提交），返回 Job。
+
+        event 字段：
+            notification_type: 'activity_updated' 或 'activity_cancelled'
+            activity_id:       活动ID（活动已删除时为 None）
+            activity_title:    活动标题
+            detail:            变更说明
+            source_activity_id: 从该活动的报名记录中查找接收者
+            user_ids:          显式指定接收者
+        """
+        return enqueue(FANOUT_JOB, event, priority=8)
+
+    def deliver(self, event):
+        """分批为事件的所有接收者写入通知，返回写入的通知数"""
+        from extensions import db
+        from models import Participation, Notification
+
+        chunk_size = self.app.config['NOTIFICATION_FANOUT_CHUNK_SIZE']
+        created_at = datetime.now(timezone.utc)
+
+        def build_rows(user_ids):
+            return [
+                {
+                    'user_id': user_id,
+                    'activity_id': event.get('activity_id'),
+                    'notification_type': event['notification_type'],
+                    'activity_title': event.get('activity_title'),
+                    'detail': event.get('detail'),
+                    'is_read': False,
+                    'created_at': created_at
+                }
+                for user_id in user_ids
+            ]
+
+        delivered = 0
+        if event.get('user_ids') is not None:
+            user_ids = list(event['user_ids'])
+            for i in range(0, len(user_ids), chunk_size):
+                delivered += self._insert_with_retry(db, Notification, build_rows(user_ids[i:i + chunk_size]))
+            return delivered
+
+        # 键集分页：每批只取 id > 上一批最后一个 id 的报名记录
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(Participation.id, Participation.user_id)
+                .where(Participation.activity_id == event['source_activity_id'], Participation.id > last_id)
+                .order_by(Participation.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            user_ids = [row.user_id for row in rows if row.user_id is not None]
+            delivered += self._insert_with_retry(db, Notification, build_rows(user_ids))
+        return delivered
+
+    def _insert_with_retry(self, db, model, rows):
+        if not rows:
+            return 0
+        max_retries = self.app.config['NOTIFICATION_FANOUT_MAX_RETRIES']
+        delay = self.app.config['NOTIFICATION_FANOUT_RETRY_DELAY']
+        for attempt in range(max_retries + 1):
+            try:
+                db.session.execute(db.insert(model), rows)
+                db.session.commit()
+                return len(rows)
+            except SQLAlchemyError:
+                db.session.rollback()
+                if attempt == max_retries:
+                    logger.error('写入 %d 条通知失败，交给任务系统重试', len(rows))
+                    raise
+                logger.warning('写入通知失败，%.1f 秒后第 %d 次重试', delay * 2 ** attempt, attempt + 1)
+                time.sleep(delay * 2 ** attempt)
+
+
+@job(FANOUT_JOB)
+def fanout_job(payload, context):
+    from flask import current_app
+
+    return {'delivered': current_app.extensions['notification_fanout'].deliver(payload)}
@@ -0,0 +1,155 @@
+"""活动列表页共用的筛选条件
+
+首页、我的活动和审核列表都按 类型/场地/日期/状态/标题 筛选。ActivityFilter 只解析一次请求参数，
+筛选值全部用 bindparam 占位，同一组“生效的筛选项”只构建一次语句并缓存在进程内；
+之后的请求直接取出缓存的语句，带上参数执行。语句对象不变，SQLAlchemy 的缓存键和编译结果也随之复用，
+每个请求不再重新构建语句树、生成缓存键和编译 SQL。
+
+    filters = ActivityFilter.from_request()
+    activities = filters.paginate(
+        'index', lambda: db.select(Activity).where(Activity.is_approved == True).order_by(...),
+        page=page, per_page=9
+    )
+
+基础语句中如果有其他参数（例如当前用户ID），同样写成 bindparam，执行时作为关键字参数传入。
+"""
+from datetime import datetime, timedelta
+
+from flask import request
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import bindparam, func
+
+LIFECYCLE_FILTERS = ('upcoming', 'ongoing', 'ended')
+
+# (语句名, 模型, 生效的筛选项, 变体) -> 语句
+_statement_cache = {}
+
+
+def parse_date(value):
+    """解析 YYYY-MM-DD，格式不对时返回 None（与原先忽略无效日期的行为一致）"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _cached(cache_key, build):
+    statement = _statement_cache.get(cache_key)
+    if statement is None:
+        # 并发时可能重复构建一次，结果相同，无需加锁
+        statement = _statement_cache[cache_key] = build()
+    return statement
+
+
+def _default_model(model):
+    if model is None:
+        from models import Activity
+        model = Activity
+    return model
+
+
+class ActivityFilter:
+    """活动列表的筛选条件，原始参数保留给模板回显"""
+
+    def __init__(self, activity_type_id=None, venue_id=None, start_date='', end_date='', status='', search=''):
+        self.activity_type_id = activity_type_id
+        self.venue_id = venue_id
+        self.start_date = start_date or ''
+        self.end_date = end_date or ''
+        self.start_dt = parse_date(self.start_date)
+        self.end_dt = parse_date(self.end_date)
+        self.status = status or ''
+        self.search = search or ''
+
+    @classmethod
+    def from_request(cls, args=None):
+        args = request.args if args is None else args
+        return cls(
+            activity_type_id=args.get('activity_type_id', type=int),
+            venue_id=args.get('venue_id', type=int),
+            start_date=args.get('start_date', ''),
+            end_date=args.get('end_date', ''),
+            status=args.get('status', ''),
+            search=args.get('search', '')
+        )
+
+    @property
+    def params(self):
+        """生效的筛选项及其绑定参数值"""
+        params = {}
+        if self.search:
+            params['search'] = f'%{self.search}%'
+        if self.activity_type_id:
+            params['activity_type_id'] = self.activity_type_id
+        if self.venue_id:
+            params['venue_id'] = self.venue_id
+        if self.start_dt:
+            params['start_dt'] = self.start_dt
+        if self.end_dt:
+            # 包含结束日期当天
+            params['end_bound'] = self.end_dt + timedelta(days=1)
+        if self.status in LIFECYCLE_FILTERS:
+            params['status'] = self.status
+        return params
+
+    @staticmethod
+    def _where(statement, model, names):
+        conditions = {
+            'search': lambda: model.title.ilike(bindparam('search')),
+            'activity_type_id': lambda: model.activity_type_id == bindparam('activity_type_id'),
+            'venue_id': lambda: model.venue_id == bindparam('venue_id'),
+            'start_dt': lambda: model.start_time >= bindparam('start_dt'),
+            'end_bound': lambda: model.end_time <= bindparam('end_bound'),
+            'status': lambda: model.lifecycle_status == bindparam('status'),
+        }
+        return statement.where(*[conditions[name]() for name in names])
+
+    def statement(self, key, build, model=None):
+        """返回带筛选条件的缓存语句
+
+        key 标识调用处，build() 返回不含筛选条件的基础语句；model 默认为 Activity，也可以是 ArchivedActivity。
+        预加载等 options 写在 build() 里，随语句一起按 key 缓存，不要在调用处另外附加（每次新建的 option 对象无法作为缓存键）。
+        """
+        model = _default_model(model)
+        names = tuple(self.params)
+        return _cached((key, model, names, 'rows'), lambda: self._where(build(), model, names))
+
+    def scalars(self, key, build, model=None, **params):
+        from extensions import db
+        return db.session.scalars(self.statement(key, build, model), {**self.params, **params}).all()
+
+    def paginate(self, key, build, page=None, per_page=None, error_out=True, model=None, **params):
+        model = _default_model(model)
+        statement = self.statement(key, build, model)
+        cache_key = (key, model, tuple(self.params))
+        return CachedPagination(
+            page=page, per_page=per_page, error_out=error_out,
+            statement=statement, cache_key=cache_key, params={**self.params, **params}
+        )
+
+
+class CachedPagination(Pagination):
+    """对缓存语句分页，分页和计数语句同样只构建一次"""
+
+    def _query_items(self):
+        from extensions import db
+
+        statement = self._query_args['statement']
+        paged = _cached(
+            self._query_args['cache_key'] + ('page',),
+            lambda: statement.limit(bindparam('_limit')).offset(bindparam('_offset'))
+        )
+        params = {**self._query_args['params'], '_limit': self.per_page, '_offset': self._query_offset}
+        return list(db.session.execute(paged, params).unique().scalars())
+
+    def _query_count(self):
+        from extensions import db
+
+        statement = self._query_args['statement']
+        counted = _cached(
+            self._query_args['cache_key'] + ('count',),
+            lambda: statement.with_only_columns(func.count(), maintain_column_froms=True).order_by(None)
+        )
+        return db.session.execute(counted, self._query_args['params']).scalar()
@@ -0,0 +1,263 @@
+"""iCalendar 订阅：每个用户（我发起和参与的活动）、每个场地一个带密钥的 .ics 地址
+
+日历应用每隔几分钟轮询一次订阅地址，按请求现查报名记录会把数据库负载放大很多倍，所以：
+- 地址里的 token 是 HMAC(ICAL_SECRET，默认 SECRET_KEY, '<kind>:<id>') 的前 22 个字符，校验不查数据库；
+  地址泄露后只能通过更换 ICAL_SECRET 让全部旧地址失效。
+- 生成好的日历写入 ICAL_CACHE_DIR/<kind>_<id>.ics，多个 worker 共享。轮询时只 stat 文件：ETag 是内容的 SHA-256（强校验，
+  进程内按 (mtime, 大小) 记住，不必每次读文件计算），Last-Modified 是文件的修改时间，
+  客户端带 If-None-Match/If-Modified-Since 且没有变化时直接返回 304，整个请求不执行 SQL。
+- 报名、退出、创建、编辑、删除和审核活动后调用 invalidate_feeds() 删除受影响的文件，下次轮询时重新生成；
+  文件超过 ICAL_CACHE_TTL 秒也会重新生成，兜底没有调用失效的改动（改场地名称、归档等）和“过去 ICAL_PAST_DAYS 天”窗口的滚动。
+- 重新生成是增量的：一条查询取出相关活动的列，每个活动的 VEVENT 文本按活动 id 缓存在进程内，
+  列值没变的活动直接复用，只有变化过的活动重新格式化。内容没变时 ETag 也不变，客户端仍然得到 304。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, has_request_context, url_for
+
+from utils.metrics import record_cache
+
+KINDS = ('user', 'venue')
+TOKEN_LENGTH = 22
+PRODID = '-//Campus Activities//Activity Feed//ZH'
+
+FeedFile = namedtuple('FeedFile', 'path etag last_modified')
+
+# 活动 id -> (列值, VEVENT 文本)
+_events = OrderedDict()
+# 文件路径 -> (mtime_ns, 大小, ETag)
+_etags = OrderedDict()
+_lock = threading.Lock()
+
+
+def _secret(config):
+    secret = config.get('ICAL_SECRET') or config['SECRET_KEY']
+    return secret if isinstance(secret, bytes) else secret.encode()
+
+
+def feed_token(config, kind, object_id):
+    digest = hmac.new(_secret(config), f'{kind}:{object_id}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()[:TOKEN_LENGTH]
+
+
+def check_token(config, kind, object_id, token):
+    return kind in KINDS and hmac.compare_digest(feed_token(config, kind, object_id), token or '')
+
+
+def feed_url(kind, object_id):
+    """订阅地址（绝对 URL），日历应用里填 https 地址或点 webcal:// 链接"""
+    return url_for(f'calendar.{kind}_feed', object_id=object_id,
+                   token=feed_token(current_app.config, kind, object_id), _external=True)
+
+
+def _path(kind, object_id):
+    return os.path.join(current_app.config['ICAL_CACHE_DIR'], f'{kind}_{int(object_id)}.ics')
+
+
+def invalidate_feeds(user_ids=(), venue_ids=()):
+    """数据变化后调用，删除受影响的日历文件；None 会被忽略"""
+    for kind, ids in (('user', user_ids), ('venue', venue_ids)):
+        for object_id in set(ids):
+            if object_id is None:
+                continue
+            try:
+                os.remove(_path(kind, object_id))
+            except FileNotFoundError:
+                pass
+
+
+def invalidate_activity(activity_id, organizer_id, *venue_ids):
+    """活动本身变化（编辑、审核）时，所有报名者、发起人和场地的日历都要更新"""
+    from extensions import db
+    from models import Participation
+
+    participant_ids = db.session.scalars(
+        db.select(Participation.user_id).where(Participation.activity_id == activity_id)
+    ).all()
+    invalidate_feeds(user_ids=[organizer_id, *participant_ids], venue_ids=venue_ids)
+
+
+def cached_feed(kind, object_id):
+    """返回未过期的已生成文件，没有或已过期时返回 None；不访问数据库"""
+    path = _path(kind, object_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        record_cache('ical_feed', False)
+        return None
+    if time.time() - stat.st_mtime > current_app.config['ICAL_CACHE_TTL']:
+        record_cache('ical_feed', False)
+        return None
+    record_cache('ical_feed', True)
+    with _lock:
+        memo = _etags.get(path)
+    if memo and memo[:2] == (stat.st_mtime_ns, stat.st_size):
+        etag = memo[2]
+    else:
+        try:
+            with open(path, 'rb') as feed:
+                etag = _remember_etag(path, stat, feed.read())
+        except FileNotFoundError:
+            return None
+    return FeedFile(path, etag, datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc))
+
+
+def _remember_etag(path, stat, body):
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    with _lock:
+        _etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        _etags.move_to_end(path)
+        while len(_etags) > current_app.config['ICAL_ETAG_MEMO_SIZE']:
+            _etags.popitem(last=False)
+    return etag
+
+
+def _escape(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line):
+    """RFC 5545：每行不超过 75 个字节，续行以空格开头，不在 UTF-8 字符中间断开"""
+    raw = line.encode()
+    if len(raw) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(raw[start:end].decode())
+        start, limit = end, 74
+    return '\r\n '.join(parts)
+
+
+def _stamp(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _vevent(row, detail_url):
+    location = ' '.join(part for part in (row.venue_name, row.venue_address or row.location) if part)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:activity-{row.id}@{current_app.config["ICAL_UID_DOMAIN"]}',
+        # DTSTAMP 取创建时间而不是生成时间，内容没变时重新生成的文件字节相同，ETag 不变
+        f'DTSTAMP:{_stamp(row.created_at or row.start_time)}',
+        f'DTSTART:{_stamp(row.start_time)}',
+        f'DTEND:{_stamp(row.end_time)}',
+        f'SUMMARY:{_escape(row.title)}',
+        f'DESCRIPTION:{_escape(row.description)}',
+        f'LOCATION:{_escape(location)}',
+        f'URL:{detail_url}',
+        f"STATUS:{'CONFIRMED' if row.review_status == 'approved' else 'TENTATIVE'}",
+        'END:VEVENT',
+    ]
+    return '\r\n'.join(_fold(line) for line in lines)
+
+
+def _event_text(row):
+    detail_url = url_for('public.activity_detail', activity_id=row.id, _external=True)
+    fingerprint = (tuple(row), detail_url)
+    with _lock:
+        cached = _events.get(row.id)
+        if cached and cached[0] == fingerprint:
+            _events.move_to_end(row.id)
+            record_cache('ical_event', True)
+            return cached[1]
+    record_cache('ical_event', False)
+    text = _vevent(row, detail_url)
+    with _lock:
+        _events[row.id] = (fingerprint, text)
+        while len(_events) > current_app.config['ICAL_EVENT_CACHE_SIZE']:
+            _events.popitem(last=False)
+    return text
+
+
+def _load_rows(kind, object_id):
+    from extensions import db
+    from models import Activity, Participation, Venue
+
+    if has_request_context():
+        # 生成的文件会一直用到失效为止，从主库读取，避免把副本延迟固化进缓存
+        g.db_replica = None
+    cutoff = datetime.now(timezone.utc) - timedelta(days=current_app.config['ICAL_PAST_DAYS'])
+    if kind == 'user':
+        scope = db.or_(
+            Activity.organizer_id == object_id,
+            Activity.id.in_(db.select(Participation.activity_id).where(Participation.user_id == object_id))
+        )
+    else:
+        scope = Activity.venue_id == object_id
+    return db.session.execute(
+        db.select(Activity.id, Activity.title, Activity.description, Activity.start_time, Activity.end_time,
+                  Activity.location, Activity.review_status, Activity.created_at,
+                  Venue.name.label('venue_name'), Venue.address.label('venue_address'))
+        .outerjoin(Venue, Venue.id == Activity.venue_id)
+        .where(scope, Activity.end_time >= cutoff, db.or_(Activity.status.is_(None), Activity.status != 'rejected'))
+        .order_by(Activity.start_time, Activity.id)
+    ).all()
+
+
+def _calendar_name(kind, object_id):
+    from extensions import db
+    from models import User, Venue
+
+    if kind == 'user':
+        user = db.session.get(User, object_id)
+        return f'{user.username} 的校园活动' if user else '校园活动'
+    venue = db.session.get(Venue, object_id)
+    return f'{venue.name} 场地日程' if venue else '场地日程'
+
+
+def build_feed(kind, object_id):
+    """查询数据库重新生成日历文件（先写临时文件再替换），返回 FeedFile"""
+    config = current_app.config
+    rows = _load_rows(kind, object_id)
+    refresh = f"PT{max(config['ICAL_CACHE_TTL'] // 60, 1)}M"
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        _fold(f'X-WR-CALNAME:{_escape(_calendar_name(kind, object_id))}'),
+        'X-WR-TIMEZONE:Asia/Shanghai',
+        f'REFRESH-INTERVAL;VALUE=DURATION:{refresh}',
+        f'X-PUBLISHED-TTL:{refresh}',
+    ]
+    lines.extend(_event_text(row) for row in rows)
+    lines.append('END:VCALENDAR')
+    body = ('\r\n'.join(lines) + '\r\n').encode()
+
+    path = _path(kind, object_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as feed:
+        feed.write(body)
+    os.replace(temp_path, path)
+    stat = os.stat(path)
+    etag = _remember_etag(path, stat, body)
+    return FeedFile(path, etag, datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc))
+
+
+def get_feed(kind, object_id):
+    return cached_feed(kind, object_id) or build_feed(kind, object_id)
+
+
+def init_app(app):
+    app.config.setdefault('ICAL_SECRET', os.environ.get('ICAL_SECRET'))
+    app.config.setdefault('ICAL_CACHE_DIR', os.environ.get('ICAL_CACHE_DIR', os.path.join(app.instance_path, 'ical')))
+    app.config.setdefault('ICAL_CACHE_TTL', int(os.environ.get('ICAL_CACHE_TTL', 3600)))
+    app.config.setdefault('ICAL_PAST_DAYS', 30)
+    app.config.setdefault('ICAL_UID_DOMAIN', os.environ.get('ICAL_UID_DOMAIN', 'campus-activities'))
+    app.config.setdefault('ICAL_EVENT_CACHE_SIZE', 5000)
+    app.config.setdefault('ICAL_ETAG_MEMO_SIZE', 10000)
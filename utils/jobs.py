@@ -0,0 +1,347 @@
+"""基于数据库任务表的后台任务系统
+
+不依赖外部消息队列：请求处理函数调用 enqueue() 写入一行 Job 后立即返回，
+由 `flask jobs worker` 启动的工作进程轮询任务表，在线程池或进程池中执行。
+
+    @job('exports.activity_csv')
+    def export_activity_csv(payload, context):
+        context.set_progress(50)
+        return {'file': ...}
+
+    enqueue('exports.activity_csv', {'activity_id': 1}, priority=5, user_id=current_user.id)
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+# 进程池中每个子进程各自创建的应用实例
+_process_app = None
+
+
+def job(name):
+    """注册一个任务处理函数，函数签名为 handler(payload, context)"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name):
+    # 处理函数在 routes 等模块导入时注册，create_app() 之后即可查到
+    return _registry.get(name)
+
+
+class JobContext:
+    """传给任务处理函数的上下文，用于上报进度；上报进度同时续租"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def set_progress(self, progress):
+        from extensions import db
+        from models import Job
+
+        db.session.execute(
+            db.update(Job).where(Job.id == self.job_id, Job.status == 'running')
+            .values(progress=max(0, min(100, int(progress))), locked_at=datetime.now(timezone.utc))
+        )
+        db.session.commit()
+
+
+def enqueue(name, payload=None, priority=0, delay=None, run_at=None, max_attempts=3, user_id=None):
+    """写入一个待执行任务并提交，返回 Job
+
+    delay 为 timedelta 或秒数；run_at 为绝对时间，二者都不传时立即可执行。
+    """
+    from extensions import db
+    from models import Job
+
+    now = datetime.now(timezone.utc)
+    if run_at is None:
+        if isinstance(delay, (int, float)):
+            delay = timedelta(seconds=delay)
+        run_at = now + delay if delay else now
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        status='queued',
+        priority=priority,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=run_at,
+        progress=0,
+        user_id=user_id,
+        created_at=now
+    )
+    db.session.add(new_job)
+    db.session.commit()
+    return new_job
+
+
+def claim_jobs(worker_id, limit):
+    """原子地领取最多 limit 个到期任务，返回任务ID列表
+
+    先按优先级和执行时间选出候选，再用带 status 条件的 UPDATE 逐个抢占，
+    多个工作进程同时领取时只有一个能更新成功。
+    """
+    from extensions import db
+    from models import Job
+
+    now = datetime.now(timezone.utc)
+    candidates = db.session.scalars(
+        db.select(Job.id)
+        .where(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+        .limit(limit * 2)
+    ).all()
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) >= limit:
+            break
+        result = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def renew_leases(worker_id):
+    """刷新本工作进程正在执行的任务的 locked_at，返回续租的任务数"""
+    from extensions import db
+    from models import Job
+
+    result = db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.locked_by == worker_id)
+        .values(locked_at=datetime.now(timezone.utc))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def requeue_stale_jobs(lease_seconds):
+    """处理超过租期没有续租的 running 任务（工作进程崩溃），返回放回队列的数量
+
+    已用完重试次数的标记为 failed，不再放回队列，避免一个会让工作进程崩溃的任务无限重试。
+    """
+    from extensions import db
+    from models import Job
+
+    now = datetime.now(timezone.utc)
+    stale = db.and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=lease_seconds))
+    failed = db.session.execute(
+        db.update(Job)
+        .where(stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', finished_at=now, locked_by=None, locked_at=None,
+                last_error='租期内没有续租，工作进程可能已崩溃；已达到最大重试次数')
+    ).rowcount
+    result = db.session.execute(
+        db.update(Job)
+        .where(stale)
+        .values(status='queued', locked_by=None, locked_at=None)
+    )
+    db.session.commit()
+    if failed:
+        logger.error('%d 个任务的工作进程崩溃且已达到最大重试次数，标记为失败', failed)
+    return result.rowcount
+
+
+def run_job(job_id):
+    """执行一个已领取的任务并记录结果，需要在应用上下文中调用"""
+    from extensions import db
+    from models import Job
+
+    current_job = db.session.get(Job, job_id)
+    if current_job is None:
+        return
+    handler = get_handler(current_job.name)
+    payload = json.loads(current_job.payload or '{}')
+    attempts = current_job.attempts
+    max_attempts = current_job.max_attempts
+    db.session.commit()
+
+    try:
+        if handler is None:
+            raise LookupError(f'未注册的任务: {current_job.name}')
+        result = handler(payload, JobContext(job_id))
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        now = datetime.now(timezone.utc)
+        if attempts < max_attempts:
+            # 指数退避后重试
+            backoff = current_app.config['JOB_RETRY_BACKOFF'] * 2 ** (attempts - 1)
+            values = dict(status='queued', run_at=now + timedelta(seconds=backoff))
+            logger.warning('任务 %s 第 %d 次执行失败，%d 秒后重试', job_id, attempts, backoff)
+        else:
+            values = dict(status='failed', finished_at=now)
+            logger.error('任务 %s 执行失败，已达到最大重试次数\n%s', job_id, error)
+        db.session.execute(
+            db.update(Job).where(Job.id == job_id)
+            .values(last_error=error[-4000:], locked_by=None, locked_at=None, **values)
+        )
+        db.session.commit()
+        return
+
+    db.session.execute(
+        db.update(Job).where(Job.id == job_id).values(
+            status='succeeded',
+            progress=100,
+            result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+            finished_at=datetime.now(timezone.utc),
+            locked_by=None,
+            locked_at=None
+        )
+    )
+    db.session.commit()
+
+
+def _run_in_thread(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+
+def _init_process():
+    global _process_app
+    from app import create_app
+    _process_app = create_app()
+
+
+def _run_in_process(job_id):
+    with _process_app.app_context():
+        run_job(job_id)
+
+
+class JobWorker:
+    """轮询任务表并在线程池或进程池中执行任务"""
+
+    def __init__(self, app, concurrency=4, pool='thread', poll_interval=None):
+        self.app = app
+        self.concurrency = concurrency
+        self.pool = pool
+        self.poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._running = set()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self, stopped):
+        # 独立线程定期续租：长任务不上报进度、或主循环在关闭时等待任务结束，租期也不会过期
+        interval = self.app.config['JOB_HEARTBEAT_INTERVAL']
+        while not stopped.wait(interval):
+            try:
+                with self.app.app_context():
+                    renew_leases(self.worker_id)
+            except Exception:
+                logger.exception('任务续租失败')
+
+    def run(self, burst=False):
+        """运行直到 stop() 被调用；burst=True 时没有到期任务后退出"""
+        if self.pool == 'process':
+            executor = ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+        lease = self.app.config['JOB_LEASE_SECONDS']
+        last_requeue = None
+        heartbeat_stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(heartbeat_stopped,),
+                                     name='job-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                self._running = {future for future in self._running if not future.done()}
+                free_slots = self.concurrency - len(self._running)
+                claimed = []
+                with self.app.app_context():
+                    if last_requeue is None or time.monotonic() - last_requeue > lease / 2:
+                        requeue_stale_jobs(lease)
+                        last_requeue = time.monotonic()
+                    if free_slots > 0:
+                        claimed = claim_jobs(self.worker_id, free_slots)
+                for job_id in claimed:
+                    if self.pool == 'process':
+                        future = executor.submit(_run_in_process, job_id)
+                    else:
+                        future = executor.submit(_run_in_thread, self.app, job_id)
+                    self._running.add(future)
+                if burst and not claimed and not self._running:
+                    with self.app.app_context():
+                        if not self._has_pending_jobs():
+                            break
+                if not claimed:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            executor.shutdown(wait=True)
+            heartbeat_stopped.set()
+
+    def _has_pending_jobs(self):
+        from extensions import db
+        from models import Job
+
+        now = datetime.now(timezone.utc)
+        return db.session.scalar(
+            db.select(db.func.count(Job.id)).where(
+                db.or_(Job.status == 'running', db.and_(Job.status == 'queued', Job.run_at <= now))
+            )
+        ) > 0
+
+
+jobs_cli = AppGroup('jobs', help='后台任务')
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', '-c', default=4, show_default=True, help='同时执行的任务数')
+@click.option('--pool', type=click.Choice(['thread', 'process']), default='thread', show_default=True,
+              help='thread 适合 I/O 型任务，process 适合图片渲染等 CPU 型任务')
+@click.option('--burst', is_flag=True, help='没有到期任务后退出')
+def worker_command(concurrency, pool, burst):
+    """启动任务工作进程"""
+    worker = JobWorker(current_app._get_current_object(), concurrency=concurrency, pool=pool)
+    click.echo(f'任务工作进程 {worker.worker_id} 已启动（{pool} × {concurrency}）')
+    try:
+        worker.run(burst=burst)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@jobs_cli.command('list')
+@click.option('--status', default=None, help='按状态筛选')
+@click.option('--limit', default=20, show_default=True)
+def list_command(status, limit):
+    """列出最近的任务"""
+    from extensions import db
+    from models import Job
+
+    query = db.select(Job).order_by(Job.id.desc()).limit(limit)
+    if status:
+        query = query.where(Job.status == status)
+    for item in db.session.scalars(query):
+        click.echo(f'{item.id}\t{item.name}\t{item.status}\t{item.progress}%\t尝试 {item.attempts}/{item.max_attempts}')
+
+
+def init_app(app):
+    app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+    app.config.setdefault('JOB_LEASE_SECONDS', 600)
+    app.config.setdefault('JOB_HEARTBEAT_INTERVAL', 30)
+    app.config.setdefault('JOB_RETRY_BACKOFF', 10)
+    app.cli.add_command(jobs_cli)
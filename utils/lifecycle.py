@@ -0,0 +1,151 @@
+"""活动生命周期调度：在开始/结束时间点批量推进 Activity.lifecycle_status
+
+upcoming -> ongoing -> ended 的转换由集合式 UPDATE 分批完成，列表查询和模板直接读取
+带索引的 lifecycle_status 列，不再逐行做时区换算和 datetime.now() 比较。
+
+调度方式：
+- 任务 `lifecycle.advance` 执行一次推进后，把自己重新排到下一个开始/结束时间点
+  （最长间隔 LIFECYCLE_MAX_INTERVAL 秒），由 `flask jobs worker` 执行。
+- `flask lifecycle advance` 可由 cron 直接调用。
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+ADVANCE_JOB = 'lifecycle.advance'
+
+
+def _update_in_batches(db, Activity, criteria, new_status, batch_size):
+    updated = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(Activity.id).where(*criteria).order_by(Activity.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return updated
+        db.session.execute(
+            db.update(Activity)
+            .where(Activity.id.in_(ids))
+            .values(lifecycle_status=new_status)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        updated += len(ids)
+
+
+def advance_lifecycle(now=None, batch_size=None):
+    """把到达边界时间的活动推进到新状态，返回 {'ongoing': n, 'ended': m}"""
+    from extensions import db
+    from models import Activity
+
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or current_app.config['LIFECYCLE_BATCH_SIZE']
+    not_ended = db.or_(Activity.lifecycle_status.is_(None), Activity.lifecycle_status != 'ended')
+    # 先处理已结束的，避免已经结束的活动先被标为进行中
+    ended = _update_in_batches(db, Activity, (not_ended, Activity.end_time < now), 'ended', batch_size)
+    ongoing = _update_in_batches(db, Activity, (
+        db.or_(Activity.lifecycle_status.is_(None), Activity.lifecycle_status == 'upcoming'),
+        Activity.start_time <= now,
+        Activity.end_time >= now
+    ), 'ongoing', batch_size)
+    if ended or ongoing:
+        logger.info('活动状态推进：%d 个进行中，%d 个已结束', ongoing, ended)
+    return {'ongoing': ongoing, 'ended': ended}
+
+
+def next_boundary(now=None):
+    """返回下一个需要推进状态的时间点，没有时返回 None"""
+    from extensions import db
+    from models import Activity
+
+    now = now or datetime.now(timezone.utc)
+    next_start = db.session.scalar(
+        db.select(db.func.min(Activity.start_time))
+        .where(Activity.lifecycle_status == 'upcoming', Activity.start_time > now)
+    )
+    next_end = db.session.scalar(
+        db.select(db.func.min(Activity.end_time))
+        .where(Activity.lifecycle_status != 'ended', Activity.end_time >= now)
+    )
+    candidates = [t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t for t in (next_start, next_end) if t]
+    return min(candidates) if candidates else None
+
+
+def schedule_advance(at=None):
+    """确保有且只有一个排队中的推进任务，并且不晚于 at"""
+    from extensions import db
+    from models import Job
+
+    now = datetime.now(timezone.utc)
+    latest = now + timedelta(seconds=current_app.config['LIFECYCLE_MAX_INTERVAL'])
+    at = min(at, latest) if at else latest
+    # 结束时间点本身仍算进行中，晚一秒推进
+    at = max(at, now) + timedelta(seconds=1)
+
+    queued = db.session.scalars(
+        db.select(Job).where(Job.name == ADVANCE_JOB, Job.status == 'queued').order_by(Job.run_at)
+    ).all()
+    if queued:
+        first = queued[0]
+        first_run_at = first.run_at.replace(tzinfo=timezone.utc) if first.run_at.tzinfo is None else first.run_at
+        if at < first_run_at:
+            first.run_at = at
+        for extra in queued[1:]:
+            db.session.delete(extra)
+        db.session.commit()
+        return first
+    return enqueue(ADVANCE_JOB, priority=10, run_at=at, max_attempts=5)
+
+
+def refresh_lifecycle(activity):
+    """活动创建或修改时间后调用：立即写入正确状态，返回该活动的下一个边界时间
+
+    调用方提交后应把返回值传给 schedule_advance()，确保推进任务不会晚于这个时间点。
+    """
+    from models import compute_lifecycle
+
+    activity.lifecycle_status = compute_lifecycle(activity.start_time, activity.end_time)
+    boundary = activity.start_time if activity.lifecycle_status == 'upcoming' else activity.end_time
+    if activity.lifecycle_status != 'ended' and boundary is not None:
+        boundary = boundary.replace(tzinfo=timezone.utc) if boundary.tzinfo is None else boundary
+        return boundary
+    return None
+
+
+@job(ADVANCE_JOB)
+def advance_lifecycle_job(payload, context):
+    counts = advance_lifecycle()
+    following = schedule_advance(next_boundary())
+    counts['next_run_at'] = following.run_at.isoformat()
+    return counts
+
+
+lifecycle_cli = AppGroup('lifecycle', help='活动生命周期状态')
+
+
+@lifecycle_cli.command('advance')
+def advance_command():
+    """立即推进一次活动状态"""
+    counts = advance_lifecycle()
+    click.echo(f"进行中 +{counts['ongoing']}，已结束 +{counts['ended']}")
+
+
+@lifecycle_cli.command('schedule')
+def schedule_command():
+    """推进一次活动状态并安排下一次推进任务（由 flask jobs worker 执行）"""
+    advance_lifecycle()
+    scheduled = schedule_advance(next_boundary())
+    click.echo(f'下一次推进时间：{scheduled.run_at}')
+
+
+def init_app(app):
+    app.config.setdefault('LIFECYCLE_BATCH_SIZE', 1000)
+    app.config.setdefault('LIFECYCLE_MAX_INTERVAL', 3600)
+    app.cli.add_command(lifecycle_cli)
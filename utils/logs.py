@@ -0,0 +1,284 @@
+"""异步的结构化日志
+
+请求线程只做一件事：把日志记录放进有界队列（QueueHandler），格式化和写文件都在后台的 QueueListener 线程里完成，
+磁盘或终端变慢时请求不会被阻塞；队列满时直接丢弃并计入 app_log_records_dropped_total 指标。
+
+- 每行一个 JSON 对象：时间、级别、logger、消息、进程号，请求内的日志带 request_id。
+  请求 id 取自请求头 X-Request-ID（由上游代理生成时），否则随机生成，并在响应头 X-Request-ID 中返回。
+- 访问日志写到 access logger：方法、路径、端点、状态码、耗时、响应大小、用户 id 和 SQL 统计。
+  高频端点按 LOG_ACCESS_SAMPLE_RATES 中的比例采样，记录里带 sample_rate 便于按比例还原；
+  出错（状态码 >= 500）和耗时超过 LOG_ACCESS_SLOW_MS 的请求总是记录。
+- LOG_FILE 为空时写到标准错误；否则按大小（LOG_MAX_BYTES）或时间（LOG_ROTATE_INTERVAL 秒）轮转，
+  旧文件 gzip 压缩为 <文件名>.1.gz ... 保留 LOG_BACKUP_COUNT 个。多 worker 部署时在 LOG_FILE 中使用 {pid}，
+  让每个进程写自己的文件。
+
+需要附带结构化字段的日志可以用 extra={'data': {...}}，字段会合并到输出的 JSON 中。
+"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, has_request_context, request, session
+
+from utils.metrics import registry
+
+access_logger = logging.getLogger('access')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+DEFAULT_SAMPLE_RATES = {
+    'public.index': 0.1,
+    'public.activity_detail': 0.1,
+    'jobs.job_status': 0.05,
+    'static': 0.01,
+    'uploaded_file': 0.01,
+    'metrics': 0.0,
+}
+
+DROPPED = registry.counter('app_log_records_dropped_total', '日志队列已满时丢弃的记录数', ('logger',))
+
+_pipeline = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        data = getattr(record, 'data', None)
+        if data:
+            entry.update(data)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """开发时在终端阅读用"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        text = super().format(record)
+        data = getattr(record, 'data', None)
+        return f'{text} {json.dumps(data, ensure_ascii=False, default=str)}' if data else text
+
+
+class RequestIdFilter(logging.Filter):
+    """在产生日志的线程里取请求 id，队列另一端已经没有请求上下文"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # 只在请求线程里把消息和异常栈转成字符串，真正的格式化交给监听线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc((record.name,))
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """按大小或时间轮转，轮转出的文件用 gzip 压缩（在监听线程里执行）"""
+
+    def __init__(self, filename, max_bytes, backup_count, interval):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + '.gz'
+        self.rotator = _gzip_rotate
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        # 空文件不轮转，免得时间触发时产生一堆空的压缩包
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+def _gzip_rotate(source, dest):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class LogPipeline:
+    def __init__(self, config, queue_handler):
+        self.config = config
+        self.handler = _make_handler(config)
+        self.queue_handler = queue_handler
+        self.queue_size = config['LOG_QUEUE_SIZE']
+        self.listener = None
+        self.start()
+
+    def start(self):
+        self.queue_handler.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.queue_handler.queue, self.handler, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart_after_fork(self):
+        # fork 出的子进程里没有监听线程，换一个新队列重新启动；
+        # 文件名中的 {pid} 在父进程里已经填好，重新创建 handler，让每个 worker 写自己的文件
+        self.listener = None
+        inherited, self.handler = self.handler, _make_handler(self.config)
+        inherited.close()
+        self.start()
+
+
+def _make_handler(config):
+    formatter = JsonFormatter() if config['LOG_FORMAT'] == 'json' else TextFormatter()
+    filename = config['LOG_FILE']
+    if filename:
+        filename = filename.format(pid=os.getpid())
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        handler = CompressingRotatingFileHandler(
+            filename, config['LOG_MAX_BYTES'], config['LOG_BACKUP_COUNT'], config['LOG_ROTATE_INTERVAL'])
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def configure(config):
+    """把根 logger 的输出换成队列 + 后台线程；重复调用时替换之前的配置"""
+    global _pipeline
+    root = logging.getLogger()
+    if _pipeline is not None:
+        root.removeHandler(_pipeline.queue_handler)
+        _pipeline.stop()
+    queue_handler = NonBlockingQueueHandler(queue.Queue())
+    queue_handler.addFilter(RequestIdFilter())
+    _pipeline = LogPipeline(config, queue_handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config['LOG_LEVEL'])
+    return _pipeline
+
+
+def _stop_pipeline():
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+def _restart_pipeline():
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+atexit.register(_stop_pipeline)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_pipeline)
+
+
+def _start_request():
+    incoming = request.headers.get(REQUEST_ID_HEADER)
+    g.request_id = incoming if incoming and _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    g.access_log_started = time.perf_counter()
+
+
+def _log_request(response):
+    started = g.pop('access_log_started', None)
+    if started is None:
+        return response
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    config = current_app.config
+    duration_ms = (time.perf_counter() - started) * 1000
+    endpoint = request.endpoint or 'unmatched'
+    rate = config['LOG_ACCESS_SAMPLE_RATES'].get(endpoint, config['LOG_ACCESS_SAMPLE_DEFAULT'])
+    if response.status_code >= 500 or duration_ms >= config['LOG_ACCESS_SLOW_MS']:
+        rate = 1.0
+    elif rate < 1.0 and random.random() >= rate:
+        return response
+
+    # 用户 id 取自 Flask-Login 写在会话里的值：提交之后 current_user 的属性已过期，读 current_user.id 会再查一次数据库
+    user_id = session.get('_user_id')
+    data = {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 2),
+        'bytes': response.content_length,
+        'remote_addr': request.remote_addr,
+        'user_id': int(user_id) if user_id and user_id.isdigit() else user_id,
+        'sample_rate': rate,
+    }
+    # utils.sqlstats 的 after_request 先注册、后执行，这里还能读到本请求的统计
+    stats = g.get('sql_stats')
+    if stats is not None:
+        data['sql_count'] = stats.count
+        data['sql_ms'] = round(stats.seconds * 1000, 2)
+    access_logger.info('%s %s %s', request.method, data['path'], response.status_code, extra={'data': data})
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('LOG_ENABLED', os.environ.get('LOG_ENABLED', '1') == '1')
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
+    app.config.setdefault('LOG_FORMAT', os.environ.get('LOG_FORMAT', 'json'))
+    # 为空时输出到标准错误；可以包含 {pid}
+    app.config.setdefault('LOG_FILE', os.environ.get('LOG_FILE'))
+    app.config.setdefault('LOG_MAX_BYTES', 50 * 1024 * 1024)
+    app.config.setdefault('LOG_ROTATE_INTERVAL', 24 * 3600)
+    app.config.setdefault('LOG_BACKUP_COUNT', 14)
+    app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('LOG_ACCESS_ENABLED', True)
+    app.config.setdefault('LOG_ACCESS_SAMPLE_RATES', dict(DEFAULT_SAMPLE_RATES))
+    app.config.setdefault('LOG_ACCESS_SAMPLE_DEFAULT', 1.0)
+    app.config.setdefault('LOG_ACCESS_SLOW_MS', 1000)
+    if app.config['LOG_FORMAT'] not in ('json', 'text'):
+        raise ValueError(f"未知的 LOG_FORMAT: {app.config['LOG_FORMAT']}")
+    if not app.config['LOG_ENABLED']:
+        return
+    configure(app.config)
+    app.before_request(_start_request)
+    if app.config['LOG_ACCESS_ENABLED']:
+        app.after_request(_log_request)
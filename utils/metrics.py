@@ -0,0 +1,493 @@
+"""Prometheus 文本格式的运行指标：/metrics
+
+采集的指标：
+- app_http_requests_total{endpoint,method,status}：按端点（public.index、user.join_activity ...）统计的请求数
+- app_http_request_duration_seconds{endpoint}：请求处理耗时
+- app_http_request_db_seconds / app_http_request_db_queries{endpoint}：每个请求的数据库耗时和语句数（来自 utils.sqlstats）
+- app_db_pool_checkout_seconds{pool}：从连接池取连接的等待时间（包括池空时新建连接）
+- app_template_render_seconds{template}：render_template 的渲染耗时
+- app_cache_requests_total{cache,result}：各缓存的命中/未命中，缓存代码调用 record_cache()
+- 抓取时读取的瞬时值：连接池大小/已借出/溢出连接数、模板缓存和 SQL 编译缓存条目数、SSE 订阅数
+
+记录路径不加锁：每个线程写自己的分片（一个 dict），只有抓取时才加锁合并各分片，
+已经退出的线程的分片在合并时并入 _retired。抓取时读到正在写入的直方图可能差一个样本，对监控没有影响。
+
+多进程（gunicorn 等预先 fork 的 worker）：设置 METRICS_MULTIPROC_DIR 后，每个进程用后台线程每
+METRICS_FLUSH_INTERVAL 秒把自己的快照写成 <pid>.json，/metrics 合并目录下所有快照。
+计数器和直方图保留已退出进程的值，保证总数单调；瞬时值只合并仍在运行的进程。
+部署前（启动主进程之前）用 `flask metrics clear` 清空目录。
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import click
+from flask import Response, abort, before_render_template, current_app, g, request, template_rendered
+from flask.cli import AppGroup
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+POOL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _cell(self, labels):
+        shard = self.registry._shard()
+        key = (self.name, labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = self._new_cell()
+        return cell
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_cell(self):
+        return [0.0]
+
+    def inc(self, labels=(), amount=1):
+        self._cell(labels)[0] += amount
+
+    def samples(self, labels, cell):
+        yield self.name, labels, cell[0]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_cell(self):
+        # 各桶（含 +Inf）的非累计计数，最后一位是总和
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, labels, value):
+        cell = self._cell(labels)
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def samples(self, labels, cell):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), cell[:-1]):
+            cumulative += count
+            yield self.name + '_bucket', labels + (('le', _format_value(bound)),), cumulative
+        yield self.name + '_sum', labels, cell[-1]
+        yield self.name + '_count', labels, cumulative
+
+
+class Gauge(Metric):
+    """瞬时值，抓取时调用 collect() 取得 [(标签值, 数值)]"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames, collect):
+        super().__init__(registry, name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+def _merge_cell(target, cell):
+    for i, value in enumerate(cell):
+        target[i] += value
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return f'{value:.1f}'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._flusher = None
+        self._flusher_pid = None
+        self.multiproc_dir = None
+        self.flush_interval = 2
+        self.app = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, collect):
+        return self._register(Gauge(self, name, documentation, labelnames, collect))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _shard(self):
+        shard = self._local.__dict__.get('shard')
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _after_fork(self):
+        # 子进程从零开始计数，不继承父进程（通常是未处理过请求的主进程）的值和线程
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._flusher = None
+        self._flusher_pid = None
+
+    def snapshot(self):
+        """合并本进程各线程分片：{(名称, 标签值): cell}"""
+        merged = {}
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    for key, cell in list(shard.items()):
+                        target = self._retired.get(key)
+                        if target is None:
+                            self._retired[key] = list(cell)
+                        else:
+                            _merge_cell(target, cell)
+            self._shards = alive
+            sources = [self._retired] + [shard for _, shard in alive]
+            for source in sources:
+                for key, cell in list(source.items()):
+                    target = merged.get(key)
+                    if target is None:
+                        merged[key] = list(cell)
+                    else:
+                        _merge_cell(target, cell)
+        return merged
+
+    def collect_gauges(self):
+        """{(名称, 标签值): 数值}"""
+        values = {}
+        for metric in self._metrics.values():
+            if metric.kind != 'gauge':
+                continue
+            try:
+                for labels, value in metric.collect():
+                    values[(metric.name, tuple(labels))] = value
+            except Exception:
+                logger.exception('采集指标 %s 失败', metric.name)
+        return values
+
+    # 多进程
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.multiproc_dir, f'{pid}.json')
+
+    def flush(self):
+        if not self.multiproc_dir:
+            return
+        pid = os.getpid()
+        data = {
+            'pid': pid,
+            'written_at': time.time(),
+            'values': [[name, list(labels), cell] for (name, labels), cell in self.snapshot().items()],
+            'gauges': [[name, list(labels), value] for (name, labels), value in self.collect_gauges().items()],
+        }
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = self._snapshot_path(pid)
+        tmp_path = os.path.join(self.multiproc_dir, f'.{pid}.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def ensure_flusher(self):
+        if not self.multiproc_dir or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_in_context()
+            except Exception:
+                logger.exception('写入指标快照失败')
+
+    def flush_in_context(self):
+        # 瞬时值的采集需要访问 db.engines，要在应用上下文里执行
+        if self.app is None:
+            self.flush()
+            return
+        with self.app.app_context():
+            self.flush()
+
+    def _read_snapshots(self):
+        values, gauges = {}, {}
+        for path in glob.glob(os.path.join(self.multiproc_dir, '*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, cell in data['values']:
+                key = (name, tuple(labels))
+                target = values.get(key)
+                if target is None:
+                    values[key] = cell
+                else:
+                    _merge_cell(target, cell)
+            if data['pid'] == os.getpid() or _pid_alive(data['pid']):
+                for name, labels, value in data['gauges']:
+                    key = (name, tuple(labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        return values, gauges
+
+    def clear(self):
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return 0
+        paths = glob.glob(os.path.join(self.multiproc_dir, '*.json'))
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+    # 输出
+
+    def render(self):
+        if self.multiproc_dir:
+            self.flush()
+            values, gauges = self._read_snapshots()
+        else:
+            values, gauges = self.snapshot(), self.collect_gauges()
+        grouped = {}
+        for (name, labels), value in list(values.items()) + list(gauges.items()):
+            grouped.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(grouped):
+            metric = self._metrics.get(name)
+            if metric is None:
+                continue
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in sorted(grouped[name], key=lambda item: item[0]):
+                pairs = tuple(zip(metric.labelnames, labels))
+                for sample_name, sample_labels, sample_value in metric.samples(pairs, value):
+                    label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in sample_labels)
+                    label_text = '{' + label_text + '}' if label_text else ''
+                    lines.append(f'{sample_name}{label_text} {_format_value(sample_value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'app_http_requests_total', '按端点、方法和状态码统计的请求数', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = registry.histogram(
+    'app_http_request_duration_seconds', '请求处理耗时（秒）', ('endpoint',))
+REQUEST_DB_SECONDS = registry.histogram(
+    'app_http_request_db_seconds', '每个请求的数据库耗时（秒）', ('endpoint',))
+REQUEST_DB_QUERIES = registry.histogram(
+    'app_http_request_db_queries', '每个请求执行的 SQL 语句数', ('endpoint',), buckets=QUERY_BUCKETS)
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    'app_db_pool_checkout_seconds', '从连接池取得连接的等待时间（秒）', ('pool',), buckets=POOL_BUCKETS)
+TEMPLATE_SECONDS = registry.histogram(
+    'app_template_render_seconds', '模板渲染耗时（秒）', ('template',))
+CACHE_REQUESTS = registry.counter(
+    'app_cache_requests_total', '缓存查找次数', ('cache', 'result'))
+
+
+def record_cache(cache, hit):
+    """缓存代码在每次查找后调用"""
+    CACHE_REQUESTS.inc((cache, 'hit' if hit else 'miss'))
+
+
+def _engines():
+    from extensions import db
+
+    return [(key or 'default', engine) for key, engine in db.engines.items()]
+
+
+def _pool_values(method):
+    def collect():
+        for name, engine in _engines():
+            getter = getattr(engine.pool, method, None)
+            if getter is not None:
+                yield (name,), getter()
+    return collect
+
+
+def _compiled_cache_entries():
+    for name, engine in _engines():
+        cache = getattr(engine, '_compiled_cache', None)
+        if cache is not None:
+            yield (name,), len(cache)
+
+
+def _template_cache_entries():
+    cache = current_app.jinja_env.cache
+    yield (), len(cache) if cache is not None else 0
+
+
+def _event_subscribers():
+    broker = current_app.extensions.get('event_broker')
+    if broker is not None:
+        yield (), broker.subscriber_count
+
+
+registry.gauge('app_db_pool_size', '连接池容量', ('pool',), _pool_values('size'))
+registry.gauge('app_db_pool_checked_out', '已借出的连接数', ('pool',), _pool_values('checkedout'))
+registry.gauge('app_db_pool_overflow', '超出容量的溢出连接数', ('pool',), _pool_values('overflow'))
+registry.gauge('app_sql_compiled_cache_entries', 'SQLAlchemy 语句编译缓存条目数', ('pool',), _compiled_cache_entries)
+registry.gauge('app_template_cache_entries', 'Jinja 模板缓存条目数', (), _template_cache_entries)
+registry.gauge('app_event_subscribers', 'SSE 订阅连接数', (), _event_subscribers)
+
+
+def _instrument_pool(name, engine):
+    pool = engine.pool
+    if getattr(pool, '_metrics_instrumented', False):
+        return
+    connect = pool.connect
+    labels = (name,)
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(labels, time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    pool._metrics_instrumented = True
+
+
+def _instrument_engine(name, engine):
+    _instrument_pool(name, engine)
+    # dispose() 会换一个新的连接池，重新包装
+    event.listen(engine, 'engine_disposed', lambda conn: _instrument_pool(name, engine))
+
+
+_render_local = threading.local()
+
+
+def _before_render(sender, template, context, **extra):
+    _render_local.__dict__.setdefault('started', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    started = _render_local.__dict__.get('started')
+    if started:
+        TEMPLATE_SECONDS.observe((template.name or 'string',), time.perf_counter() - started.pop())
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+    REQUEST_SECONDS.observe((endpoint,), time.perf_counter() - started)
+    # utils.sqlstats 的 after_request 先注册、后执行，这里还能读到本请求的统计
+    stats = g.get('sql_stats')
+    if stats is not None:
+        REQUEST_DB_SECONDS.observe((endpoint,), stats.seconds)
+        REQUEST_DB_QUERIES.observe((endpoint,), stats.count)
+    registry.ensure_flusher()
+    return response
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+metrics_cli = AppGroup('metrics', help='运行指标')
+
+
+@metrics_cli.command('dump')
+def dump_command():
+    """输出当前的指标文本"""
+    click.echo(registry.render(), nl=False)
+
+
+@metrics_cli.command('clear')
+def clear_command():
+    """清空多进程快照目录（在启动主进程之前执行）"""
+    removed = registry.clear()
+    click.echo(f'已删除 {removed} 个指标快照')
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', '1') == '1')
+    app.config.setdefault('METRICS_MULTIPROC_DIR', os.environ.get('METRICS_MULTIPROC_DIR'))
+    app.config.setdefault('METRICS_FLUSH_INTERVAL', 2)
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.cli.add_command(metrics_cli)
+    if not app.config['METRICS_ENABLED']:
+        return
+    registry.app = app
+    registry.multiproc_dir = app.config['METRICS_MULTIPROC_DIR']
+    registry.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+    if registry.multiproc_dir:
+        atexit.register(registry.flush_in_context)
+
+    from extensions import db
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            _instrument_engine(key or 'default', engine)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,315 @@
+"""按需的请求剖析：采样火焰图和 cProfile
+
+两种模式：
+- sample：后台采样线程每 PROFILE_SAMPLE_INTERVAL 秒读一次被剖析请求所在线程的调用栈（sys._current_frames），
+  按“根;...;叶”折叠计数，写成 collapsed stack 文件，可以直接拖进 speedscope 或交给 flamegraph.pl 生成 SVG。
+  Jinja 模板编译后的帧以模板文件名出现，数据库调用停在 SQLAlchemy/驱动的 Python 帧上，Python、渲染和数据库的耗时都能看到。
+  开销只落在被采样的请求上，其余请求只多一次随机数判断。
+- cprofile：确定性剖析，写出 pstats 文件，管理页显示按累计耗时排序的前若干个函数。
+
+触发方式：
+- 管理员在请求头加 `X-Profile: sample|cprofile`，或在地址后加 `?_profile=sample|cprofile`
+- 自动采样：按 PROFILE_SAMPLE_RATE 的概率随机采样普通请求（只用 sample 模式）
+
+限流：每个进程每分钟最多自动采样 PROFILE_AUTO_PER_MINUTE 个、按需剖析 PROFILE_ON_DEMAND_PER_MINUTE 个请求，
+同时最多 PROFILE_MAX_CONCURRENT 个请求在采样；cProfile 同一时刻只允许一个请求使用。
+结果存放在 PROFILE_DIR，每个剖析一个 <id>.json 元数据加一个数据文件，超过 PROFILE_RING_SIZE 个时删除最旧的。
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sample', 'cprofile')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+SUFFIXES = {'sample': '.collapsed', 'cprofile': '.pstats'}
+
+_cprofile_lock = threading.Lock()
+
+
+class RateLimiter:
+    """滑动窗口限流：每 period 秒最多 limit 次"""
+
+    def __init__(self):
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def allow(self, limit, period=60):
+        now = time.monotonic()
+        with self._lock:
+            while self._events and self._events[0] <= now - period:
+                self._events.popleft()
+            if len(self._events) >= limit:
+                return False
+            self._events.append(now)
+            return True
+
+
+_auto_limiter = RateLimiter()
+_on_demand_limiter = RateLimiter()
+
+
+def _frame_label(code, root):
+    filename = code.co_filename
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    else:
+        # 第三方库只保留包内路径
+        marker = 'site-packages' + os.sep
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class Sampler:
+    """采样线程：只在有请求注册时工作，没有时阻塞等待"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._labels = {}
+        self.interval = 0.005
+        self.root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    @property
+    def active(self):
+        return len(self._sessions)
+
+    def start(self, thread_id):
+        with self._condition:
+            self._sessions[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self, thread_id):
+        with self._condition:
+            return self._sessions.pop(thread_id, Counter())
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code, self.root)
+        return label
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._sessions:
+                    self._condition.wait()
+                thread_ids = list(self._sessions)
+            frames = sys._current_frames()
+            stacks = {}
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if labels:
+                    stacks[thread_id] = ';'.join(reversed(labels))
+            del frames
+            with self._condition:
+                for thread_id, stack in stacks.items():
+                    counter = self._sessions.get(thread_id)
+                    if counter is not None:
+                        counter[stack] += 1
+            time.sleep(self.interval)
+
+
+_sampler = Sampler()
+
+
+def _profile_dir():
+    path = current_app.config['PROFILE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _requested_mode():
+    mode = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_PARAM)
+    return mode if mode in MODES else None
+
+
+def _start_request():
+    config = current_app.config
+    if not config['PROFILING_ENABLED']:
+        return
+    mode = _requested_mode()
+    if mode:
+        from flask_login import current_user
+
+        if not (current_user.is_authenticated and current_user.is_admin):
+            return
+        if not _on_demand_limiter.allow(config['PROFILE_ON_DEMAND_PER_MINUTE']):
+            logger.info('按需剖析超过每分钟 %d 次的限制，跳过', config['PROFILE_ON_DEMAND_PER_MINUTE'])
+            return
+        trigger = 'on_demand'
+    elif config['PROFILE_SAMPLE_RATE'] and random.random() < config['PROFILE_SAMPLE_RATE']:
+        if not _auto_limiter.allow(config['PROFILE_AUTO_PER_MINUTE']):
+            return
+        mode, trigger = 'sample', 'auto'
+    else:
+        return
+
+    if mode == 'cprofile':
+        if not _cprofile_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        g.profile = {'mode': mode, 'trigger': trigger, 'profiler': profiler, 'started': time.perf_counter()}
+        profiler.enable()
+    else:
+        if _sampler.active >= config['PROFILE_MAX_CONCURRENT']:
+            return
+        _sampler.interval = config['PROFILE_SAMPLE_INTERVAL']
+        g.profile = {'mode': mode, 'trigger': trigger, 'thread_id': threading.get_ident(),
+                     'started': time.perf_counter()}
+        _sampler.start(g.profile['thread_id'])
+
+
+def _record_status(response):
+    profile = g.get('profile')
+    if profile is not None:
+        profile['status'] = response.status_code
+        profile['id'] = f'{time.time_ns()}-{os.getpid()}'
+        stats = g.get('sql_stats')
+        if stats is not None:
+            profile['sql'] = {'sql_count': stats.count, 'sql_ms': round(stats.seconds * 1000, 2)}
+        response.headers['X-Profile-Id'] = profile['id']
+    return response
+
+
+def _finish_request(exc):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    duration_ms = (time.perf_counter() - profile['started']) * 1000
+    if profile['mode'] == 'cprofile':
+        profile['profiler'].disable()
+        _cprofile_lock.release()
+    else:
+        stacks = _sampler.stop(profile['thread_id'])
+    profile_id = profile.get('id') or f'{time.time_ns()}-{os.getpid()}'
+    meta = {
+        'id': profile_id,
+        'mode': profile['mode'],
+        'trigger': profile['trigger'],
+        'endpoint': request.endpoint or 'unknown',
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'status': profile.get('status', 500),
+        'duration_ms': round(duration_ms, 2),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        **profile.get('sql', {}),
+    }
+    try:
+        directory = _profile_dir()
+        data_path = os.path.join(directory, profile_id + SUFFIXES[profile['mode']])
+        if profile['mode'] == 'cprofile':
+            profile['profiler'].dump_stats(data_path)
+        else:
+            meta['samples'] = sum(stacks.values())
+            with open(data_path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        with open(os.path.join(directory, profile_id + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        _trim(directory, current_app.config['PROFILE_RING_SIZE'])
+    except OSError:
+        logger.exception('写入剖析结果失败')
+
+
+def _trim(directory, keep):
+    """只保留最新的 keep 个剖析（id 以纳秒时间戳开头，按名字排序即按时间排序）"""
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:-keep] if len(ids) > keep else []:
+        for suffix in ('.json', *SUFFIXES.values()):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _valid_id(profile_id):
+    return bool(profile_id) and all(part.isdigit() for part in profile_id.split('-')) and profile_id.count('-') == 1
+
+
+def list_profiles():
+    """最近的剖析元数据，新的在前"""
+    directory = _profile_dir()
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            # 可能正被其他进程轮换删除
+            continue
+    return profiles
+
+
+def get_profile(profile_id):
+    """返回 (元数据, 数据文件路径)，不存在时返回 (None, None)"""
+    if not _valid_id(profile_id):
+        return None, None
+    directory = _profile_dir()
+    try:
+        with open(os.path.join(directory, profile_id + '.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    path = os.path.join(directory, profile_id + SUFFIXES[meta['mode']])
+    return (meta, path) if os.path.exists(path) else (None, None)
+
+
+def summarize(meta, path, limit=40):
+    """管理页展示用：cprofile 为 pstats 文本，sample 为按自身样本数排序的叶子函数和最常见的调用栈"""
+    if meta['mode'] == 'cprofile':
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+        return {'text': output.getvalue()}
+    leaves = Counter()
+    stacks = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            leaves[stack.rsplit(';', 1)[-1]] += int(count)
+            stacks.append((int(count), stack.split(';')))
+    total = sum(leaves.values()) or 1
+    return {
+        'leaves': [(label, count, count / total) for label, count in leaves.most_common(limit)],
+        'stacks': sorted(stacks, key=lambda item: item[0], reverse=True)[:10],
+        'total': total,
+    }
+
+
+def init_app(app):
+    app.config.setdefault('PROFILING_ENABLED', os.environ.get('PROFILING_ENABLED', '1') == '1')
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_RING_SIZE', 200)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', '0.01')))
+    app.config.setdefault('PROFILE_SAMPLE_INTERVAL', 0.005)
+    app.config.setdefault('PROFILE_AUTO_PER_MINUTE', 2)
+    app.config.setdefault('PROFILE_ON_DEMAND_PER_MINUTE', 30)
+    app.config.setdefault('PROFILE_MAX_CONCURRENT', 2)
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
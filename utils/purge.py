@@ -0,0 +1,275 @@
+"""活动和用户的软删除与后台清理
+
+删除活动或用户时只写 deleted_at，请求立即返回：
+- init_app() 在 Session 上注册 do_orm_execute 钩子，给所有 ORM 查询加上 deleted_at IS NULL
+  （with_loader_criteria，连接、子查询和预加载同样生效），软删除的行对列表、详情、登录等立即不可见。
+  需要看到它们的查询（清理任务、注册时的用户名查重）加 execution_options(include_deleted=True)。
+- 删除后提交一个 purge.deleted 任务（已有排队中的不重复提交），PURGE_DELAY 秒后由后台 worker 真正删除
+  （留出时间让取消通知按报名记录扇出，期间多次删除合并成一次清理）。清理只处理删除时间早于 PURGE_DELAY 秒前的行，
+  所以更早排队的任务不会提前删掉刚删除的活动的报名记录；还有未到期的行时任务按最早到期的时间重新排队：
+  子表按主键每次取 PURGE_CHUNK_SIZE 行，集合式 DELETE ... WHERE id IN (...)，每块一个短事务，
+  同一事务中按块扣减受影响的用户/活动计数，不会长时间锁表，也不把子记录加载到内存。
+- 子表外键带 ON DELETE CASCADE / SET NULL 兜底：删除活动或用户的那一刻仍有并发写入的子记录由数据库处理。
+  SQLite 默认不启用外键约束，所以清理任务仍显式删除全部子记录，不依赖级联。
+"""
+import logging
+from datetime import datetime, timezone, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from utils import similarity
+from utils.ical import invalidate_feeds
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+PURGE_JOB = 'purge.deleted'
+
+_criteria = None
+_listening = False
+
+
+def _hide_deleted(execute_state):
+    global _criteria
+    if (not execute_state.is_select or execute_state.is_column_load or execute_state.is_relationship_load
+            or execute_state.execution_options.get('include_deleted', False)):
+        return
+    if _criteria is None:
+        from models import Activity, User
+        _criteria = (
+            with_loader_criteria(Activity, Activity.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True),
+        )
+    execute_state.statement = execute_state.statement.options(*_criteria)
+
+
+def schedule_purge():
+    """提交清理任务；已有排队中的任务时不重复提交，一个任务会清理当时所有待删除的行"""
+    from extensions import db
+    from models import Job
+
+    queued = db.session.scalar(
+        db.select(db.func.count(Job.id)).where(Job.name == PURGE_JOB, Job.status == 'queued')
+    )
+    if not queued:
+        enqueue(PURGE_JOB, priority=-1, delay=current_app.config['PURGE_DELAY'])
+
+
+def soft_delete_activity(activity):
+    """标记活动为已删除并扣减发起人的发起数（调用方负责提交，提交后调用 schedule_purge()）"""
+    from utils.counters import release_activity_counters
+
+    release_activity_counters(activity)
+    activity.deleted_at = datetime.now(timezone.utc)
+
+
+def soft_delete_users(ids, chunk_size=None):
+    """标记用户为已删除，返回标记的行数（调用方负责提交，提交后调用 schedule_purge()）"""
+    from extensions import db
+    from models import User
+
+    chunk_size = chunk_size or current_app.config['PURGE_CHUNK_SIZE']
+    now = datetime.now(timezone.utc)
+    count = 0
+    for start in range(0, len(ids), chunk_size):
+        count += db.session.execute(
+            db.update(User).where(User.id.in_(ids[start:start + chunk_size]), User.deleted_at.is_(None))
+            .values(deleted_at=now).execution_options(synchronize_session=False)
+        ).rowcount
+    return count
+
+
+def _delete_rows(db, model, condition, chunk_size, counters=()):
+    """分块删除满足条件的行，每块一个事务；counters 为 (计数所在模型, 本表外键列名, 计数列名)，同一事务中按块扣减"""
+    deleted = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(model.id).where(condition).order_by(model.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return deleted
+        for target, key, column in counters:
+            foreign_key = getattr(model, key)
+            removed = db.select(db.func.count(model.id)).where(
+                model.id.in_(ids), foreign_key == target.id
+            ).scalar_subquery()
+            db.session.execute(
+                db.update(target)
+                .where(target.id.in_(db.select(foreign_key).where(model.id.in_(ids))))
+                .values({column: getattr(target, column) - removed})
+                .execution_options(synchronize_session=False)
+            )
+        db.session.execute(
+            db.delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += len(ids)
+
+
+def _cutoff():
+    return datetime.now(timezone.utc) - timedelta(seconds=current_app.config['PURGE_DELAY'])
+
+
+def _pending_ids(db, model, batch_size, cutoff):
+    return db.session.scalars(
+        db.select(model.id).where(model.deleted_at.is_not(None), model.deleted_at <= cutoff)
+        .order_by(model.id).limit(batch_size).execution_options(include_deleted=True)
+    ).all()
+
+
+def _next_due():
+    """还没到清理时间的软删除行中，最早可以清理的时间；没有时返回 None"""
+    from extensions import db
+    from models import Activity, User
+
+    earliest = [
+        db.session.scalar(db.select(db.func.min(model.deleted_at)).execution_options(include_deleted=True))
+        for model in (Activity, User)
+    ]
+    earliest = [value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+                for value in earliest if value is not None]
+    if not earliest:
+        return None
+    return min(earliest) + timedelta(seconds=current_app.config['PURGE_DELAY'])
+
+
+def purge_deleted_activities(batch_size=None, chunk_size=None):
+    """删除已软删除的活动及其报名、评论、点赞、通知和相似活动，返回各表删除的行数"""
+    from extensions import db
+    from models import Activity, User, Participation, Comment, Like, Notification
+
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+    chunk_size = chunk_size or current_app.config['PURGE_CHUNK_SIZE']
+    children = [
+        (Participation, ((User, 'user_id', 'joined_count'),)),
+        (Comment, ((User, 'user_id', 'comments_count'),)),
+        (Like, ((User, 'user_id', 'likes_given_count'),)),
+        (Notification, ()),
+    ]
+    totals = {model.__tablename__: 0 for model in [Activity] + [model for model, _ in children]}
+    cutoff = _cutoff()
+    purged = []
+    while True:
+        activity_ids = _pending_ids(db, Activity, batch_size, cutoff)
+        if not activity_ids:
+            similarity.remove_from_index(purged)
+            return totals
+        # 报名者的日历在这里失效，删除请求不必按报名人数逐个处理
+        invalidate_feeds(user_ids=db.session.scalars(
+            db.select(Participation.user_id).where(Participation.activity_id.in_(activity_ids))
+        ).all())
+        for model, counters in children:
+            totals[model.__tablename__] += _delete_rows(
+                db, model, model.activity_id.in_(activity_ids), chunk_size, counters
+            )
+        similarity.delete_rows(activity_ids)
+        totals[Activity.__tablename__] += db.session.execute(
+            db.delete(Activity).where(Activity.id.in_(activity_ids), Activity.deleted_at.is_not(None))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        purged.extend(activity_ids)
+
+
+def purge_deleted_users(batch_size=None, chunk_size=None):
+    """删除已软删除的用户及其报名、点赞和通知，返回各表删除的行数
+
+    报名和点赞按块扣减对应活动的人数和点赞数；发起/审核的活动、评论、归档记录和任务保留，用户列置空。
+    """
+    from extensions import db
+    from models import (User, Activity, Participation, Comment, Like, Notification, Job,
+                        ArchivedActivity, ArchivedParticipation, ArchivedComment, ArchivedLike,
+                        ArchivedNotification)
+
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+    chunk_size = chunk_size or current_app.config['PURGE_CHUNK_SIZE']
+    children = [
+        (Participation, ((Activity, 'activity_id', 'current_participants'),)),
+        (Like, ((Activity, 'activity_id', 'likes_count'),)),
+        (Notification, ()),
+        (ArchivedNotification, ()),
+    ]
+    nullified = [
+        (Activity, ('organizer_id', 'reviewer_id')), (ArchivedActivity, ('organizer_id', 'reviewer_id')),
+        (Comment, ('user_id',)), (ArchivedComment, ('user_id',)),
+        (ArchivedParticipation, ('user_id',)), (ArchivedLike, ('user_id',)), (Job, ('user_id',)),
+    ]
+    totals = {model.__tablename__: 0 for model in [User] + [model for model, _ in children]}
+    cutoff = _cutoff()
+    while True:
+        user_ids = _pending_ids(db, User, batch_size, cutoff)
+        if not user_ids:
+            return totals
+        invalidate_feeds(user_ids=user_ids)
+        for model, counters in children:
+            totals[model.__tablename__] += _delete_rows(
+                db, model, model.user_id.in_(user_ids), chunk_size, counters
+            )
+        for model, names in nullified:
+            for name in names:
+                db.session.execute(
+                    db.update(model).where(getattr(model, name).in_(user_ids)).values({name: None})
+                    .execution_options(synchronize_session=False)
+                )
+        totals[User.__tablename__] += db.session.execute(
+            db.delete(User).where(User.id.in_(user_ids), User.deleted_at.is_not(None))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+
+
+def purge_deleted(batch_size=None, chunk_size=None):
+    totals = purge_deleted_activities(batch_size, chunk_size)
+    for table, count in purge_deleted_users(batch_size, chunk_size).items():
+        totals[table] = totals.get(table, 0) + count
+    if any(totals.values()):
+        logger.info('已清理软删除的数据：%s', totals)
+    return totals
+
+
+@job(PURGE_JOB)
+def purge_job(payload, context):
+    totals = purge_deleted(batch_size=payload.get('batch_size'), chunk_size=payload.get('chunk_size'))
+    # 本任务排队后又删除的行还没到期，schedule_purge 当时因为已有排队中的任务没有再提交，在这里补上
+    due = _next_due()
+    if due is not None:
+        from extensions import db
+        from models import Job
+        queued = db.session.scalar(
+            db.select(db.func.count(Job.id)).where(Job.name == PURGE_JOB, Job.status == 'queued')
+        )
+        if not queued:
+            enqueue(PURGE_JOB, payload, priority=-1, run_at=due + timedelta(seconds=1))
+    return totals
+
+
+purge_cli = AppGroup('purge', help='清理已删除的活动和用户')
+
+
+@purge_cli.command('run')
+@click.option('--batch-size', type=int, default=None, help='每批活动/用户数，默认 PURGE_BATCH_SIZE')
+@click.option('--chunk-size', type=int, default=None, help='每条 DELETE 的行数，默认 PURGE_CHUNK_SIZE')
+@click.option('--background', is_flag=True, help='提交为后台任务，而不是立即执行')
+def run_command(batch_size, chunk_size, background):
+    """真正删除删除时间早于 PURGE_DELAY 秒前的活动和用户及其子记录"""
+    if background:
+        queued = enqueue(PURGE_JOB, {'batch_size': batch_size, 'chunk_size': chunk_size}, priority=-1)
+        click.echo(f'已提交清理任务 {queued.id}')
+        return
+    for table, count in purge_deleted(batch_size, chunk_size).items():
+        click.echo(f'{table}: {count}')
+
+
+def init_app(app):
+    global _listening
+    app.config.setdefault('PURGE_BATCH_SIZE', 100)
+    app.config.setdefault('PURGE_CHUNK_SIZE', 1000)
+    app.config.setdefault('PURGE_DELAY', 60)
+    if not _listening:
+        event.listen(Session, 'do_orm_execute', _hide_deleted)
+        _listening = True
+    app.cli.add_command(purge_cli)
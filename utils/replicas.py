@@ -0,0 +1,229 @@
+"""只读副本路由：GET/HEAD 请求的查询发往副本，写操作和其余请求留在主库
+
+副本在 DATABASE_REPLICA_URLS 中配置，每个副本是一个 bind（replica0、replica1 ...），db.session 使用 RoutingSession：
+- 请求开始时，GET/HEAD/OPTIONS 请求从健康的副本中随机选一个，整个请求都用它；其他方法、请求之外（任务、命令行）都走主库
+- 只有普通 SELECT 发往副本；flush、INSERT/UPDATE/DELETE、SELECT ... FOR UPDATE 和 text() 语句都走主库。
+  同一个请求一旦写过数据，后面的查询也改走主库，保证读到自己刚写的内容
+- 读自己的写（read-your-writes）：请求中写过数据后，会话 cookie 里记下 DB_READ_YOUR_WRITES_SECONDS 秒的截止时间，
+  这段时间内同一用户的读请求都走主库，提交表单后跳转回来的页面不会因为副本延迟看不到刚提交的内容
+
+延迟检测：每个进程有一个后台线程，每 DB_REPLICA_CHECK_INTERVAL 秒在主库的 replica_heartbeat 表写入当前时间，
+再从各副本读回，二者之差就是复制延迟。延迟超过 DB_REPLICA_MAX_LAG 秒、读取失败或还没检测过的副本不参与路由，
+所有副本都不可用时读请求回到主库。副本在两次检测之间宕机时，期间的请求会报错，下次检测后恢复。
+
+本地测试可以用两个 SQLite 文件，`flask replicas sync` 把主库整体复制到副本，模拟一次复制：
+
+    DATABASE_URL=sqlite:////tmp/primary.db DATABASE_REPLICA_URLS=sqlite:////tmp/replica.db flask --app app replicas sync
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import click
+from flask import current_app, g, has_request_context, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+STICKY_SESSION_KEY = '_db_primary_until'
+
+
+class RoutingSession(Session):
+    """在 Flask-SQLAlchemy 按 bind_key 选引擎的基础上，把请求内的只读查询发往副本"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not router.replicas or not has_request_context():
+            return engine
+        if self._flushing or getattr(clause, 'is_dml', False):
+            g.db_wrote = True
+            g.db_replica = None
+            return engine
+        replica = g.get('db_replica')
+        if replica is None or engine is not self._db.engine:
+            return engine
+        if not getattr(clause, 'is_select', False) or getattr(clause, '_for_update_arg', None) is not None:
+            return engine
+        return replica
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        # [(bind 名称, 引擎)]
+        self.replicas = []
+        # bind 名称 -> {'lag': 秒或 None, 'healthy': bool, 'error': str 或 None, 'checked_at': time.time()}
+        self.status = {}
+        self.app = None
+        self._monitor_pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        from extensions import db
+
+        self.app = app
+        with app.app_context():
+            engines = db.engines
+            self.replicas = [(name, engines[name]) for name in app.config['DB_REPLICA_BINDS']]
+        self.status = {name: {'lag': None, 'healthy': False, 'error': '尚未检测', 'checked_at': None}
+                       for name, _ in self.replicas}
+
+    def pick(self):
+        """随机选一个健康的副本引擎，没有时返回 None"""
+        healthy = [engine for name, engine in self.replicas if self.status[name]['healthy']]
+        return random.choice(healthy) if healthy else None
+
+    def beat(self):
+        """在主库写入心跳"""
+        from extensions import db
+        from models import ReplicaHeartbeat
+
+        table = ReplicaHeartbeat.__table__
+        now = _utcnow()
+        with db.engine.begin() as conn:
+            if conn.execute(table.update().where(table.c.id == 1).values(beat_at=now)).rowcount == 0:
+                conn.execute(table.insert().values(id=1, beat_at=now))
+
+    def check(self):
+        """写一次心跳，再读出各副本的延迟，更新 status"""
+        from models import ReplicaHeartbeat
+
+        table = ReplicaHeartbeat.__table__
+        max_lag = current_app.config['DB_REPLICA_MAX_LAG']
+        if current_app.config['DB_REPLICA_HEARTBEAT']:
+            try:
+                self.beat()
+            except Exception:
+                # 多个进程同时插入第一行时可能冲突，下一轮改为 UPDATE
+                logger.exception('写入副本心跳失败')
+        for name, engine in self.replicas:
+            lag, error = None, None
+            try:
+                with engine.connect() as conn:
+                    beat_at = conn.execute(table.select().with_only_columns(table.c.beat_at)
+                                           .where(table.c.id == 1)).scalar()
+                if beat_at is None:
+                    error = '副本上还没有心跳'
+                else:
+                    if beat_at.tzinfo is not None:
+                        beat_at = beat_at.astimezone(timezone.utc).replace(tzinfo=None)
+                    lag = max((_utcnow() - beat_at).total_seconds(), 0.0)
+            except Exception as exc:
+                error = f'{type(exc).__name__}: {exc}'
+            healthy = error is None and lag <= max_lag
+            previous = self.status.get(name, {}).get('healthy')
+            if previous and not healthy:
+                logger.warning('副本 %s 不可用，读请求改走主库：%s', name, error or f'延迟 {lag:.1f} 秒')
+            elif previous is False and healthy and self.status[name]['checked_at'] is not None:
+                logger.info('副本 %s 恢复，延迟 %.1f 秒', name, lag)
+            self.status[name] = {'lag': lag, 'healthy': healthy, 'error': error, 'checked_at': time.time()}
+        return self.status
+
+    def ensure_monitor(self):
+        if not self.replicas or self._monitor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._monitor_pid == os.getpid():
+                return
+            self._monitor_pid = os.getpid()
+            threading.Thread(target=self._monitor, name='replica-monitor', daemon=True).start()
+
+    def _monitor(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.check()
+                except Exception:
+                    logger.exception('检测副本延迟失败')
+                interval = current_app.config['DB_REPLICA_CHECK_INTERVAL']
+            time.sleep(interval)
+
+
+router = ReplicaRouter()
+
+
+def _choose_route():
+    g.db_replica = None
+    if not router.replicas:
+        return
+    router.ensure_monitor()
+    if request.method not in SAFE_METHODS:
+        return
+    if session.get(STICKY_SESSION_KEY, 0) > time.time():
+        return
+    g.db_replica = router.pick()
+
+
+def _remember_write(response):
+    if g.pop('db_wrote', False):
+        session[STICKY_SESSION_KEY] = time.time() + current_app.config['DB_READ_YOUR_WRITES_SECONDS']
+    return response
+
+
+def _sqlite_path(engine):
+    if engine.dialect.name != 'sqlite' or not engine.url.database or engine.url.database == ':memory:':
+        return None
+    return engine.url.database
+
+
+replicas_cli = AppGroup('replicas', help='只读副本')
+
+
+@replicas_cli.command('status')
+def status_command():
+    """写一次心跳并显示各副本的延迟"""
+    if not router.replicas:
+        click.echo('没有配置副本（DATABASE_REPLICA_URLS）')
+        return
+    for name, state in router.check().items():
+        lag = f"{state['lag']:.2f} 秒" if state['lag'] is not None else '-'
+        click.echo(f"{name}: {'可用' if state['healthy'] else '不可用'}，延迟 {lag}"
+                   + (f"，{state['error']}" if state['error'] else ''))
+
+
+@replicas_cli.command('sync')
+def sync_command():
+    """本地测试用：把 SQLite 主库完整复制到各 SQLite 副本"""
+    from extensions import db
+
+    source_path = _sqlite_path(db.engine)
+    if source_path is None:
+        raise click.ClickException('只支持 SQLite 文件数据库，真实副本请使用数据库自身的复制')
+    router.beat()
+    source = sqlite3.connect(source_path)
+    try:
+        for name, engine in router.replicas:
+            target_path = _sqlite_path(engine)
+            if target_path is None:
+                raise click.ClickException(f'副本 {name} 不是 SQLite 文件数据库')
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            click.echo(f'已复制到 {name}（{target_path}）')
+    finally:
+        source.close()
+
+
+def init_app(app):
+    app.config.setdefault('DB_REPLICA_BINDS', {})
+    app.config.setdefault('DB_REPLICA_MAX_LAG', float(os.environ.get('DB_REPLICA_MAX_LAG', 5)))
+    app.config.setdefault('DB_REPLICA_CHECK_INTERVAL', float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 1)))
+    # 关闭后由其他进程负责写心跳（例如只在一个进程里开启）
+    app.config.setdefault('DB_REPLICA_HEARTBEAT', os.environ.get('DB_REPLICA_HEARTBEAT', '1') == '1')
+    app.config.setdefault('DB_READ_YOUR_WRITES_SECONDS', float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 10)))
+    app.cli.add_command(replicas_cli)
+    router.configure(app)
+    if router.replicas:
+        app.before_request(_choose_route)
+        app.after_request(_remember_write)
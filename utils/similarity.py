@@ -0,0 +1,422 @@
+"""相似活动：按标题、标签和简介的内容相似度，为每个活动预先算好前 SIMILARITY_TOP_K 个邻居
+
+- 向量化：文本按汉字连续段切成 1~2 字的字符 n-gram（英文和数字按整词），标签另加整个标签作为一个词；
+  标题和标签的权重是简介的两倍。词经 CRC32 哈希到 SIMILARITY_FEATURES 维（不需要保存词表，增量更新时
+  新词也有固定的列），取次线性 tf × idf 后按行做 L2 归一化，余弦相似度即稀疏矩阵乘积。
+- 批量重建（similarity.rebuild 任务，每天一次，或 flask similarity rebuild）：对热表中的全部活动拟合 idf，
+  每 SIMILARITY_BLOCK_SIZE 行与整个矩阵相乘，取得分不低于 SIMILARITY_MIN_SCORE 的前 K 个写入 activity_similarity，
+  每块一个事务；矩阵和 idf 保存到 SIMILARITY_INDEX_PATH 供增量更新使用。
+- 增量更新（similarity.update 任务）：创建或修改了标题、简介、标签后提交，用保存的 idf 计算该活动的向量，
+  与矩阵相乘得到它的邻居，同时把它插入（或移出）得分足够高的其他活动的列表。被挤出某个列表的活动
+  不会补回第 K+1 名，等下一次批量重建。多个 worker 进程同时写矩阵文件时以最后写入的为准，同样由批量重建兜底。
+- 清理和归档活动时在同一事务中删除相关的 activity_similarity 行（delete_rows），提交后把它们移出矩阵
+  （remove_from_index）；增量更新前还会去掉矩阵中已不在热表的活动，不会写入指向不存在活动的行。
+- 详情页只做一次按主键 (activity_id, rank) 的查询，不在请求中加载 NumPy/SciPy。
+"""
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from utils.jobs import job, enqueue
+
+logger = logging.getLogger(__name__)
+
+REBUILD_JOB = 'similarity.rebuild'
+UPDATE_JOB = 'similarity.update'
+
+_SEGMENT = re.compile(r'[\u4e00-\u9fff]+|[a-z0-9]+')
+_TAG_SEPARATOR = re.compile(r'[,，、;；\s]+')
+FIELD_WEIGHTS = (('title', 2.0), ('tags', 2.0), ('description', 1.0))
+
+SimilarityIndex = namedtuple('SimilarityIndex', 'ids matrix idf')
+
+# (mtime_ns, 大小, SimilarityIndex)
+_cached = None
+_lock = threading.Lock()
+
+
+def _ngrams(text, max_n):
+    for segment in _SEGMENT.findall((text or '').lower()):
+        if segment.isascii():
+            yield segment
+            continue
+        for n in range(1, max_n + 1):
+            for start in range(len(segment) - n + 1):
+                yield segment[start:start + n]
+
+
+def _tokens(row, field, max_n):
+    value = getattr(row, field)
+    if field != 'tags':
+        return _ngrams(value, max_n)
+    tags = [tag for tag in _TAG_SEPARATOR.split((value or '').lower()) if tag]
+    return [f'#{tag}' for tag in tags] + [token for tag in tags for token in _ngrams(tag, max_n)]
+
+
+def _term_matrix(rows, config):
+    """行 -> 加权词频的 CSR 矩阵（已取次线性 tf）"""
+    import numpy as np
+    from scipy import sparse
+
+    n_features, max_n = config['SIMILARITY_FEATURES'], config['SIMILARITY_NGRAM']
+    indptr, indices, data = [0], [], []
+    for row in rows:
+        counts = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in _tokens(row, field, max_n):
+                column = zlib.crc32(token.encode()) % n_features
+                counts[column] = counts.get(column, 0.0) + weight
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(rows), n_features)
+    )
+    matrix.data = 1 + np.log(matrix.data)
+    return matrix
+
+
+def _weight(matrix, idf):
+    """乘以 idf 并按行 L2 归一化（原地修改并返回）"""
+    import numpy as np
+    from scipy import sparse
+
+    matrix.data *= idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def _fit(rows, config):
+    import numpy as np
+
+    matrix = _term_matrix(rows, config)
+    document_frequency = np.bincount(matrix.indices, minlength=config['SIMILARITY_FEATURES'])
+    idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return _weight(matrix, idf).tocsr(), idf
+
+
+def _load_rows(activity_ids=None):
+    from extensions import db
+    from models import Activity
+
+    statement = db.select(Activity.id, Activity.title, Activity.description, Activity.tags).order_by(Activity.id)
+    if activity_ids is not None:
+        statement = statement.where(Activity.id.in_(activity_ids))
+    return db.session.execute(statement).all()
+
+
+def _top_k(scores, k, min_score):
+    """scores: (行数, N) 的稠密矩阵，返回每行 [(列号, 得分), ...]，按得分降序"""
+    import numpy as np
+
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return [[] for _ in range(scores.shape[0])]
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return [
+        [(int(column), float(score)) for column, score in zip(row_columns, row_scores) if score >= min_score]
+        for row_columns, row_scores in zip(candidates, top)
+    ]
+
+
+def _replace_neighbours(db, neighbours):
+    """neighbours: {活动id: [(相似活动id, 得分), ...]}，整体替换这些活动的邻居列表（调用方负责提交）"""
+    from models import ActivitySimilarity
+
+    if not neighbours:
+        return
+    db.session.execute(
+        db.delete(ActivitySimilarity).where(ActivitySimilarity.activity_id.in_(list(neighbours)))
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        {'activity_id': activity_id, 'rank': rank, 'similar_id': similar_id, 'score': score}
+        for activity_id, items in neighbours.items()
+        for rank, (similar_id, score) in enumerate(items)
+    ]
+    if rows:
+        db.session.execute(db.insert(ActivitySimilarity), rows)
+
+
+def _save_index(index):
+    import numpy as np
+
+    path = current_app.config['SIMILARITY_INDEX_PATH']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as output:
+        np.savez(output, ids=index.ids, idf=index.idf, data=index.matrix.data, indices=index.matrix.indices,
+                 indptr=index.matrix.indptr, shape=np.array(index.matrix.shape))
+    os.replace(temp_path, path)
+
+
+def load_index():
+    """读取批量重建保存的矩阵，文件没有变化时复用进程内的副本；还没有重建过时返回 None"""
+    global _cached
+    import numpy as np
+    from scipy import sparse
+
+    path = current_app.config['SIMILARITY_INDEX_PATH']
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if _cached and _cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return _cached[2]
+    with np.load(path) as saved:
+        index = SimilarityIndex(
+            saved['ids'], sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                            shape=tuple(saved['shape'])), saved['idf']
+        )
+    _cached = (stat.st_mtime_ns, stat.st_size, index)
+    return index
+
+
+def _prune(index):
+    """去掉矩阵中已经不在热表的活动（已删除、已清理或已归档），返回 (索引, 是否有变化)"""
+    import numpy as np
+    from extensions import db
+    from models import Activity
+
+    existing = np.fromiter(db.session.scalars(db.select(Activity.id)), dtype=np.int64)
+    keep = np.isin(index.ids, existing)
+    if keep.all():
+        return index, False
+    return SimilarityIndex(index.ids[keep], index.matrix[keep], index.idf), True
+
+
+def delete_rows(activity_ids):
+    """删除这些活动自己的和指向它们的邻居行，在删除或归档活动的同一事务中、删除活动之前调用（调用方负责提交）"""
+    from extensions import db
+    from models import ActivitySimilarity
+
+    if activity_ids:
+        db.session.execute(
+            db.delete(ActivitySimilarity)
+            .where(db.or_(ActivitySimilarity.activity_id.in_(activity_ids),
+                          ActivitySimilarity.similar_id.in_(activity_ids)))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def remove_from_index(activity_ids):
+    """活动被清理或归档后调用，从保存的矩阵中移除，增量更新不会再把它们选为邻居"""
+    global _cached
+    import numpy as np
+
+    if not activity_ids:
+        return
+    with _lock:
+        index = load_index()
+        if index is None:
+            return
+        keep = ~np.isin(index.ids, np.asarray(activity_ids, dtype=np.int64))
+        if keep.all():
+            return
+        _save_index(SimilarityIndex(index.ids[keep], index.matrix[keep], index.idf))
+        _cached = None
+
+
+def rebuild_similarity(block_size=None):
+    """重新计算热表中全部活动的邻居，返回 {'activities': 活动数, 'pairs': 写入的邻居数}"""
+    global _cached
+    import numpy as np
+    from extensions import db
+    from models import Activity, ActivitySimilarity
+
+    config = current_app.config
+    block_size = block_size or config['SIMILARITY_BLOCK_SIZE']
+    with _lock:
+        rows = _load_rows()
+        ids = np.array([row.id for row in rows], dtype=np.int64)
+        matrix, idf = _fit(rows, config)
+        # 稀疏乘稀疏在同类活动多时结果几乎是稠密的，换成只取本块出现过的特征列做稀疏乘稠密
+        by_column = matrix.tocsc()
+        pairs = 0
+        for start in range(0, len(rows), block_size):
+            end = min(start + block_size, len(rows))
+            block = matrix[start:end]
+            columns = np.unique(block.indices)
+            scores = (by_column[:, columns] @ block[:, columns].toarray().T).T
+            scores[np.arange(end - start), np.arange(start, end)] = -1
+            neighbours = {
+                int(ids[start + offset]): [(int(ids[column]), score) for column, score in items]
+                for offset, items in enumerate(_top_k(scores, config['SIMILARITY_TOP_K'], config['SIMILARITY_MIN_SCORE']))
+            }
+            _replace_neighbours(db, neighbours)
+            db.session.commit()
+            pairs += sum(len(items) for items in neighbours.values())
+        # 已归档或已删除的活动留下的行
+        db.session.execute(
+            db.delete(ActivitySimilarity)
+            .where(ActivitySimilarity.activity_id.not_in(db.select(Activity.id)))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        index = SimilarityIndex(ids, matrix, idf)
+        _save_index(index)
+        _cached = None
+    logger.info('相似活动重建完成：%d 个活动，%d 对邻居', len(rows), pairs)
+    return {'activities': len(rows), 'pairs': pairs}
+
+
+def update_activity(activity_id):
+    """活动创建或修改内容后调用：重算它的邻居，并更新可能因它而变化的其他活动的列表"""
+    global _cached
+    import numpy as np
+    from scipy import sparse
+    from extensions import db
+    from models import ActivitySimilarity
+
+    config = current_app.config
+    top_k, min_score = config['SIMILARITY_TOP_K'], config['SIMILARITY_MIN_SCORE']
+    with _lock:
+        index = load_index()
+        if index is None:
+            return None
+        # 上次重建之后删除或归档的活动可能还在矩阵里，邻居只能从热表中现存的活动里选，否则写入时违反外键
+        index, pruned = _prune(index)
+        rows = _load_rows([activity_id])
+        if not rows:
+            # 本身已删除或已归档：别的列表里的它由显示时的连接过滤、清理或归档时删除
+            _replace_neighbours(db, {activity_id: []})
+            db.session.commit()
+            if pruned:
+                _save_index(index)
+                _cached = None
+            return {'neighbours': 0, 'updated': 0}
+
+        positions = np.flatnonzero(index.ids == activity_id)
+        vector = _weight(_term_matrix(rows, config), index.idf).tocsr()
+        if len(positions):
+            position = int(positions[0])
+            matrix = sparse.vstack([index.matrix[:position], vector, index.matrix[position + 1:]], format='csr')
+            ids = index.ids
+        else:
+            position = len(index.ids)
+            matrix = sparse.vstack([index.matrix, vector], format='csr')
+            ids = np.append(index.ids, activity_id)
+        scores = (matrix @ vector.T).toarray().ravel()
+        scores[position] = -1
+        own = [(int(ids[column]), score) for column, score in _top_k(scores[np.newaxis, :], top_k, min_score)[0]]
+        changes = {activity_id: own}
+
+        # 反向更新：得分最高的若干个活动可能要把它加入列表，原来列表中有它的活动要更新或移除它的得分
+        close = [(int(ids[column]), score) for column, score in
+                 _top_k(scores[np.newaxis, :], config['SIMILARITY_REVERSE_CANDIDATES'], min_score)[0]]
+        new_scores = dict(close)
+        listing = db.session.scalars(
+            db.select(ActivitySimilarity.activity_id).where(ActivitySimilarity.similar_id == activity_id)
+        ).all()
+        for column in np.flatnonzero(np.isin(ids, listing)):
+            if scores[column] >= min_score:
+                new_scores.setdefault(int(ids[column]), float(scores[column]))
+        # 列出它的活动可能已软删除、还没清理
+        candidates = (set(new_scores) | set(listing)) & set(ids.tolist())
+        candidates.discard(activity_id)
+        current = {}
+        if candidates:
+            for row in db.session.execute(
+                db.select(ActivitySimilarity.activity_id, ActivitySimilarity.similar_id, ActivitySimilarity.score)
+                .where(ActivitySimilarity.activity_id.in_(candidates))
+                .order_by(ActivitySimilarity.activity_id, ActivitySimilarity.rank)
+            ):
+                current.setdefault(row.activity_id, []).append((row.similar_id, row.score))
+        for other_id in candidates:
+            before = current.get(other_id, [])
+            after = [item for item in before if item[0] != activity_id]
+            if other_id in new_scores:
+                after.append((activity_id, new_scores[other_id]))
+            after = sorted(after, key=lambda item: item[1], reverse=True)[:top_k]
+            if after != before:
+                changes[other_id] = after
+        _replace_neighbours(db, changes)
+        db.session.commit()
+        _save_index(SimilarityIndex(ids, matrix, index.idf))
+        _cached = None
+    return {'neighbours': len(own), 'updated': len(changes) - 1}
+
+
+def similar_activities(activity_id, limit=None):
+    """详情页的“相似活动”：按预先算好的排名取已通过审核的活动，一次主键范围查询"""
+    from extensions import db
+    from models import Activity, ActivitySimilarity
+
+    return db.session.scalars(
+        db.select(Activity)
+        .join(ActivitySimilarity, ActivitySimilarity.similar_id == Activity.id)
+        .where(ActivitySimilarity.activity_id == activity_id, Activity.is_approved == True,
+               Activity.status == 'active')
+        .order_by(ActivitySimilarity.rank)
+        .limit(limit or current_app.config['SIMILARITY_SHOWN'])
+    ).all()
+
+
+def schedule_update(activity_id):
+    enqueue(UPDATE_JOB, {'activity_id': activity_id}, priority=-2)
+
+
+@job(UPDATE_JOB)
+def update_job(payload, context):
+    result = update_activity(payload['activity_id'])
+    if result is None:
+        # 还没有重建过索引：直接全量计算一次
+        return rebuild_similarity()
+    return result
+
+
+@job(REBUILD_JOB)
+def rebuild_job(payload, context):
+    result = rebuild_similarity(block_size=payload.get('block_size'))
+    # 每天执行一次，已有排队中的任务时不重复排
+    from extensions import db
+    from models import Job
+    queued = db.session.scalar(
+        db.select(db.func.count(Job.id)).where(Job.name == REBUILD_JOB, Job.status == 'queued')
+    )
+    if not queued:
+        enqueue(REBUILD_JOB, payload, priority=-5, delay=current_app.config['SIMILARITY_INTERVAL'])
+    return result
+
+
+similarity_cli = AppGroup('similarity', help='相似活动索引')
+
+
+@similarity_cli.command('rebuild')
+@click.option('--block-size', type=int, default=None, help='每次相乘的行数，默认 SIMILARITY_BLOCK_SIZE')
+@click.option('--background', is_flag=True, help='提交为后台任务（之后每天自动执行），而不是立即执行')
+def rebuild_command(block_size, background):
+    """重新计算全部活动的相似活动"""
+    if background:
+        queued = enqueue(REBUILD_JOB, {'block_size': block_size}, priority=-5)
+        click.echo(f'已提交相似活动重建任务 {queued.id}')
+        return
+    result = rebuild_similarity(block_size=block_size)
+    click.echo(f"{result['activities']} 个活动，{result['pairs']} 对邻居")
+
+
+def init_app(app):
+    app.config.setdefault('SIMILARITY_INDEX_PATH', os.environ.get(
+        'SIMILARITY_INDEX_PATH', os.path.join(app.instance_path, 'similarity', 'index.npz')))
+    app.config.setdefault('SIMILARITY_FEATURES', 2 ** 18)
+    app.config.setdefault('SIMILARITY_NGRAM', 2)
+    app.config.setdefault('SIMILARITY_TOP_K', 10)
+    app.config.setdefault('SIMILARITY_MIN_SCORE', 0.05)
+    app.config.setdefault('SIMILARITY_BLOCK_SIZE', 256)
+    app.config.setdefault('SIMILARITY_REVERSE_CANDIDATES', 200)
+    app.config.setdefault('SIMILARITY_SHOWN', 5)
+    app.config.setdefault('SIMILARITY_INTERVAL', 86400)
+    app.cli.add_command(similarity_cli)
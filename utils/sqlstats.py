@@ -0,0 +1,196 @@
+"""按请求统计 SQL：语句数、数据库耗时、最慢的几条语句，以及同一请求内反复出现的同形语句（N+1）
+
+在 Engine 类上挂 before/after_cursor_execute 事件，对所有引擎生效。语句的“形状”是去掉空白差异、
+并把展开后的 IN (?, ?, ...) 合并成 IN (?) 之后的 SQL 文本；参数都是绑定参数，所以循环里逐行懒加载
+（例如模板里的 p.activity、activity.organizer）会产生同一个形状，出现 SQL_NPLUSONE_THRESHOLD 次以上即视为 N+1。
+
+结果的出口：
+- 调试模式（或 SQL_STATS_HEADERS=True）下写入响应头 X-SQL-Count、X-SQL-Time、X-SQL-Repeated 和 Server-Timing
+- 请求耗时、语句数超过阈值或发现 N+1 时，记一条带结构化字段的 utils.sqlstats 日志（经 utils.logs 输出为一行 JSON）
+- SQL_STATS_STRICT=True 时发现 N+1 直接抛出 NPlusOneError，供测试使用
+
+请求之外（任务、命令行、脚本）可以用 capture() 统计一段代码：
+
+    with capture() as stats:
+        run_job(job_id)
+    assert not stats.repeated(5)
+"""
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_IN_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+_SPACES = re.compile(r'\s+')
+_local = threading.local()
+_listening = False
+
+
+class NPlusOneError(RuntimeError):
+    """严格模式下，一个请求里同形语句重复次数超过阈值"""
+
+
+def statement_shape(statement):
+    return _SPACES.sub(' ', _IN_LIST.sub('(?)', statement)).strip()
+
+
+class SQLStats:
+    """一段代码（通常是一个请求）执行的 SQL 统计"""
+
+    def __init__(self, top=5):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+        self.top = top
+        self._slowest = []
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        item = (seconds, self.count, shape)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """[(秒数, 语句形状)]，从慢到快"""
+        return [(seconds, shape) for seconds, _, shape in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """重复次数不少于 threshold 的语句形状：[(次数, 形状)]，从多到少"""
+        return sorted(((count, shape) for shape, count in self.shapes.items() if count >= threshold), reverse=True)
+
+    def as_dict(self, threshold):
+        return {
+            'sql_count': self.count,
+            'sql_ms': round(self.seconds * 1000, 2),
+            'slowest': [{'ms': round(seconds * 1000, 2), 'sql': shape} for seconds, shape in self.slowest],
+            'repeated': [{'count': count, 'sql': shape} for count, shape in self.repeated(threshold)],
+        }
+
+
+def _active_stats():
+    captured = getattr(_local, 'stack', None)
+    if captured:
+        return captured[-1]
+    if has_request_context():
+        return g.get('sql_stats')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_stats() is not None:
+        conn.info.setdefault('sql_stats_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('sql_stats_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _active_stats()
+    if stats is not None:
+        stats.add(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    # 出错的语句不会触发 after_cursor_execute，丢掉它的开始时间
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('sql_stats_started'):
+        connection.info['sql_stats_started'].pop()
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+
+@contextmanager
+def capture(top=5):
+    """统计 with 块内当前线程执行的 SQL（可嵌套，只记到最内层）"""
+    _listen()
+    stats = SQLStats(top)
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.pop()
+
+
+def _start_request():
+    config = current_app.config
+    if config['SQL_STATS_ENABLED']:
+        g.sql_stats = SQLStats(config['SQL_STATS_TOP'])
+        g.sql_stats_started = time.perf_counter()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    config = current_app.config
+    threshold = config['SQL_NPLUSONE_THRESHOLD']
+    duration_ms = (time.perf_counter() - g.pop('sql_stats_started')) * 1000
+    repeated = stats.repeated(threshold)
+
+    show_headers = config['SQL_STATS_HEADERS']
+    if show_headers is None:
+        show_headers = current_app.debug
+    if show_headers:
+        response.headers['X-SQL-Count'] = str(stats.count)
+        response.headers['X-SQL-Time'] = f'{stats.seconds * 1000:.2f}'
+        if repeated:
+            count, shape = repeated[0]
+            response.headers['X-SQL-Repeated'] = f'{count}x {shape[:200]}'.encode('ascii', 'replace').decode()
+        response.headers.add('Server-Timing', f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"')
+
+    if (duration_ms >= config['SQL_SLOW_REQUEST_MS'] or stats.count >= config['SQL_SLOW_REQUEST_QUERIES']
+            or repeated):
+        path = request.full_path.rstrip('?')
+        logger.warning('slow_request %s %s', request.method, path, extra={'data': {
+            'event': 'slow_request',
+            'method': request.method,
+            'path': path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            **stats.as_dict(threshold),
+        }})
+
+    if repeated and config['SQL_STATS_STRICT']:
+        count, shape = repeated[0]
+        raise NPlusOneError(f'{request.endpoint}: 同一条语句执行了 {count} 次（N+1）：{shape}')
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('SQL_STATS_ENABLED', os.environ.get('SQL_STATS_ENABLED', '1') == '1')
+    # None 表示跟随调试模式
+    app.config.setdefault('SQL_STATS_HEADERS', None)
+    app.config.setdefault('SQL_STATS_STRICT', os.environ.get('SQL_STATS_STRICT') == '1')
+    app.config.setdefault('SQL_STATS_TOP', 5)
+    app.config.setdefault('SQL_NPLUSONE_THRESHOLD', 10)
+    app.config.setdefault('SQL_SLOW_REQUEST_MS', 500)
+    app.config.setdefault('SQL_SLOW_REQUEST_QUERIES', 100)
+    _listen()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
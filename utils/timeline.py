@@ -0,0 +1,100 @@
+"""个人中心时间线：用户发起和参与的活动，按游标（keyset）分页
+
+每一页对热表和归档表各执行一次查询：WHERE (排序列, id) < 游标 ORDER BY 排序列 DESC, id DESC LIMIT n+1，
+走 (organizer_id, start_time) / (user_id, registered_at) 索引，翻到多深都只扫描 n+1 行，
+活动、场地通过 joinedload 在同一条语句中取出。两边结果在内存中归并后取前 n 条，
+第 n+1 条是否存在决定是否还有下一页。归档表中的 id 沿用热表 id，两表合并后 id 仍然唯一。
+"""
+import heapq
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import joinedload
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def _naive_utc(value):
+    if value is None:
+        return datetime.min
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def encode_cursor(value, row_id):
+    return f'{_naive_utc(value).strftime(_CURSOR_FORMAT)}-{row_id}'
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时抛出 ValueError"""
+    if not cursor:
+        return None
+    value, _, row_id = cursor.partition('-')
+    return datetime.strptime(value, _CURSOR_FORMAT), int(row_id)
+
+
+def _page(user_id, sources, cursor, limit):
+    """sources 为 (模型, 用户列, 排序列, 加载选项) 列表，返回 (本页记录, 下一页游标)"""
+    from extensions import db
+
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor)
+    branches = []
+    for model, user_column, sort_column, options in sources:
+        statement = db.select(model).where(user_column == user_id).options(*options)
+        if after is not None:
+            value, row_id = after
+            statement = statement.where(db.or_(
+                sort_column < value,
+                db.and_(sort_column == value, model.id < row_id)
+            ))
+        rows = db.session.scalars(
+            statement.order_by(sort_column.desc(), model.id.desc()).limit(limit + 1)
+        ).unique().all()
+        key_name = sort_column.key
+        branches.append([((_naive_utc(getattr(row, key_name)), row.id), row) for row in rows])
+
+    merged = list(heapq.merge(*branches, key=lambda item: item[0], reverse=True))
+    items = [row for _, row in merged[:limit]]
+    next_cursor = encode_cursor(*merged[limit - 1][0]) if len(merged) > limit else None
+    return items, next_cursor
+
+
+def organized_page(user_id, cursor=None, limit=None):
+    """用户发起的活动（含已归档），按开始时间倒序"""
+    from models import Activity, ArchivedActivity
+
+    return _page(user_id, [
+        (model, model.organizer_id, model.start_time, (joinedload(model.venue),))
+        for model in (Activity, ArchivedActivity)
+    ], cursor, limit)
+
+
+def participated_page(user_id, cursor=None, limit=None):
+    """用户的报名记录（含已归档），按报名时间倒序，activity 为空表示活动已删除"""
+    from models import Activity, Participation, ArchivedActivity, ArchivedParticipation
+
+    return _page(user_id, [
+        (model, model.user_id, model.registered_at, (joinedload(model.activity).joinedload(activity.venue),))
+        for model, activity in ((Participation, Activity), (ArchivedParticipation, ArchivedActivity))
+    ], cursor, limit)
+
+
+def activity_item(activity):
+    """时间线条目的 JSON 表示"""
+    from flask import url_for
+
+    if activity is None:
+        return {'id': None, 'title': '已删除的活动', 'deleted': True}
+    start_time = activity.start_time_cst
+    return {
+        'id': activity.id,
+        'title': activity.title,
+        'url': url_for('public.activity_detail', activity_id=activity.id),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M') if start_time else None,
+        'venue': activity.venue.name if activity.venue else None,
+        'status': activity.current_status,
+        'is_archived': activity.is_archived,
+        'deleted': False
+    }
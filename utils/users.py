@@ -0,0 +1,86 @@
+"""后台用户管理：分页搜索、按角色筛选，以及批量修改角色和批量删除
+
+搜索只做前缀匹配（LIKE 'q%'），可以走 username、email、department 上的索引；
+批量操作都是按条件的集合式 UPDATE，一次请求处理任意多个用户，不逐个加载对象，管理员和当前用户不受影响；
+删除是软删除，子记录由 utils.purge 的后台任务清理。
+"""
+
+SEARCH_FIELDS = ('all', 'username', 'email', 'department')
+ROLES = {
+    'admin': {'is_admin': True, 'is_reviewer': False},
+    'reviewer': {'is_admin': False, 'is_reviewer': True},
+    'user': {'is_admin': False, 'is_reviewer': False},
+}
+ROLE_LABELS = {'admin': '管理员', 'reviewer': '审核员', 'user': '普通用户'}
+DELETE_CHUNK_SIZE = 1000
+
+
+class UserFilter:
+    """用户列表的筛选条件，原始参数保留给模板回显"""
+
+    def __init__(self, search='', field='all', role=''):
+        self.search = (search or '').strip()
+        self.field = field if field in SEARCH_FIELDS else 'all'
+        self.role = role if role in ROLES else ''
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(search=args.get('search', ''), field=args.get('field', 'all'), role=args.get('role', ''))
+
+    def conditions(self):
+        from extensions import db
+        from models import User
+
+        conditions = []
+        if self.search:
+            columns = [User.username, User.email, User.department] if self.field == 'all' \
+                else [getattr(User, self.field)]
+            conditions.append(db.or_(*[column.startswith(self.search, autoescape=True) for column in columns]))
+        if self.role:
+            conditions.extend(getattr(User, name) == value for name, value in ROLES[self.role].items())
+        return conditions
+
+    def as_args(self):
+        """保留在分页链接和批量操作表单中的参数"""
+        return {key: value for key, value in
+                (('search', self.search), ('field', self.field), ('role', self.role)) if value and value != 'all'}
+
+
+def search_users(user_filter, page, per_page):
+    from extensions import db
+    from models import User
+
+    return db.paginate(
+        db.select(User).where(*user_filter.conditions()).order_by(User.id),
+        page=page, per_page=per_page, error_out=False
+    )
+
+
+def bulk_set_role(criteria, role):
+    """把满足 criteria 的非管理员用户设为指定角色，返回修改的行数（调用方负责提交）
+
+    管理员不参与批量修改，避免一次按筛选结果把其他管理员全部降级；需要时逐个修改权限。
+    """
+    from extensions import db
+    from models import User
+
+    result = db.session.execute(
+        db.update(User).where(*criteria, User.is_admin.isnot(True)).values(**ROLES[role])
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def bulk_delete_users(criteria, chunk_size=DELETE_CHUNK_SIZE):
+    """软删除满足 criteria 的非管理员用户，返回删除的用户数（调用方负责提交，提交后调用 utils.purge.schedule_purge()）
+
+    用户立即从查询中隐藏、无法登录；报名、点赞和通知的删除以及活动计数的扣减由清理任务分块完成，
+    发起/审核的活动和评论保留，用户列置空。
+    """
+    from extensions import db
+    from models import User
+    from utils.purge import soft_delete_users
+
+    # 先取出 ID 再分批更新：MySQL 不允许 UPDATE user 的条件中再查询 user 表
+    ids = db.session.scalars(db.select(User.id).where(*criteria, User.is_admin.isnot(True))).all()
+    return soft_delete_users(ids, chunk_size)
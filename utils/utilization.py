@@ -0,0 +1,204 @@
+"""场地使用率：按星期×小时的占用热力图、同时在场人数峰值和未来的空闲时段
+
+一个场地的全部活动时间段读成 NumPy 数组后，用扫描线一次算完：
+开始/结束时间点排序去重，在每个时间点上累加 +1/-1（或 ±报名人数），累加和就是相邻两个时间点之间的
+同时进行活动数（或在场人数）。“被占用的累计秒数”是分段线性函数，在小时边界上插值再差分即得每小时的占用秒数；
+每小时内的人数峰值用 maximum.reduceat 在合并了小时边界的分段上取得。全程没有逐活动、逐小时的 Python 循环。
+
+结果按场地缓存在进程内，活动创建、修改、删除、审核以及场地修改时调用 invalidate_venue() 失效；
+其他 worker 进程中的缓存最迟在 VENUE_UTILIZATION_TTL 秒后过期。
+NumPy 在函数内导入，只有打开场地页面时才加载，不拖慢 worker 启动和命令行。
+被拒绝的活动不占用场地，不计入统计。时间按北京时间划分。
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app
+
+HOUR = 3600
+WEEK_HOURS = 7 * 24
+CST_OFFSET = 8 * HOUR
+IDLE_SLOT = 30 * 60
+
+# venue_id -> (过期时间, 结果)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def invalidate_venue(*venue_ids):
+    """活动或场地变化后调用，None 会被忽略"""
+    with _cache_lock:
+        for venue_id in venue_ids:
+            _cache.pop(venue_id, None)
+
+
+def _to_local_seconds(values):
+    """UTC 时间（无时区视为 UTC）列表 -> 北京时间的 epoch 秒数组"""
+    import numpy as np
+
+    naive = [value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value for value in values]
+    return np.array(naive, dtype='datetime64[s]').astype(np.int64) + CST_OFFSET
+
+
+def _load_intervals(venue_id, start, end):
+    """与 [start, end) 相交的活动：(开始, 结束, 报名人数) 三个数组，时间为北京时间的 epoch 秒"""
+    import numpy as np
+
+    from extensions import db
+    from models import Activity, ArchivedActivity
+
+    rows = []
+    for model in (Activity, ArchivedActivity):
+        rows.extend(db.session.execute(
+            db.select(model.start_time, model.end_time, model.current_participants).where(
+                model.venue_id == venue_id,
+                db.or_(model.status.is_(None), model.status != 'rejected'),
+                model.start_time < end,
+                model.end_time > start
+            )
+        ).all())
+    rows = [row for row in rows if row.end_time > row.start_time]
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    starts = _to_local_seconds([row.start_time for row in rows])
+    ends = _to_local_seconds([row.end_time for row in rows])
+    people = np.array([row.current_participants or 0 for row in rows], dtype=np.int64)
+    return starts, ends, people
+
+
+def sweep(starts, ends, weights):
+    """扫描线：返回 (时间点, 各时间点之后的水平)，水平在 [times[i], times[i+1]) 上保持不变"""
+    import numpy as np
+
+    times, inverse = np.unique(np.concatenate([starts, ends]), return_inverse=True)
+    deltas = np.bincount(inverse, weights=np.concatenate([weights, -weights]), minlength=len(times))
+    return times, np.rint(np.cumsum(deltas)).astype(np.int64)
+
+
+def covered_seconds(times, levels, edges):
+    """每个 [edges[k], edges[k+1]) 区间内水平 > 0 的秒数"""
+    import numpy as np
+
+    if len(times) == 0:
+        return np.zeros(len(edges) - 1)
+    busy = (levels[:-1] > 0) * np.diff(times)
+    cumulative = np.concatenate([[0], np.cumsum(busy)])
+    return np.diff(np.interp(edges, times, cumulative))
+
+
+def peak_levels(times, levels, edges):
+    """每个 [edges[k], edges[k+1]) 区间内水平的最大值"""
+    import numpy as np
+
+    if len(times) == 0:
+        return np.zeros(len(edges) - 1, dtype=np.int64)
+    points = np.union1d(times, edges)
+    points = points[(points >= edges[0]) & (points <= edges[-1])]
+    index = np.searchsorted(times, points[:-1], side='right') - 1
+    segment_levels = np.where(index >= 0, levels[np.clip(index, 0, None)], 0)
+    return np.maximum.reduceat(segment_levels, np.searchsorted(points, edges[:-1]))
+
+
+def idle_windows(times, levels, start, days, open_hours, min_hours, now, limit=5):
+    """从 start 起 days 天内、开放时间中没有活动的连续时段，按时长取前 limit 个，再按时间排序"""
+    import numpy as np
+
+    edges = start + np.arange(days * 24 * HOUR // IDLE_SLOT + 1, dtype=np.int64) * IDLE_SLOT
+    slot_starts = edges[:-1]
+    hour_of_day = (slot_starts % (24 * HOUR)) // HOUR
+    idle = ((covered_seconds(times, levels, edges) == 0)
+            & (hour_of_day >= open_hours[0]) & (hour_of_day < open_hours[1])
+            & (slot_starts >= now))
+    change = np.diff(np.concatenate([[0], idle.astype(np.int8), [0]]))
+    run_starts, run_ends = np.flatnonzero(change == 1), np.flatnonzero(change == -1)
+    lengths = run_ends - run_starts
+    keep = lengths * IDLE_SLOT >= min_hours * HOUR
+    run_starts, run_ends, lengths = run_starts[keep], run_ends[keep], lengths[keep]
+    top = np.sort(np.argsort(-lengths, kind='stable')[:limit])
+    return [
+        {'start': _format(slot_starts[run_starts[i]]), 'end': _format(edges[run_ends[i]]),
+         'hours': float(lengths[i] * IDLE_SLOT / HOUR)}
+        for i in top
+    ]
+
+
+def _format(local_seconds):
+    return datetime.fromtimestamp(int(local_seconds), tz=timezone.utc).strftime('%m-%d %H:%M')
+
+
+def compute_utilization(venue, now=None):
+    """计算一个场地最近 VENUE_UTILIZATION_WEEKS 周的使用情况和未来 7 天的空闲时段"""
+    import numpy as np
+
+    config = current_app.config
+    weeks = config['VENUE_UTILIZATION_WEEKS']
+    open_hours = config['VENUE_OPEN_HOURS']
+    now = now or datetime.now(timezone.utc)
+    now_local = int(_to_local_seconds([now])[0])
+    today_local = now_local - now_local % (24 * HOUR)
+    # 1970-01-01 是星期四，换算出本周一 0 点
+    this_monday = today_local - ((today_local // (24 * HOUR) + 3) % 7) * 24 * HOUR
+    window_start = this_monday - (weeks - 1) * 7 * 24 * HOUR
+    window_end = this_monday + 7 * 24 * HOUR
+    idle_days = 7
+    load_end = max(window_end, today_local + idle_days * 24 * HOUR)
+
+    def to_utc(local_seconds):
+        return datetime.fromtimestamp(int(local_seconds - CST_OFFSET), tz=timezone.utc).replace(tzinfo=None)
+
+    starts, ends, people = _load_intervals(venue.id, to_utc(window_start), to_utc(load_end))
+    # 只统计窗口内的部分
+    clipped_starts = np.clip(starts, window_start, load_end)
+    clipped_ends = np.clip(ends, window_start, load_end)
+    count_times, count_levels = sweep(clipped_starts, clipped_ends, np.ones_like(people))
+    load_times, load_levels = sweep(clipped_starts, clipped_ends, people)
+
+    edges = window_start + np.arange(weeks * WEEK_HOURS + 1, dtype=np.int64) * HOUR
+    occupied = covered_seconds(count_times, count_levels, edges).reshape(weeks, 7, 24)
+    peaks = peak_levels(load_times, load_levels, edges).reshape(weeks, 7, 24)
+    occupancy = occupied.mean(axis=0) / HOUR
+    open_slice = slice(open_hours[0], open_hours[1])
+
+    peak_load = int(peaks.max()) if peaks.size else 0
+    peak_at = None
+    if peak_load:
+        week, weekday, hour = np.unravel_index(int(peaks.argmax()), peaks.shape)
+        peak_at = _format(window_start + (week * WEEK_HOURS + weekday * 24 + hour) * HOUR)
+    capacity = venue.capacity or 0
+    return {
+        'venue_id': venue.id,
+        'weeks': weeks,
+        'activity_count': int(len(starts)),
+        'occupancy': np.round(occupancy, 3).tolist(),
+        'peak_by_slot': peaks.max(axis=0).tolist(),
+        'utilization': float(occupied.sum() / (weeks * WEEK_HOURS * HOUR)),
+        'open_utilization': float(occupied[:, :, open_slice].sum() / (weeks * 7 * (open_hours[1] - open_hours[0]) * HOUR)),
+        'peak_load': peak_load,
+        'peak_at': peak_at,
+        'capacity': capacity,
+        'peak_ratio': peak_load / capacity if capacity else None,
+        'idle_windows': idle_windows(count_times, count_levels, today_local, idle_days, open_hours,
+                                     config['VENUE_IDLE_MIN_HOURS'], now_local),
+    }
+
+
+def venue_utilization(venue):
+    """带缓存的 compute_utilization"""
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(venue.id)
+    if cached and cached[0] > now:
+        return cached[1]
+    result = compute_utilization(venue)
+    with _cache_lock:
+        _cache[venue.id] = (now + current_app.config['VENUE_UTILIZATION_TTL'], result)
+    return result
+
+
+def init_app(app):
+    app.config.setdefault('VENUE_UTILIZATION_WEEKS', 8)
+    app.config.setdefault('VENUE_UTILIZATION_TTL', 600)
+    app.config.setdefault('VENUE_OPEN_HOURS', (8, 22))
+    app.config.setdefault('VENUE_IDLE_MIN_HOURS', 2)